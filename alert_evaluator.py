@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+alert_evaluator.py — Background job that evaluates alert rules server-side.
+
+Each pass reads the SensorsLatest updates that arrived since the previous one
+(only for gateways with enabled rules) and runs them through an AlertEngine,
+which compares each update only against the rules indexed under its
+(gateway_id, node_id, type) and enforces cooldown_minutes.  Fired alerts are
+handed to a NotificationDispatcher, which delivers them to the users'
+DeviceTokens from its own worker pool (FCM when FCM_CREDENTIALS and
+FCM_PROJECT_ID are set, otherwise logged).  The rule index is reloaded whenever /alert_rules creates, updates or
+deletes a rule.
+
+Usage:
+  python3 alert_evaluator.py -d PROD [--interval 5] [--workers 8] [--once]
+
+Options:
+  -d / --db        Database alias: PROD or TEST  (required)
+  -i / --interval  Seconds between evaluation passes  (default: 5)
+  -w / --workers   Concurrent push sends  (default: 8)
+  -1 / --once      Run a single pass and exit
+  -h               Show this help
+"""
+
+import getopt
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+import alerts as _alerts
+import notifications as _notifications
+
+DB_MAP = {
+    'PROD': 'gdtechdb_prod',
+    'TEST': 'gdtechdb_test',
+}
+
+
+def evaluate_pass(db, engine, since):
+    """Evaluate SensorsLatest updates with time > since.
+
+    Returns (fired alerts, new watermark).
+    """
+    engine.refresh_if_stale()
+    gateways = engine.gateways()
+    if not gateways:
+        return [], since
+    docs = list(db.SensorsLatest.find(
+        {'gateway_id': {'$in': gateways}, 'time': {'$gt': since}},
+        {'_id': 0, 'gateway_id': 1, 'node_id': 1, 'type': 1, 'value': 1, 'time': 1},
+    ))
+    if not docs:
+        return [], since
+    return engine.evaluate(docs), max(doc['time'] for doc in docs)
+
+
+def printhelp():
+    print(__doc__)
+
+
+def main(argv):
+    db_alias = ''
+    interval = 5
+    workers = 8
+    once = False
+
+    try:
+        opts, _ = getopt.getopt(argv, 'h1d:i:w:', ['db=', 'interval=', 'workers=', 'once'])
+    except getopt.GetoptError as e:
+        print(f'Error: {e}')
+        printhelp()
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            printhelp()
+            sys.exit(0)
+        elif opt in ('-d', '--db'):
+            db_alias = arg.upper()
+        elif opt in ('-i', '--interval'):
+            interval = int(arg)
+        elif opt in ('-w', '--workers'):
+            workers = int(arg)
+        elif opt in ('-1', '--once'):
+            once = True
+
+    if db_alias not in DB_MAP:
+        print(f'Error: --db must be one of {list(DB_MAP.keys())}')
+        printhelp()
+        sys.exit(1)
+
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGODB_HOST', 'localhost'), 27017)
+    db = client[DB_MAP[db_alias]]
+    db.SensorsLatest.create_index('time')
+
+    dispatcher = _notifications.NotificationDispatcher(db, workers=workers)
+    engine = _alerts.AlertEngine(db, push=dispatcher.enqueue)
+    # Start from now: readings already in SensorsLatest were current before
+    # the evaluator started and are not re-alerted
+    since = time.time()
+    while True:
+        started = time.time()
+        try:
+            fired, since = evaluate_pass(db, engine, since)
+            if fired or once:
+                print(f'[alerts] Pass done in {time.time() - started:.1f}s: '
+                      f'{len(fired)} alert(s) fired; push {dispatcher.stats()}')
+        except Exception as exc:
+            print(f'[alerts] Pass failed: {exc}')
+        if once:
+            break
+        time.sleep(max(0.0, interval - (time.time() - started)))
+
+    dispatcher.close()
+    client.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
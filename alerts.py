@@ -0,0 +1,189 @@
+"""
+alerts.py — Server-side evaluation of user alert rules.
+
+AlertEngine keeps the enabled AlertRules in memory, indexed by
+(gateway_id, node_id, type), so each SensorsLatest update is only compared
+against the rules that watch that sensor.  A rule without a node_id watches
+every node of the gateway for its type.
+
+Rules are documents created through /alert_rules:
+
+  {rule_id, email, gateway_id, node_id, type, operator, threshold, label,
+   enabled, cooldown_minutes, push_enabled}
+
+A rule fires when `value <operator> threshold` holds and it has not fired
+within its cooldown.  Last-fired times are kept in memory and persisted in
+AlertState ({rule_id, last_fired}) so a restart does not re-fire every rule.
+Delivery is pluggable: the engine calls push(alert) for each fired rule with
+push_enabled; the default only logs, and alert_evaluator.py passes a
+notifications.NotificationDispatcher.
+
+The rule CRUD endpoints call bump_rules_version, and the engine reloads its
+index whenever the version it loaded is stale (see alert_evaluator.py).
+"""
+
+import logging
+import operator
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+
+import sensor_common as _sc
+
+logger = logging.getLogger(__name__)
+
+_RULES_COLLECTION = 'AlertRules'
+_STATE_COLLECTION = 'AlertState'
+_VERSION_COLLECTION = 'AlertRulesVersion'
+
+_OPERATORS: Dict[str, Callable[[float, float], bool]] = {
+    '>': operator.gt, 'gt': operator.gt, 'above': operator.gt,
+    '>=': operator.ge, 'gte': operator.ge,
+    '<': operator.lt, 'lt': operator.lt, 'below': operator.lt,
+    '<=': operator.le, 'lte': operator.le,
+    '==': operator.eq, 'eq': operator.eq,
+    '!=': operator.ne, 'ne': operator.ne,
+}
+
+
+def log_push(alert: dict) -> None:
+    """Default delivery: record the alert in the log only."""
+    logger.info('Alert %s for %s: %s', alert['rule_id'], alert['email'], alert['message'])
+
+
+def bump_rules_version(db) -> int:
+    """Mark AlertRules as changed; engines reload their index on the next check."""
+    doc = db[_VERSION_COLLECTION].find_one_and_update(
+        {'_id': 'rules'}, {'$inc': {'version': 1}}, upsert=True,
+        return_document=ReturnDocument.AFTER)
+    return doc['version']
+
+
+def _rules_version(db) -> int:
+    doc = db[_VERSION_COLLECTION].find_one({'_id': 'rules'})
+    return doc['version'] if doc else 0
+
+
+def _compile(rule: dict) -> Optional[dict]:
+    """Rule with a resolved comparison and numeric threshold, or None if unusable."""
+    compare = _OPERATORS.get(str(rule.get('operator', '')).strip().lower())
+    try:
+        threshold = float(rule.get('threshold', rule.get('value')))
+    except (TypeError, ValueError):
+        return None
+    if compare is None or not rule.get('gateway_id') or not rule.get('type'):
+        return None
+    return {**rule, '_compare': compare, '_threshold': threshold,
+            '_cooldown': float(rule.get('cooldown_minutes') or 0) * 60}
+
+
+class AlertEngine:
+    """In-memory, indexed evaluation of enabled alert rules.
+
+    Args:
+      db: database holding AlertRules / AlertState.
+      push: callable invoked with each fired alert dict whose rule has
+        push_enabled; defaults to log_push.
+      clock: time source (seconds), for tests.
+    """
+
+    def __init__(self, db, push: Optional[Callable[[dict], None]] = None,
+                 clock: Callable[[], float] = time.time):
+        self.db = db
+        self.push = push or log_push
+        self.clock = clock
+        self.index: Dict[Tuple[str, Optional[str], str], List[dict]] = {}
+        self.last_fired: Dict[str, float] = {}
+        self.version = None
+
+    # ── Index ────────────────────────────────────────────────────────────────
+
+    def refresh(self) -> int:
+        """Reload enabled rules and persisted last-fired times; return the rule count."""
+        self.version = _rules_version(self.db)
+        index: Dict[Tuple[str, Optional[str], str], List[dict]] = {}
+        count = 0
+        for rule in self.db[_RULES_COLLECTION].find({'enabled': {'$ne': False}}, {'_id': 0}):
+            compiled = _compile(rule)
+            if compiled is None:
+                logger.warning('Skipping malformed alert rule %s', rule.get('rule_id'))
+                continue
+            node = rule.get('node_id')
+            key = (str(rule['gateway_id']), str(node) if node not in (None, '') else None,
+                   rule['type'])
+            index.setdefault(key, []).append(compiled)
+            count += 1
+        self.index = index
+        rule_ids = [r['rule_id'] for rules in index.values() for r in rules]
+        self.last_fired = {doc['rule_id']: doc['last_fired'] for doc in
+                           self.db[_STATE_COLLECTION].find({'rule_id': {'$in': rule_ids}},
+                                                           {'_id': 0})}
+        logger.info('Alert engine loaded %d rule(s) on %d sensor key(s)', count, len(index))
+        return count
+
+    def refresh_if_stale(self) -> bool:
+        """Reload the index if the rules changed since it was loaded."""
+        if self.version is None or _rules_version(self.db) != self.version:
+            self.refresh()
+            return True
+        return False
+
+    def gateways(self) -> List[str]:
+        """Gateways with at least one enabled rule."""
+        return sorted({key[0] for key in self.index})
+
+    def rules_for(self, gateway_id: str, node_id: str, sensor_type: str) -> List[dict]:
+        """Rules watching this sensor: node-specific ones plus gateway-wide ones."""
+        gateway_id, node_id = str(gateway_id), str(node_id)
+        return (self.index.get((gateway_id, node_id, sensor_type), [])
+                + self.index.get((gateway_id, None, sensor_type), []))
+
+    # ── Evaluation ───────────────────────────────────────────────────────────
+
+    def _check(self, doc: dict, now: float) -> List[dict]:
+        rules = self.rules_for(doc.get('gateway_id'), doc.get('node_id'), doc.get('type'))
+        if not rules:
+            return []
+        value = _sc.clean_value(doc.get('value'))
+        if value != value:   # NaN
+            return []
+        fired = []
+        for rule in rules:
+            if not rule['_compare'](value, rule['_threshold']):
+                continue
+            if now - self.last_fired.get(rule['rule_id'], float('-inf')) < rule['_cooldown']:
+                continue
+            self.last_fired[rule['rule_id']] = now
+            label = rule.get('label') or f"{doc['node_id']} {doc['type']}"
+            fired.append({
+                'rule_id': rule['rule_id'], 'email': rule.get('email'),
+                'gateway_id': doc['gateway_id'], 'node_id': doc['node_id'],
+                'type': doc['type'], 'value': value, 'threshold': rule['_threshold'],
+                'operator': rule['operator'], 'time': doc.get('time'), 'fired_at': now,
+                'push': rule.get('push_enabled', True),
+                'message': f"{label}: {value:g} {rule['operator']} {rule['_threshold']:g}",
+            })
+        return fired
+
+    def evaluate(self, docs: Iterable[dict]) -> List[dict]:
+        """Evaluate SensorsLatest updates; deliver and return the fired alerts.
+
+        Each update costs one index lookup plus one comparison per matching
+        rule.  Last-fired times of the batch are persisted with one bulk_write.
+        """
+        now = self.clock()
+        fired = [alert for doc in docs for alert in self._check(doc, now)]
+        if not fired:
+            return []
+        self.db[_STATE_COLLECTION].bulk_write(
+            [UpdateOne({'rule_id': a['rule_id']}, {'$set': {'last_fired': a['fired_at']}},
+                       upsert=True) for a in fired], ordered=False)
+        for alert in fired:
+            if not alert['push']:
+                continue
+            try:
+                self.push(alert)
+            except Exception as exc:
+                logger.warning('Alert push for rule %s failed: %s', alert['rule_id'], exc)
+        return fired
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+anomaly_scorer.py — Background job that extends the AnomalyScores collection.
+
+For every gateway with a trained anomaly model under models/, scores the
+time buckets that arrived since the last stored score (or backfills the
+whole lookback window when a gateway has none, e.g. after a retrain in
+another process). /predict_anomaly reads these scores with a range query.
+
+With --stream, each gateway instead gets an OnlineAnomalyScorer seeded from
+its frame cache; new readings are polled with one query per pass and every
+bucket is scored as soon as all of its nodes have reported, at a constant
+cost per bucket.
+
+Usage:
+  python3 anomaly_scorer.py -d PROD [--interval 300] [--once]
+  python3 anomaly_scorer.py -d PROD --stream [--interval 10]
+
+Options:
+  -d / --db        Database alias: PROD or TEST  (required)
+  -i / --interval  Seconds between scoring passes  (default: 300, 10 with --stream)
+  -1 / --once      Run a single pass and exit (for cron)
+  -s / --stream    Score buckets online as readings arrive
+  -h               Show this help
+"""
+
+import getopt
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+import anomaly_training as _at
+import sensor_common as _sc
+
+DB_MAP = {
+    'PROD': 'gdtechdb_prod',
+    'TEST': 'gdtechdb_test',
+}
+
+
+def gateways_with_models(models_dir=_at.MODELS_DIR):
+    """Return gateway ids that have a saved anomaly model."""
+    if not os.path.isdir(models_dir):
+        return []
+    return sorted(gw for gw in os.listdir(models_dir)
+                  if _at.model_exists(gw, models_dir))
+
+
+def score_pass(db, models_dir=_at.MODELS_DIR):
+    """Score new buckets for every gateway; return {gateway_id: buckets_written}."""
+    written = {}
+    for gw in gateways_with_models(models_dir):
+        try:
+            written[gw] = _at.score_new_anomaly_buckets(db, gw, models_dir)
+        except Exception as exc:
+            print(f'[scorer] Gateway {gw} failed: {exc}')
+    return written
+
+
+def stream_pass(db, scorers, models_dir=_at.MODELS_DIR):
+    """Feed readings that arrived since the last pass to the online scorers.
+
+    scorers maps gateway_id -> OnlineAnomalyScorer and is updated in place:
+    gateways whose model was (re)trained, or whose frame cache was rebuilt
+    with another bucket size, get a freshly seeded scorer. Seeding only
+    reads the frame cache; the request path keeps it fresh.
+    Returns the number of buckets written to AnomalyScores.
+    """
+    gateways = gateways_with_models(models_dir)
+    for gw in list(scorers):
+        if gw not in gateways:
+            del scorers[gw]
+    for gw in gateways:
+        try:
+            _, metadata = _at.load_cached_model(gw, models_dir)
+            manifest = _at.frame_cache_manifest(gw, models_dir)
+            if (gw not in scorers or scorers[gw].trained_at != metadata.get('trained_at')
+                    or (manifest is not None
+                        and manifest['bucket_seconds'] != scorers[gw].bucket_secs)):
+                scorer = _at.OnlineAnomalyScorer.from_history(db, gw, models_dir)
+                if scorer is not None:
+                    scorers[gw] = scorer
+        except Exception as exc:
+            print(f'[scorer] Gateway {gw} failed to seed: {exc}')
+    if not scorers:
+        return 0
+
+    cursor = db.Sensors.find(
+        {'gateway_id': {'$in': list(scorers)},
+         'time': {'$gt': min(s.last_time for s in scorers.values())},
+         'type': {'$in': ['F', 'H', 'P']}},
+        {'_id': 0, 'gateway_id': 1, 'node_id': 1, 'type': 1, 'value': 1, 'time': 1},
+    ).sort('time', 1)
+
+    ops = []
+    for doc in cursor:
+        scorer = scorers[doc['gateway_id']]
+        if doc['time'] <= scorer.last_time:
+            continue
+        scorer.last_time = doc['time']
+        value = _sc.clean_value(doc['value'])
+        if value != value:   # NaN
+            continue
+        for score in scorer.add_reading(str(doc['node_id']), doc['type'], value, doc['time']):
+            ops.append(UpdateOne(
+                {'gateway_id': scorer.gateway_id, 'time_rounded': score['time_rounded']},
+                {'$set': {**score, 'model_trained_at': scorer.trained_at}}, upsert=True))
+    if ops:
+        db[_at._SCORES_COLLECTION].bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def printhelp():
+    print(__doc__)
+
+
+def main(argv):
+    db_alias = ''
+    interval = None
+    once = False
+    stream = False
+
+    try:
+        opts, _ = getopt.getopt(argv, 'h1sd:i:', ['db=', 'interval=', 'once', 'stream'])
+    except getopt.GetoptError as e:
+        print(f'Error: {e}')
+        printhelp()
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            printhelp()
+            sys.exit(0)
+        elif opt in ('-d', '--db'):
+            db_alias = arg.upper()
+        elif opt in ('-i', '--interval'):
+            interval = int(arg)
+        elif opt in ('-1', '--once'):
+            once = True
+        elif opt in ('-s', '--stream'):
+            stream = True
+
+    if db_alias not in DB_MAP:
+        print(f'Error: --db must be one of {list(DB_MAP.keys())}')
+        printhelp()
+        sys.exit(1)
+
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGODB_HOST', 'localhost'), 27017)
+    db = client[DB_MAP[db_alias]]
+    if interval is None:
+        interval = 10 if stream else 300
+
+    scorers = {}
+    while True:
+        started = time.time()
+        if stream:
+            written = stream_pass(db, scorers)
+            if written:
+                print(f'[scorer] Streamed {written} bucket(s) across {len(scorers)} gateway(s)')
+        else:
+            written = score_pass(db)
+            print(f'[scorer] Pass done in {time.time() - started:.1f}s: '
+                  f'{sum(written.values())} bucket(s) across {len(written)} gateway(s)')
+        if once:
+            break
+        time.sleep(max(0.0, interval - (time.time() - started)))
+
+    client.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
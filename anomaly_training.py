@@ -11,19 +11,27 @@ anomaly detection across nodes. Saves the model with joblib and provides predict
 via the unified madi predict() interface.
 """
 
+import contextlib
 import datetime
+import fcntl
+import glob
 import json
 import logging
 import os
 import sys
 import time
+import uuid
 from typing import Dict, List, Optional, Tuple
 
 import requests
 
-import joblib
 import numpy as np
 import pandas as pd
+from pymongo import UpdateOne
+
+import model_cache as _model_cache
+import model_store as _model_store
+import sensor_common as _sc
 
 # ---------------------------------------------------------------------------
 # Locate the shared anomalydetection/ package regardless of working directory.
@@ -74,13 +82,78 @@ _SAMPLE_RATIO      = 2.0
 _SAMPLE_DELTA      = 0.05
 _TEST_RATIO        = 1.0
 _ANOMALY_THRESHOLD = 0.5
+_COMPACT_TOLERANCE = 0.01   # max holdout F1 loss accepted when compacting NS-RF
 _BUCKET_SECONDS    = 60   # fallback / minimum bucket size
 # Candidate bucket sizes tried in order (seconds); first one >= max node interval is used.
 _BUCKET_CANDIDATES = (60, 120, 300, 600, 900, 1800, 3600)
-_NOAA_NODE_ID      = 'noaa_forecast'
+_NOAA_NODE_ID      = _sc.NOAA_NODE_ID
 _TREND_WINDOW      = 6   # rolling window (buckets) for delta/mean/std trend features
 
 
+def _window_sums(a: np.ndarray, window: int) -> np.ndarray:
+    """Trailing sums over the last `window` entries along axis 1 (min_periods=1)."""
+    out = a.copy()
+    for lag in range(1, window):
+        out[:, lag:] += a[:, :-lag]
+    return out
+
+
+def _trend_features(values: np.ndarray, delta: np.ndarray, mean: np.ndarray,
+                    std: np.ndarray, window: int = _TREND_WINDOW) -> None:
+    """Fill delta / rolling mean / rolling std for every series in `values`.
+
+    values has one series per row (shape n_series × n_buckets); delta, mean
+    and std are output arrays (or views) of the same shape. Results match
+    diff().fillna(0), rolling(window, min_periods=1).mean() and
+    rolling(window, min_periods=1).std(ddof=0).fillna(0), NaN-aware.
+
+    Window sums are built from `window` shifted adds over all series at once.
+    Each series is centred on its own mean first so the sum-of-squares
+    variance does not lose precision on readings far from zero (~1000 hPa).
+    Dense series skip the NaN masking entirely.
+    """
+    n = values.shape[1]
+    w = min(window, n)
+    delta[:, :1] = 0.0
+    np.subtract(values[:, 1:], values[:, :-1], out=delta[:, 1:])
+
+    missing = np.isnan(values)
+    sparse = missing.any(axis=1)
+    if sparse.any():
+        np.copyto(delta, 0.0, where=np.isnan(delta))
+
+    for rows, masked in ((np.flatnonzero(~sparse), False), (np.flatnonzero(sparse), True)):
+        if not len(rows):
+            continue
+        x = values[rows]
+        if masked:
+            present = ~missing[rows]
+            x[~present] = 0.0
+            shift = x.sum(axis=1, keepdims=True) / np.maximum(present.sum(axis=1, keepdims=True), 1)
+            x -= shift
+            x *= present
+            count = _window_sums(present.astype(np.float64), w)
+        else:
+            shift = x.mean(axis=1, keepdims=True)
+            x -= shift
+            count = np.minimum(np.arange(1, n + 1, dtype=np.float64), w)
+
+        s1 = _window_sums(x, w)
+        x *= x
+        s2 = _window_sums(x, w)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s1 /= count            # empty windows → NaN mean, as in pandas
+            s2 /= count
+        s2 -= s1 * s1
+        np.maximum(s2, 0.0, out=s2)
+        np.sqrt(s2, out=s2)
+        if masked:
+            np.copyto(s2, 0.0, where=np.isnan(s2))
+        s1 += shift
+        mean[rows] = s1
+        std[rows] = s2
+
+
 def _add_engineered_features(df: pd.DataFrame) -> pd.DataFrame:
     """Add temporal and rolling trend features to a time-bucketed wide DataFrame.
 
@@ -94,17 +167,12 @@ def _add_engineered_features(df: pd.DataFrame) -> pd.DataFrame:
       {col}_roll_mean  — rolling mean over the last _TREND_WINDOW buckets
       {col}_roll_std   — rolling std  over the last _TREND_WINDOW buckets
     min_periods=1 avoids introducing NaNs at the start of the series.
+
+    All features are computed on one 2-D array (see _trend_features) and
+    written into a single preallocated block appended to the frame once.
     """
     df = df.sort_values('time_rounded').reset_index(drop=True)
 
-    # Cyclic time features derived from Unix timestamps
-    hours = (df['time_rounded'] % 86400) / 3600              # float 0–24
-    dows  = ((df['time_rounded'] // 86400) % 7).astype(int)  # int 0–6
-    df['hour_sin'] = np.sin(2 * np.pi * hours / 24)
-    df['hour_cos'] = np.cos(2 * np.pi * hours / 24)
-    df['dow_sin']  = np.sin(2 * np.pi * dows  / 7)
-    df['dow_cos']  = np.cos(2 * np.pi * dows  / 7)
-
     # Rolling trend features for real sensor columns only
     _meta = {'time_rounded', 'hour_sin', 'hour_cos', 'dow_sin', 'dow_cos'}
     sensor_cols = [
@@ -113,13 +181,31 @@ def _add_engineered_features(df: pd.DataFrame) -> pd.DataFrame:
         and not c.startswith(_NOAA_NODE_ID)
         and '_' in c   # node_id_type pattern: "1_F", "2_H", etc.
     ]
-    for col in sensor_cols:
-        df[f'{col}_delta']     = df[col].diff().fillna(0.0)
-        df[f'{col}_roll_mean'] = df[col].rolling(_TREND_WINDOW, min_periods=1).mean()
-        df[f'{col}_roll_std']  = (df[col].rolling(_TREND_WINDOW, min_periods=1)
-                                         .std(ddof=0).fillna(0.0))
 
-    return df
+    # One (features × rows) block; a DataFrame over its transpose keeps each
+    # feature column contiguous, which is pandas' native block layout
+    n, k = len(df), len(sensor_cols)
+    out = np.empty((4 + 3 * k, n))
+
+    # Cyclic time features derived from Unix timestamps
+    ts = df['time_rounded'].to_numpy(dtype=np.float64)
+    hours = (ts % 86400) / 3600                          # float 0–24
+    dows  = ((ts // 86400) % 7).astype(np.int64)         # int 0–6
+    np.sin(2 * np.pi * hours / 24, out=out[0])
+    np.cos(2 * np.pi * hours / 24, out=out[1])
+    np.sin(2 * np.pi * dows / 7, out=out[2])
+    np.cos(2 * np.pi * dows / 7, out=out[3])
+
+    if k:
+        values = np.ascontiguousarray(df[sensor_cols].to_numpy(dtype=np.float64).T)
+        _trend_features(values, out[4::3], out[5::3], out[6::3])
+
+    names = ['hour_sin', 'hour_cos', 'dow_sin', 'dow_cos']
+    for col in sensor_cols:
+        names += [f'{col}_delta', f'{col}_roll_mean', f'{col}_roll_std']
+    feats = pd.DataFrame(out.T, index=df.index, columns=names, copy=False)
+    # Time features already present (re-featurizing a frame) are replaced, not duplicated
+    return pd.concat([df.drop(columns=[c for c in names if c in df.columns]), feats], axis=1)
 
 
 def _optimal_bucket_seconds(df: pd.DataFrame, node_ids: List[str]) -> int:
@@ -151,67 +237,79 @@ def _optimal_bucket_seconds(df: pd.DataFrame, node_ids: List[str]) -> int:
 # Data loading
 # ---------------------------------------------------------------------------
 
-def get_gateway_dataframe(db, gateway_id: str,
-                          lookback_days: int = _LOOKBACK_DAYS) -> Optional[pd.DataFrame]:
-    """Query all nodes for gateway_id; return a wide time-bucketed DataFrame.
+_clean_value = _sc.clean_value
 
-    Columns are '{node_id}_{type}' (e.g. '1_F', '1_H', '2_F', '2_P').
-    The bucket size is chosen dynamically: for each node the median inter-reading
-    interval is computed; the bucket is set to the smallest value in
-    _BUCKET_CANDIDATES that is >= the slowest node's interval. This ensures all
-    nodes have at least one reading per bucket regardless of their duty cycle.
-    Rows missing F or H for any node are dropped; P columns are allowed to be
-    sparse. The returned DataFrame includes a 'time_rounded' column.
-    Returns None if fewer than 20 aligned rows remain.
-    """
-    start_ts = time.time() - lookback_days * 86400
-    try:
-        cursor = db.Sensors.find(
-            {'gateway_id': gateway_id,
-             'time': {'$gte': start_ts},
-             'type': {'$in': ['F', 'H', 'P']},
-             },
-            {'_id': 0, 'node_id': 1, 'type': 1, 'value': 1, 'time': 1},
-        )
-        rows = list(cursor)
-    except Exception as exc:
-        logger.warning('MongoDB query failed for gateway %s: %s', gateway_id, exc)
-        return None
 
+def _query_gateway_readings(db, gateway_id: str, since_ts: float) -> pd.DataFrame:
+    """Return cleaned long-format F/H/P readings (node_id, type, value, time).
+
+    Query errors propagate to the caller.
+    """
+    cursor = db.Sensors.find(
+        {'gateway_id': gateway_id,
+         'time': {'$gte': since_ts},
+         'type': {'$in': ['F', 'H', 'P']},
+         },
+        {'_id': 0, 'node_id': 1, 'type': 1, 'value': 1, 'time': 1},
+    )
+    rows = list(cursor)
     if not rows:
-        logger.info('No sensor rows found for gateway %s in last %d days', gateway_id, lookback_days)
-        return None
+        return pd.DataFrame(columns=['node_id', 'type', 'value', 'time'])
 
     df = pd.DataFrame(rows)
-
-    def _clean(v):
-        try:
-            return float(str(v).replace("b'", '').replace("'", ''))
-        except (ValueError, TypeError):
-            return float('nan')
-
-    df['value'] = df['value'].apply(_clean)
+    df['value'] = df['value'].apply(_clean_value)
     df = df.dropna(subset=['value'])
     df['node_id'] = df['node_id'].astype(str)
+    return df
 
-    node_ids = sorted(df['node_id'].unique())
 
-    # Check if NOAA is opted-in for this gateway
-    noaa_doc = db.NOAASettings.find_one({'gateway_id': gateway_id, 'enabled': True})
-    noaa_enabled = noaa_doc is not None
+def _pivot_readings(df: pd.DataFrame, bucket_secs: int) -> pd.DataFrame:
+    """Pivot long readings into a bucket-indexed wide frame of '{node_id}_{type}' columns.
 
-    # Bucket size is driven by real sensor nodes only (NOAA is hourly, not a sensor)
-    real_node_ids = [n for n in node_ids if n != _NOAA_NODE_ID]
-    bucket_secs = _optimal_bucket_seconds(df, real_node_ids)
-    logger.info('Gateway %s: using %d s buckets (nodes=%s)', gateway_id, bucket_secs, real_node_ids)
-
-    df['bucket'] = (df['time'] // bucket_secs).astype(int) * bucket_secs
-    df['col'] = df['node_id'] + '_' + df['type']
-
-    pivoted = df.pivot_table(
-        index='bucket', columns='col', values='value', aggfunc='first'
-    )
-    pivoted.columns.name = None
+    The first reading seen in each (bucket, column) cell wins. Equivalent to
+    pivot_table(index='bucket', columns='col', aggfunc='first') but avoids the
+    per-row '{node_id}_{type}' string column and the groupby: bucket and column
+    keys are factorized to integer codes and the first value per cell is
+    scattered into a preallocated float array.
+    """
+    buckets = (df['time'].values // bucket_secs).astype(np.int64) * bucket_secs
+    bucket_codes, bucket_index = pd.factorize(buckets, sort=True)
+    node_codes, node_uniques = pd.factorize(df['node_id'].values)
+    type_codes, type_uniques = pd.factorize(df['type'].values)
+
+    # Combine (node, type) codes, then renumber the pairs that actually occur
+    # to the sorted column-name order pivot_table would produce
+    n_types = len(type_uniques)
+    pair_codes = node_codes * n_types + type_codes
+    present = np.flatnonzero(np.bincount(pair_codes, minlength=len(node_uniques) * n_types))
+    names = np.array([f'{node_uniques[p // n_types]}_{type_uniques[p % n_types]}'
+                      for p in present], dtype=object)
+    order = np.argsort(names, kind='stable')
+    lookup = np.empty(len(node_uniques) * n_types, dtype=np.int64)
+    lookup[present[order]] = np.arange(len(order))
+    col_codes = lookup[pair_codes]
+
+    n_cols = len(names)
+    cells = bucket_codes.astype(np.int64) * n_cols + col_codes
+    first = ~pd.Series(cells).duplicated(keep='first').values
+
+    out = np.full(len(bucket_index) * n_cols, np.nan)
+    out[cells[first]] = df['value'].values.astype(np.float64)[first]
+    return pd.DataFrame(out.reshape(len(bucket_index), n_cols),
+                        index=pd.Index(bucket_index, name='bucket'),
+                        columns=pd.Index(list(names[order])), copy=False)
+
+
+def _finalize_gateway_frame(pivoted: pd.DataFrame, gateway_id: str,
+                            noaa_enabled: bool) -> Optional[pd.DataFrame]:
+    """Align a pivoted bucket frame and add engineered features.
+
+    Rows missing F or H for any real node are dropped, the NOAA column is
+    forward-filled (or dropped when NOAA is not opted-in) and the result gets a
+    'time_rounded' column. Returns None if fewer than 20 aligned rows remain.
+    """
+    real_node_ids = sorted({c.rsplit('_', 1)[0] for c in pivoted.columns
+                            if not c.startswith(_NOAA_NODE_ID)})
 
     # Require F and H only from real sensor nodes; NOAA is treated as sparse
     required = [f'{n}_{t}' for n in real_node_ids for t in ('F', 'H')
@@ -243,6 +341,270 @@ def get_gateway_dataframe(db, gateway_id: str,
     return result
 
 
+def _build_pivoted_frame(db, gateway_id: str,
+                         start_ts: float) -> Optional[Tuple[pd.DataFrame, int, float]]:
+    """Query, bucket and pivot all readings since start_ts.
+
+    Returns (pivoted, bucket_secs, last_time) or None when the query fails or
+    yields no rows. last_time is the newest raw reading timestamp seen.
+    """
+    try:
+        df = _query_gateway_readings(db, gateway_id, start_ts)
+    except Exception as exc:
+        logger.warning('MongoDB query failed for gateway %s: %s', gateway_id, exc)
+        return None
+
+    if df.empty:
+        return None
+
+    # Bucket size is driven by real sensor nodes only (NOAA is hourly, not a sensor)
+    node_ids = sorted(df['node_id'].unique())
+    real_node_ids = [n for n in node_ids if n != _NOAA_NODE_ID]
+    bucket_secs = _optimal_bucket_seconds(df, real_node_ids)
+    logger.info('Gateway %s: using %d s buckets (nodes=%s)', gateway_id, bucket_secs, real_node_ids)
+
+    return _pivot_readings(df, bucket_secs), bucket_secs, float(df['time'].max())
+
+
+# ---------------------------------------------------------------------------
+# Gateway frame cache
+#
+# The bucketed wide frame (before NOAA handling, dropna and feature engineering)
+# is cached per gateway under models/{gateway}/frame_cache/ as plain .npy files
+# plus a JSON manifest. The manifest records the bucket size and the newest raw
+# reading covered, so a refresh only queries and re-pivots the readings since
+# then plus a trailing overlap for late uploads. Readers memory-map the arrays and slice the requested lookback.
+# ---------------------------------------------------------------------------
+
+_FRAME_CACHE_SUBDIR  = 'frame_cache'
+_FRAME_CACHE_MAX_AGE = 86400   # full rebuild after this many seconds (re-picks bucket size)
+_FRAME_CACHE_OVERLAP = 3600    # seconds before last_time re-read on refresh (late uploads)
+
+
+def _frame_cache_dir(gateway_id: str, cache_dir: str = MODELS_DIR) -> str:
+    return os.path.join(cache_dir, str(gateway_id), _FRAME_CACHE_SUBDIR)
+
+
+def load_frame_cache(gateway_id: str,
+                     cache_dir: str = MODELS_DIR) -> Optional[Tuple[pd.DataFrame, Dict]]:
+    """Return (pivoted, manifest) from the frame cache, or None if absent.
+
+    The values are memory-mapped read-only; callers must not modify the frame
+    in place.
+    """
+    path = _frame_cache_dir(gateway_id, cache_dir)
+    try:
+        with open(os.path.join(path, 'frame.json')) as f:
+            manifest = json.load(f)
+        gen = manifest['generation']
+        buckets = np.load(os.path.join(path, f'buckets.{gen}.npy'), mmap_mode='r')
+        values  = np.load(os.path.join(path, f'values.{gen}.npy'), mmap_mode='r')
+    except (OSError, ValueError, KeyError) as exc:
+        if not isinstance(exc, FileNotFoundError):
+            logger.warning('Gateway %s: unreadable frame cache: %s', gateway_id, exc)
+        return None
+
+    pivoted = pd.DataFrame(values, index=pd.Index(buckets, name='bucket'),
+                           columns=manifest['columns'], copy=False)
+    return pivoted, manifest
+
+
+def frame_cache_manifest(gateway_id: str, cache_dir: str = MODELS_DIR) -> Optional[Dict]:
+    """Return the frame cache manifest alone (no arrays), or None if absent."""
+    try:
+        with open(os.path.join(_frame_cache_dir(gateway_id, cache_dir), 'frame.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@contextlib.contextmanager
+def _frame_cache_lock(path: str):
+    """Exclusive lock serializing frame-cache writers across processes."""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _remove_stale_generations(path: str, keep: Optional[str] = None) -> None:
+    """Delete every generation's arrays (and stray manifests) except `keep`."""
+    kept = {f'buckets.{keep}.npy', f'values.{keep}.npy'} if keep else set()
+    for pattern in ('buckets.*.npy', 'values.*.npy', 'frame.json.*'):
+        for name in glob.glob(os.path.join(path, pattern)):
+            if os.path.basename(name) not in kept:
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+
+
+def save_frame_cache(gateway_id: str, pivoted: pd.DataFrame, bucket_secs: int,
+                     last_time: float, built_at: float,
+                     cache_dir: str = MODELS_DIR) -> None:
+    """Write pivoted to the frame cache, replacing the previous generation.
+
+    Arrays are written under a new generation name before the manifest is
+    swapped atomically, so concurrent readers never see a torn cache. Writers
+    are serialized with a lock file, and every other generation is removed
+    once the manifest points at the new one.
+    """
+    path = _frame_cache_dir(gateway_id, cache_dir)
+    with _frame_cache_lock(path):
+        gen = uuid.uuid4().hex[:12]
+        np.save(os.path.join(path, f'buckets.{gen}.npy'),
+                np.ascontiguousarray(pivoted.index.values, dtype=np.int64))
+        np.save(os.path.join(path, f'values.{gen}.npy'),
+                np.ascontiguousarray(pivoted.values, dtype=np.float64))
+
+        manifest = {'generation': gen,
+                    'columns': [str(c) for c in pivoted.columns],
+                    'bucket_seconds': int(bucket_secs),
+                    'first_bucket': int(pivoted.index.min()) if len(pivoted) else None,
+                    'last_bucket': int(pivoted.index.max()) if len(pivoted) else None,
+                    'last_time': float(last_time),
+                    'built_at': float(built_at),
+                    'updated_at': time.time()}
+        tmp_path = os.path.join(path, f'frame.json.{gen}')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(path, 'frame.json'))
+        _remove_stale_generations(path, keep=gen)
+
+
+def invalidate_frame_cache(gateway_id: str, cache_dir: str = MODELS_DIR) -> None:
+    """Drop the frame cache so the next read rebuilds it from MongoDB."""
+    path = _frame_cache_dir(gateway_id, cache_dir)
+    if not os.path.isdir(path):
+        return
+    with _frame_cache_lock(path):
+        try:
+            os.remove(os.path.join(path, 'frame.json'))
+            logger.info('Gateway %s: frame cache invalidated', gateway_id)
+        except FileNotFoundError:
+            pass
+        _remove_stale_generations(path)
+
+
+def _refresh_frame_cache(db, gateway_id: str,
+                         cache_dir: str = MODELS_DIR) -> Optional[Tuple[pd.DataFrame, int]]:
+    """Bring the gateway's frame cache up to date; return (pivoted, bucket_secs).
+
+    A missing or stale cache is rebuilt from _LOOKBACK_DAYS of readings.
+    Otherwise readings from _FRAME_CACHE_OVERLAP before the manifest's
+    last_time on are queried and pivoted with the cached bucket size, and
+    replace those buckets, so readings uploaded up to an hour late are picked
+    up (later ones wait for the daily rebuild). Buckets older than the
+    lookback window are trimmed; the cache is only rewritten if it changed.
+    """
+    now = time.time()
+    window_start = now - _LOOKBACK_DAYS * 86400
+    cached = load_frame_cache(gateway_id, cache_dir)
+
+    if cached is None or now - cached[1].get('built_at', 0) > _FRAME_CACHE_MAX_AGE:
+        built = _build_pivoted_frame(db, gateway_id, window_start)
+        if built is None:
+            return None
+        pivoted, bucket_secs, last_time = built
+        try:
+            save_frame_cache(gateway_id, pivoted, bucket_secs, last_time, now, cache_dir)
+        except OSError as exc:
+            logger.warning('Gateway %s: failed to write frame cache: %s', gateway_id, exc)
+        return pivoted, bucket_secs
+
+    pivoted, manifest = cached
+    bucket_secs = manifest['bucket_seconds']
+    # Re-read the trailing overlap so readings uploaded late (timestamped
+    # before last_time) still land in their buckets
+    since = (manifest['last_time'] - _FRAME_CACHE_OVERLAP) // bucket_secs * bucket_secs
+    try:
+        new_rows = _query_gateway_readings(db, gateway_id, since)
+    except Exception as exc:
+        logger.warning('MongoDB query failed for gateway %s: %s; using cached frame',
+                       gateway_id, exc)
+        return pivoted, bucket_secs
+
+    if new_rows.empty:
+        return pivoted, bucket_secs
+
+    # Buckets from `since` on are re-pivoted from all their readings, exactly
+    # as a rebuild would, and replace the cached ones
+    new = _pivot_readings(new_rows, bucket_secs)
+    columns = sorted(set(pivoted.columns) | set(new.columns))
+    last_time = max(manifest['last_time'], float(new_rows['time'].max()))
+    old_tail = pivoted.loc[pivoted.index >= since]
+    if last_time == manifest['last_time'] and old_tail.reindex(columns=columns).equals(
+            new.reindex(columns=columns)):
+        return pivoted, bucket_secs
+
+    head = pivoted.loc[pivoted.index < since]
+    merged = pd.concat([head.reindex(columns=columns), new.reindex(columns=columns)])
+    merged = merged.loc[merged.index >= window_start // bucket_secs * bucket_secs]
+    merged.index.name = 'bucket'
+
+    logger.debug('Gateway %s: frame cache re-read %d readings → %d buckets',
+                 gateway_id, len(new_rows), len(merged))
+    try:
+        save_frame_cache(gateway_id, merged, bucket_secs, last_time,
+                         manifest['built_at'], cache_dir)
+    except OSError as exc:
+        logger.warning('Gateway %s: failed to write frame cache: %s', gateway_id, exc)
+    return merged, bucket_secs
+
+
+def get_gateway_dataframe(db, gateway_id: str,
+                          lookback_days: int = _LOOKBACK_DAYS,
+                          use_cache: bool = True,
+                          cache_dir: str = MODELS_DIR) -> Optional[pd.DataFrame]:
+    """Query all nodes for gateway_id; return a wide time-bucketed DataFrame.
+
+    Columns are '{node_id}_{type}' (e.g. '1_F', '1_H', '2_F', '2_P').
+    The bucket size is chosen dynamically: for each node the median inter-reading
+    interval is computed; the bucket is set to the smallest value in
+    _BUCKET_CANDIDATES that is >= the slowest node's interval. This ensures all
+    nodes have at least one reading per bucket regardless of their duty cycle.
+    Rows missing F or H for any node are dropped; P columns are allowed to be
+    sparse. The returned DataFrame includes a 'time_rounded' column.
+    Returns None if fewer than 20 aligned rows remain.
+
+    With use_cache (the default) the pivoted frame comes from the per-gateway
+    frame cache, which is refreshed incrementally; lookbacks longer than
+    _LOOKBACK_DAYS always bypass the cache.
+    """
+    start_ts = time.time() - lookback_days * 86400
+
+    if use_cache and lookback_days <= _LOOKBACK_DAYS:
+        refreshed = _refresh_frame_cache(db, gateway_id, cache_dir)
+        if refreshed is None:
+            logger.info('No sensor rows found for gateway %s in last %d days',
+                        gateway_id, lookback_days)
+            return None
+        pivoted, bucket_secs = refreshed
+        pivoted = pivoted.loc[pivoted.index >= start_ts // bucket_secs * bucket_secs]
+        # Nodes that have not reported inside the window must not become required
+        pivoted = pivoted.dropna(axis=1, how='all')
+    else:
+        built = _build_pivoted_frame(db, gateway_id, start_ts)
+        if built is None:
+            logger.info('No sensor rows found for gateway %s in last %d days',
+                        gateway_id, lookback_days)
+            return None
+        pivoted = built[0]
+
+    if pivoted.empty:
+        logger.info('No sensor rows found for gateway %s in last %d days', gateway_id, lookback_days)
+        return None
+
+    # Check if NOAA is opted-in for this gateway
+    noaa_doc = db.NOAASettings.find_one({'gateway_id': gateway_id, 'enabled': True})
+    noaa_enabled = noaa_doc is not None
+
+    return _finalize_gateway_frame(pivoted.copy(), gateway_id, noaa_enabled)
+
+
 # ---------------------------------------------------------------------------
 # Model training & selection
 # ---------------------------------------------------------------------------
@@ -299,8 +661,10 @@ def train_and_select_best(
     pos_test = x_test_raw.copy()
     pos_test['class_label'] = 1
     neg_test = sample_utils.get_neg_sample(
-        x_test_raw, int(len(x_test_raw) * _TEST_RATIO), do_permute=True)
-    test_combined = pd.concat([pos_test, neg_test], ignore_index=True).sample(frac=1)
+        x_test_raw, int(len(x_test_raw) * _TEST_RATIO), do_permute=True,
+        rng=np.random.default_rng(random_state))
+    test_combined = pd.concat([pos_test, neg_test], ignore_index=True).sample(
+        frac=1, random_state=random_state)
     X_test_df = test_combined[feature_cols]
     y_test    = test_combined['class_label'].values
 
@@ -317,8 +681,7 @@ def train_and_select_best(
         try:
             logger.debug('Training %s...', name)
             det.train_model(x_train)
-            pred_df = det.predict(X_test_df.copy())
-            probs   = pred_df['class_prob'].values
+            probs   = _class_probs(det, X_test_df.to_numpy(dtype=np.float64), feature_cols)
             auc = float(compute_auc(y_test, probs))
             # F1 on the anomaly class (label=0): threshold class_prob at 0.5
             y_pred = (probs >= _ANOMALY_THRESHOLD).astype(int)
@@ -333,6 +696,21 @@ def train_and_select_best(
 
     best_name = max(results, key=lambda k: results[k][2])   # select by F1
     best_det, best_auc, best_f1 = results[best_name]
+
+    if _model_store.COMPACT_ENABLED:
+        x_test = X_test_df.to_numpy(dtype=np.float64)
+
+        def holdout_f1(det):
+            y_pred = (_class_probs(det, x_test, feature_cols) >= _ANOMALY_THRESHOLD).astype(int)
+            return sk_f1_score(y_test, y_pred, pos_label=0, zero_division=0)
+
+        best_det, report = _model_store.compact_ensemble(best_det, holdout_f1, _COMPACT_TOLERANCE)
+        if report['applied']:
+            best_det.compaction_ = report
+            logger.info('Compacted %s: %d -> %d trees (F1 %.4f -> %.4f)', best_name,
+                        report['trees_before'], report['trees_after'],
+                        report['score_before'], report['score_after'])
+
     logger.info('Best model: %s (F1=%.4f  AUC=%.4f) features=%s',
                 best_name, best_f1, best_auc, feature_cols)
     return best_det, best_name, best_auc, best_f1, feature_cols
@@ -353,7 +731,9 @@ def save_model(gateway_id: str, model, model_type: str,
     """Persist gateway-level model + metadata to models/{gateway}/.
 
     Normalization is embedded inside the detector object and saved by joblib;
-    no separate normalization.json is needed.
+    no separate normalization.json is needed. The artifact manifest from
+    model_store.save_artifact (and the compaction report, if the model was
+    compacted) is recorded in the metadata.
     """
     path = _model_dir(gateway_id, models_dir)
     try:
@@ -365,38 +745,74 @@ def save_model(gateway_id: str, model, model_type: str,
     model_path = os.path.join(path, 'model.joblib')
     meta_path = os.path.join(path, 'metadata.json')
 
+    # save_artifact writes then renames: other workers may have the previous
+    # file memory-mapped, and truncating it in place would invalidate their mappings.
     try:
-        joblib.dump(model, model_path)
+        artifact = _model_store.save_artifact(model, model_path, verify=True)
     except Exception as exc:
         logger.error('Failed to save model to %s: %s', model_path, exc)
         raise
 
+    metadata = {'model_type': model_type, 'auc': auc, 'f1': f1,
+                'feature_columns': feature_columns,
+                'nodes': nodes,
+                'num_rows': num_rows,
+                'trained_at': time.time(),
+                'artifact': artifact}
+    if getattr(model, 'compaction_', None):
+        metadata['compaction'] = model.compaction_
     try:
         with open(meta_path, 'w') as f:
-            json.dump({'model_type': model_type, 'auc': auc, 'f1': f1,
-                       'feature_columns': feature_columns,
-                       'nodes': nodes,
-                       'num_rows': num_rows,
-                       'trained_at': time.time()}, f)
+            json.dump(metadata, f)
     except Exception as exc:
         logger.error('Failed to save metadata to %s: %s', meta_path, exc)
         if os.path.isfile(model_path):
             os.remove(model_path)
         raise
+    finally:
+        _model_cache.cache.bump_version((str(gateway_id), None, None))
+
+    logger.info('Saved %s gateway model (F1=%.4f  AUC=%.4f) nodes=%s num_rows=%d '
+                '(%.1f KB, load %.3fs) to %s', model_type, f1, auc, nodes, num_rows,
+                artifact['size_bytes'] / 1024, artifact['load_seconds'], path)
 
-    logger.info('Saved %s gateway model (F1=%.4f  AUC=%.4f) nodes=%s num_rows=%d to %s',
-                model_type, f1, auc, nodes, num_rows, path)
 
+def load_model(gateway_id: str, models_dir: str = MODELS_DIR,
+               mmap_mode: Optional[str] = None, verify: bool = False) -> Tuple[object, Dict]:
+    """Load (model, metadata). Raises FileNotFoundError if absent.
 
-def load_model(gateway_id: str, models_dir: str = MODELS_DIR) -> Tuple[object, Dict]:
-    """Load (model, metadata). Raises FileNotFoundError if absent."""
+    mmap_mode is passed to joblib.load; with 'r' the model's numpy arrays are
+    memory-mapped from the artifact instead of copied. It is ignored for
+    compressed artifacts, which joblib cannot map. With verify the artifact's
+    sha256 is checked against the metadata (ValueError on mismatch).
+    """
     path = _model_dir(gateway_id, models_dir)
-    model = joblib.load(os.path.join(path, 'model.joblib'))
     with open(os.path.join(path, 'metadata.json')) as f:
         metadata = json.load(f)
+    model = _model_store.load_artifact(os.path.join(path, 'model.joblib'),
+                                       metadata.get('artifact'), mmap_mode=mmap_mode,
+                                       verify=verify)
     return model, metadata
 
 
+def load_cached_model(gateway_id: str,
+                      models_dir: str = MODELS_DIR) -> Tuple[object, Dict]:
+    """Load (model, metadata) through the per-worker model cache.
+
+    Repeat calls within the cache's revalidation interval do not touch the
+    filesystem; a miss checks the artifact's content hash. Raises
+    FileNotFoundError if the model is absent and ValueError if the hash does
+    not match (nothing is cached, so the next call retries).
+    """
+    path = _model_dir(gateway_id, models_dir)
+    return _model_cache.cache.get(
+        (str(gateway_id), None, None),
+        [os.path.join(path, 'model.joblib'), os.path.join(path, 'metadata.json')],
+        lambda: load_model(gateway_id, models_dir, mmap_mode='r', verify=True),
+        size_of=lambda loaded: _model_store.resident_bytes(loaded[0], loaded[1].get('artifact')),
+    )
+
+
 def model_exists(gateway_id: str, models_dir: str = MODELS_DIR) -> bool:
     return os.path.isfile(os.path.join(_model_dir(gateway_id, models_dir), 'model.joblib'))
 
@@ -405,6 +821,18 @@ def model_exists(gateway_id: str, models_dir: str = MODELS_DIR) -> bool:
 # Prediction
 # ---------------------------------------------------------------------------
 
+def _class_probs(model, x: np.ndarray, cols: List[str]) -> np.ndarray:
+    """Return class_prob for every row of x, whose columns are cols (training order).
+
+    Uses the detector's score_array fast path; falls back to predict() for
+    detectors that only support DataFrames.
+    """
+    try:
+        return model.score_array(x)
+    except NotImplementedError:
+        return model.predict(pd.DataFrame(x, columns=cols, copy=False))['class_prob'].values
+
+
 def predict_anomalies(model, fh_df: pd.DataFrame,
                       threshold: float = _ANOMALY_THRESHOLD,
                       feature_columns: Optional[List[str]] = None) -> List[float]:
@@ -436,8 +864,7 @@ def predict_anomalies(model, fh_df: pd.DataFrame,
                   else fh_df.index.values.astype(float))
 
     try:
-        result = model.predict(fh_df[cols].copy())
-        mask = result['class_prob'].values < threshold
+        mask = _class_probs(model, fh_df[cols].to_numpy(dtype=np.float64), cols) < threshold
     except Exception as exc:
         logger.warning('Prediction failed: %s', exc)
         return []
@@ -450,6 +877,364 @@ def predict_anomalies(model, fh_df: pd.DataFrame,
     return anomalies
 
 
+# ---------------------------------------------------------------------------
+# Materialized anomaly scores
+#
+# Historical buckets never change once complete, so class_prob is computed
+# once per (gateway_id, time_rounded) and stored in AnomalyScores: backfilled
+# right after training and extended by anomaly_scorer.py as new buckets land.
+# /predict_anomaly then becomes a range query over this collection.
+# ---------------------------------------------------------------------------
+
+_SCORES_COLLECTION = 'AnomalyScores'
+
+
+def _score_rows(model, feature_columns: List[str], gw_df: pd.DataFrame) -> List[Dict]:
+    """Score every aligned row of gw_df; return one partial score doc per bucket."""
+    available = [c for c in feature_columns if c in gw_df.columns]
+    pred_df = gw_df[['time_rounded'] + available].dropna(subset=available)
+    if pred_df.empty:
+        return []
+
+    probs = _class_probs(model, pred_df[available].to_numpy(dtype=np.float64), available)
+    # Nodes with a temperature column in the row (used for per-node filtering)
+    node_f_cols = [c for c in available
+                   if c.endswith('_F') and c.count('_') == 1
+                   and not c.startswith(_NOAA_NODE_ID)]
+    present = pred_df[node_f_cols].notna().values
+    node_ids = [c[:-2] for c in node_f_cols]
+    return [
+        {'time_rounded': float(ts), 'class_prob': float(p),
+         'nodes': [n for n, ok in zip(node_ids, row) if ok]}
+        for ts, p, row in zip(pred_df['time_rounded'].values, probs, present)
+    ]
+
+
+def backfill_anomaly_scores(db, gateway_id: str, models_dir: str = MODELS_DIR,
+                            gw_df: Optional[pd.DataFrame] = None) -> int:
+    """Replace the gateway's stored scores with a full re-score of the lookback window.
+
+    The new scores are upserted per (gateway_id, time_rounded) before the
+    buckets scored by any other model are deleted, so readers always find a
+    complete set of scores. gw_df may be passed to reuse a frame the caller
+    already built (training). Returns the number of buckets stored.
+    """
+    model, metadata = load_cached_model(gateway_id, models_dir)
+    if gw_df is None:
+        gw_df = get_gateway_dataframe(db, gateway_id, cache_dir=models_dir)
+    if gw_df is None:
+        return 0
+
+    docs = _score_rows(model, metadata.get('feature_columns', []), gw_df)
+    trained_at = metadata.get('trained_at')
+    for doc in docs:
+        doc.update(gateway_id=gateway_id, model_trained_at=trained_at)
+
+    col = db[_SCORES_COLLECTION]
+    col.create_index([('gateway_id', 1), ('time_rounded', 1)], unique=True)
+    if docs:
+        col.bulk_write([
+            UpdateOne({'gateway_id': gateway_id, 'time_rounded': doc['time_rounded']},
+                      {'$set': doc}, upsert=True)
+            for doc in docs
+        ], ordered=False)
+    col.delete_many({'gateway_id': gateway_id, 'model_trained_at': {'$ne': trained_at}})
+    logger.info('Gateway %s: backfilled %d anomaly scores', gateway_id, len(docs))
+    return len(docs)
+
+
+def score_new_anomaly_buckets(db, gateway_id: str, models_dir: str = MODELS_DIR) -> int:
+    """Score buckets newer than the last stored score; backfill if none are stored.
+
+    The most recent stored bucket is re-scored too, in case it was still
+    filling when first scored. Returns the number of buckets written.
+    """
+    model, metadata = load_cached_model(gateway_id, models_dir)
+    trained_at = metadata.get('trained_at')
+    col = db[_SCORES_COLLECTION]
+    last = col.find_one({'gateway_id': gateway_id, 'model_trained_at': trained_at},
+                        {'_id': 0, 'time_rounded': 1}, sort=[('time_rounded', -1)])
+    if last is None:
+        return backfill_anomaly_scores(db, gateway_id, models_dir)
+
+    last_ts = last['time_rounded']
+    # One spare day covers the rolling-feature warm-up before last_ts
+    lookback_days = min(_LOOKBACK_DAYS, int((time.time() - last_ts) // 86400) + 2)
+    gw_df = get_gateway_dataframe(db, gateway_id, lookback_days=lookback_days,
+                                  cache_dir=models_dir)
+    if gw_df is None:
+        return 0
+
+    docs = _score_rows(model, metadata.get('feature_columns', []),
+                       gw_df[gw_df['time_rounded'] >= last_ts])
+    if docs:
+        col.bulk_write([
+            UpdateOne({'gateway_id': gateway_id, 'time_rounded': doc['time_rounded']},
+                      {'$set': {**doc, 'model_trained_at': trained_at}}, upsert=True)
+            for doc in docs
+        ], ordered=False)
+    logger.debug('Gateway %s: scored %d new bucket(s) after %s', gateway_id, len(docs), last_ts)
+    return len(docs)
+
+
+def query_anomaly_scores(db, gateway_id: str, metadata: Dict, start_ts: float,
+                         node_id: Optional[str] = None,
+                         threshold: float = _ANOMALY_THRESHOLD) -> Optional[List[float]]:
+    """Return stored anomalous timestamps since start_ts, or None if not materialized.
+
+    Scores from a model other than the one described by metadata are ignored.
+    The node filter is applied in the query, and only when the node is part
+    of the model (otherwise all gateway anomalies are returned).
+    """
+    col = db[_SCORES_COLLECTION]
+    base = {'gateway_id': gateway_id, 'model_trained_at': metadata.get('trained_at')}
+    if col.find_one(base, {'_id': 1}) is None:
+        return None
+
+    qry = {**base, 'time_rounded': {'$gte': start_ts}, 'class_prob': {'$lt': threshold}}
+    if node_id and f'{node_id}_F' in metadata.get('feature_columns', []):
+        qry['nodes'] = str(node_id)
+    cursor = col.find(qry, {'_id': 0, 'time_rounded': 1}).sort('time_rounded', 1)
+    return [doc['time_rounded'] for doc in cursor]
+
+
+# ---------------------------------------------------------------------------
+# Online (streaming) scoring
+#
+# OnlineAnomalyScorer keeps the last _TREND_WINDOW aligned buckets of a gateway
+# in a ring buffer together with running sums, so each new bucket's engineered
+# features are an O(1) update instead of a frame rebuild. Readings are fed one
+# at a time; a bucket is scored as soon as every raw column the model uses has
+# reported, or closed (and scored if possible) once readings two buckets newer
+# arrive. Features match _add_engineered_features on the same aligned rows.
+# ---------------------------------------------------------------------------
+
+_TREND_SUFFIXES = ('_delta', '_roll_mean', '_roll_std')
+_TIME_FEATURES  = ('hour_sin', 'hour_cos', 'dow_sin', 'dow_cos')
+
+
+class _RollingWindow:
+    """Ring buffer of the last `size` rows with nan-aware running mean/std.
+
+    Values are offset by the first observation per column before summing so
+    the sum-of-squares variance stays accurate for readings far from zero.
+    """
+
+    def __init__(self, n_cols: int, size: int = _TREND_WINDOW):
+        self.size = size
+        self._buf = np.full((size, n_cols), np.nan)
+        self._head = 0
+        self._len = 0
+        self._shift = np.full(n_cols, np.nan)
+        self._count = np.zeros(n_cols)
+        self._sum = np.zeros(n_cols)
+        self._sumsq = np.zeros(n_cols)
+        self.last = np.full(n_cols, np.nan)
+
+    def push(self, row: np.ndarray) -> None:
+        unset = np.isnan(self._shift) & ~np.isnan(row)
+        self._shift[unset] = row[unset]
+
+        if self._len == self.size:
+            self._remove(self._buf[self._head])
+        else:
+            self._len += 1
+        self._buf[self._head] = row
+        self._head = (self._head + 1) % self.size
+        self._add(row)
+        self.last = row
+
+    def _add(self, row: np.ndarray) -> None:
+        ok = ~np.isnan(row)
+        d = np.where(ok, row - self._shift, 0.0)
+        self._count += ok
+        self._sum += d
+        self._sumsq += d * d
+
+    def _remove(self, row: np.ndarray) -> None:
+        ok = ~np.isnan(row)
+        d = np.where(ok, row - self._shift, 0.0)
+        self._count -= ok
+        self._sum -= d
+        self._sumsq -= d * d
+
+    def mean_std(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (mean, population std); mean is NaN for all-NaN columns, std 0."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            m = self._sum / self._count
+            var = np.maximum(self._sumsq / self._count - m * m, 0.0)
+        std = np.where(self._count > 0, np.sqrt(var), 0.0)
+        return m + self._shift, std
+
+
+class OnlineAnomalyScorer:
+    """Incrementally engineer features and score new buckets for one gateway.
+
+    Build with from_history() (or construct directly and call seed()), then
+    feed readings in time order with add_reading(). Each call returns the
+    score docs completed by that reading, in the same shape as the docs in
+    AnomalyScores ({'time_rounded', 'class_prob', 'nodes'}).
+    """
+
+    def __init__(self, gateway_id: str, model, feature_columns: List[str],
+                 bucket_secs: int, trained_at: Optional[float] = None):
+        self.gateway_id = gateway_id
+        self.model = model
+        self.feature_columns = list(feature_columns)
+        self.bucket_secs = int(bucket_secs)
+        self.trained_at = trained_at
+
+        base = [c for c in self.feature_columns
+                if c not in _TIME_FEATURES and not c.endswith(_TREND_SUFFIXES)]
+        self.noaa_col = f'{_NOAA_NODE_ID}_F'
+        self.use_noaa = self.noaa_col in base
+        # Raw sensor columns (trend features are computed for all of them)
+        self.raw_cols = sorted(c for c in base if not c.startswith(_NOAA_NODE_ID))
+        self._col_index = {c: i for i, c in enumerate(self.raw_cols)}
+        node_ids = sorted({c.rsplit('_', 1)[0] for c in self.raw_cols})
+        self._required_idx = np.array([self._col_index[f'{n}_{t}']
+                                       for n in node_ids for t in ('F', 'H')
+                                       if f'{n}_{t}' in self._col_index], dtype=int)
+        self._node_f = [(n, self._col_index[f'{n}_F']) for n in node_ids
+                        if f'{n}_F' in self._col_index]
+
+        self._window = _RollingWindow(len(self.raw_cols))
+        self._pending: Dict[int, np.ndarray] = {}
+        self._pending_noaa: Dict[int, float] = {}
+        self._noaa = np.nan
+        self.last_bucket: Optional[int] = None
+        self.last_time: Optional[float] = None
+
+    @classmethod
+    def from_history(cls, db, gateway_id: str,
+                     models_dir: str = MODELS_DIR) -> Optional['OnlineAnomalyScorer']:
+        """Create a scorer for the gateway's current model, seeded from the frame cache.
+
+        The frame cache is only read: refreshing it is left to the request
+        path, and without a cache the frame is built in memory. The scorer's
+        last_time is the newest raw reading the seed covers, i.e. where the
+        caller should resume feeding readings. Returns None when the gateway
+        has no readings; raises FileNotFoundError if no model is saved.
+        """
+        model, metadata = load_cached_model(gateway_id, models_dir)
+        cached = load_frame_cache(gateway_id, models_dir)
+        if cached is not None:
+            pivoted, manifest = cached
+            bucket_secs, last_time = manifest['bucket_seconds'], manifest['last_time']
+        else:
+            built = _build_pivoted_frame(db, gateway_id, time.time() - _LOOKBACK_DAYS * 86400)
+            if built is None:
+                return None
+            pivoted, bucket_secs, last_time = built
+        scorer = cls(gateway_id, model, metadata.get('feature_columns', []),
+                     bucket_secs, metadata.get('trained_at'))
+        scorer.seed(pivoted)
+        scorer.last_time = float(last_time)
+        return scorer
+
+    def seed(self, pivoted: pd.DataFrame) -> None:
+        """Load history from a pivoted bucket frame (as built by _pivot_readings).
+
+        Every bucket but the newest is treated as closed: the last
+        _TREND_WINDOW aligned ones fill the ring buffer. The newest bucket may
+        still be filling, so its cells become pending.
+        """
+        if pivoted.empty:
+            return
+        cols = [c for c in self.raw_cols if c in pivoted.columns]
+        raw = np.full((len(pivoted), len(self.raw_cols)), np.nan)
+        raw[:, [self._col_index[c] for c in cols]] = pivoted[cols].to_numpy(dtype=np.float64)
+        buckets = pivoted.index.values.astype(np.int64)
+
+        if self.use_noaa and self.noaa_col in pivoted.columns:
+            noaa = pivoted[self.noaa_col].values[:-1]
+            seen = noaa[~np.isnan(noaa)]
+            if len(seen):
+                self._noaa = float(seen[-1])
+            if not np.isnan(pivoted[self.noaa_col].values[-1]):
+                self._pending_noaa[int(buckets[-1])] = float(pivoted[self.noaa_col].values[-1])
+
+        closed = raw[:-1]
+        aligned = closed[~np.isnan(closed[:, self._required_idx]).any(axis=1)]
+        for row in aligned[-_TREND_WINDOW:]:
+            self._window.push(row)
+        if len(buckets) > 1:
+            self.last_bucket = int(buckets[-2])
+        self._pending[int(buckets[-1])] = raw[-1].copy()
+
+    def add_reading(self, node_id: str, type_: str, value: float, ts: float) -> List[Dict]:
+        """Feed one raw reading; return score docs for buckets it completed."""
+        bucket = int(ts // self.bucket_secs) * self.bucket_secs
+        if self.last_bucket is not None and bucket <= self.last_bucket:
+            return []   # late reading for a bucket that is already closed
+
+        if str(node_id) == _NOAA_NODE_ID:
+            if self.use_noaa and type_ == 'F':
+                self._pending_noaa.setdefault(bucket, float(value))
+            return []
+
+        idx = self._col_index.get(f'{node_id}_{type_}')
+        if idx is None:
+            return []
+        row = self._pending.get(bucket)
+        if row is None:
+            row = self._pending[bucket] = np.full(len(self.raw_cols), np.nan)
+        if np.isnan(row[idx]):   # first reading in the bucket wins
+            row[idx] = value
+
+        if not np.isnan(row).any():
+            return self._close_through(bucket)
+        return self._close_through(bucket - 2 * self.bucket_secs)
+
+    def flush(self) -> List[Dict]:
+        """Close every pending bucket (e.g. at shutdown or in tests)."""
+        if not self._pending:
+            return []
+        return self._close_through(max(self._pending))
+
+    def _close_through(self, bucket: int) -> List[Dict]:
+        docs = []
+        for b in sorted(k for k in self._pending if k <= bucket):
+            doc = self._close(b, self._pending.pop(b))
+            if doc is not None:
+                docs.append(doc)
+        for b in sorted(k for k in self._pending_noaa if k <= bucket):
+            self._noaa = self._pending_noaa.pop(b)
+        return docs
+
+    def _close(self, bucket: int, row: np.ndarray) -> Optional[Dict]:
+        # Forward-fill NOAA through every bucket up to this one
+        for b in sorted(k for k in self._pending_noaa if k <= bucket):
+            self._noaa = self._pending_noaa.pop(b)
+        self.last_bucket = bucket
+        if np.isnan(row[self._required_idx]).any():
+            return None   # not aligned: dropped, exactly like the batch dropna
+
+        prev = self._window.last
+        self._window.push(row)
+        mean, std = self._window.mean_std()
+        delta = np.nan_to_num(row - prev, nan=0.0)
+
+        feats = dict(zip(self.raw_cols, row))
+        for i, col in enumerate(self.raw_cols):
+            feats[f'{col}_delta'] = delta[i]
+            feats[f'{col}_roll_mean'] = mean[i]
+            feats[f'{col}_roll_std'] = std[i]
+        hour = (bucket % 86400) / 3600
+        dow = (bucket // 86400) % 7
+        feats.update(hour_sin=np.sin(2 * np.pi * hour / 24), hour_cos=np.cos(2 * np.pi * hour / 24),
+                     dow_sin=np.sin(2 * np.pi * dow / 7), dow_cos=np.cos(2 * np.pi * dow / 7))
+        if self.use_noaa:
+            feats[self.noaa_col] = self._noaa
+
+        x = np.array([[feats.get(c, np.nan) for c in self.feature_columns]])
+        if np.isnan(x).any():
+            return None   # e.g. a sparse P column the model needs is missing
+        prob = _class_probs(self.model, x, self.feature_columns)[0]
+        return {'time_rounded': float(bucket), 'class_prob': float(prob),
+                'nodes': [n for n, i in self._node_f if not np.isnan(row[i])]}
+
+
 # ---------------------------------------------------------------------------
 # NOAA historical backfill (inlined from NOAAHistoricalFetcher.py logic)
 # ---------------------------------------------------------------------------
@@ -461,14 +1246,15 @@ _NOAA_PAGE_LIMIT = 500
 
 
 def _backfill_noaa_history(db, gateway_id: str, lat: float, lon: float,
-                            lookback_days: int) -> None:
+                            lookback_days: int, cache_dir: str = MODELS_DIR) -> None:
     """Fetch historical NOAA observations and insert any missing hour-buckets.
 
     Called at the start of train_for_gateway() when NOAA is enabled so that
     the training window is fully populated before get_gateway_dataframe() runs.
     Uses the same document schema and deduplication logic as NOAAHistoricalFetcher.py.
     Failures are logged and swallowed — training proceeds without NOAA features
-    if the API is unavailable.
+    if the API is unavailable. Inserting history invalidates the gateway's
+    frame cache, since those rows predate its incremental high-water mark.
     """
     now_utc  = datetime.datetime.now(datetime.timezone.utc)
     start_dt = (now_utc - datetime.timedelta(days=lookback_days)).replace(
@@ -590,6 +1376,8 @@ def _backfill_noaa_history(db, gateway_id: str, lat: float, lon: float,
             logger.info('Gateway %s: inserted %d NOAA history records', gateway_id, len(docs))
         except Exception as exc:
             logger.warning('Gateway %s: NOAA history insert error: %s', gateway_id, exc)
+        # Unordered inserts may land partially even on error
+        invalidate_frame_cache(gateway_id, cache_dir)
     else:
         logger.info('Gateway %s: NOAA history already up to date (0 new records)', gateway_id)
 
@@ -612,10 +1400,10 @@ def train_for_gateway(gateway_id: str, db,
     if noaa_doc and noaa_doc.get('lat') is not None and noaa_doc.get('lon') is not None:
         _backfill_noaa_history(db, gateway_id,
                                float(noaa_doc['lat']), float(noaa_doc['lon']),
-                               _LOOKBACK_DAYS)
+                               _LOOKBACK_DAYS, models_dir)
 
     logger.info('Building gateway-wide DataFrame for %s', gateway_id)
-    gw_df = get_gateway_dataframe(db, gateway_id)
+    gw_df = get_gateway_dataframe(db, gateway_id, cache_dir=models_dir)
     if gw_df is None:
         logger.info('Skipping gateway %s: insufficient aligned data', gateway_id)
         return [{'gateway_id': gateway_id, 'status': 'skipped',
@@ -631,6 +1419,10 @@ def train_for_gateway(gateway_id: str, db,
     nodes = sorted({c.rsplit('_', 1)[0] for c in feature_cols})
     num_rows = len(feature_df)
     save_model(gateway_id, model, model_type, auc, f1, feature_cols, nodes, num_rows, models_dir)
+    try:
+        backfill_anomaly_scores(db, gateway_id, models_dir, gw_df=gw_df)
+    except Exception as exc:
+        logger.warning('Gateway %s: anomaly score backfill failed: %s', gateway_id, exc)
     logger.info('Training complete for gateway %s: %s F1=%.4f AUC=%.4f nodes=%s num_rows=%d',
                 gateway_id, model_type, f1, auc, nodes, num_rows)
     return [{'gateway_id': gateway_id, 'status': 'done',
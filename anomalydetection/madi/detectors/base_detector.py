@@ -14,9 +14,33 @@
 """Base class for Anomaly Detector instances."""
 
 import abc
+import contextlib
+from typing import Iterator, Optional
+import warnings
 
+import numpy as np
 import pandas as pd
 
+# Rows scored per sklearn call in score_array; bounds the temporaries.
+SCORE_CHUNK_ROWS = 65536
+
+
+def iter_chunks(x: np.ndarray,
+                chunk_rows: Optional[int] = None) -> Iterator[slice]:
+  """Yields row slices covering x in chunks of at most chunk_rows."""
+  chunk_rows = chunk_rows or SCORE_CHUNK_ROWS
+  for start in range(0, len(x), chunk_rows):
+    yield slice(start, min(start + chunk_rows, len(x)))
+
+
+@contextlib.contextmanager
+def ignore_feature_names():
+  """Silences sklearn's warning for arrays passed to a DataFrame-fitted model."""
+  with warnings.catch_warnings():
+    warnings.filterwarnings(
+        'ignore', message='X does not have valid feature names', category=UserWarning)
+    yield
+
 
 class BaseAnomalyDetectionAlgorithm(metaclass=abc.ABCMeta):
   """All AD algorithms will include a train and predict step."""
@@ -30,3 +54,20 @@ class BaseAnomalyDetectionAlgorithm(metaclass=abc.ABCMeta):
   def predict(self, sample_df: pd.DataFrame) -> pd.DataFrame:
     """Predicts with the model on a test set."""
     pass
+
+  def score_array(self, x: np.ndarray) -> np.ndarray:
+    """Returns class_prob for every row of x, skipping the DataFrame round-trip.
+
+    Args:
+      x: M x N array of raw (not normalized) features, columns in the order
+        the model was trained with. float64 input reproduces predict()
+        exactly; float32 is accepted and avoids a conversion.
+
+    Returns:
+      Length-M float array, 1.0 for normal to 0.0 for anomalous.
+
+    Raises:
+      NotImplementedError: if the detector only supports predict().
+    """
+    raise NotImplementedError(
+        '%s does not implement score_array' % type(self).__name__)
@@ -13,10 +13,13 @@
 #     limitations under the License.
 """Isolation Forest Anomaly Detector."""
 from madi.detectors.base_detector import BaseAnomalyDetectionAlgorithm
+from madi.detectors.base_detector import ignore_feature_names
+from madi.detectors.base_detector import iter_chunks
 import madi.utils.sample_utils as sample_utils
 import numpy as np
 import pandas as pd
 import sklearn.ensemble
+import sklearn.utils
 
 _CLASS_LABEL = 'class_label'
 _NORMAL_CLASS = 1
@@ -109,10 +112,15 @@ class NegativeSamplingRandomForestAd(sklearn.ensemble.RandomForestClassifier,
     normalized_x_train = sample_utils.normalize(x_train[column_order],
                                                 self._normalization_info)
 
+    # The negative sample is drawn from random_state as well, so a fixed
+    # random_state reproduces the whole fit, not just the trees.
+    sampler_seed = sklearn.utils.check_random_state(self.random_state).randint(
+        np.iinfo(np.int32).max)
     normalized_training_sample = sample_utils.apply_negative_sample(
         positive_sample=normalized_x_train,
         sample_ratio=self.sample_ratio,
-        sample_delta=self.sample_delta)
+        sample_delta=self.sample_delta,
+        rng=sampler_seed)
 
     super(NegativeSamplingRandomForestAd, self).fit(
         X=normalized_training_sample[column_order],
@@ -137,3 +145,13 @@ class NegativeSamplingRandomForestAd(sklearn.ensemble.RandomForestClassifier,
     preds = super(NegativeSamplingRandomForestAd, self).predict_proba(x)
     sample_df['class_prob'] = preds[:, _NORMAL_CLASS]
     return sample_df
+
+  def score_array(self, x: np.ndarray) -> np.ndarray:
+    out = np.empty(len(x), dtype=np.float64)
+    with ignore_feature_names():
+      for rows in iter_chunks(x):
+        x_test = sample_utils.normalize_array(
+            x[rows], self._normalization_info).astype(np.float32)
+        out[rows] = super(NegativeSamplingRandomForestAd,
+                          self).predict_proba(x_test)[:, _NORMAL_CLASS]
+    return out
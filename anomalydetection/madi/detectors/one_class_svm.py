@@ -13,6 +13,8 @@
 #     limitations under the License.
 """Wrapper for One-Class SVM Anomaly Detector based on sklearn."""
 from madi.detectors.base_detector import BaseAnomalyDetectionAlgorithm
+from madi.detectors.base_detector import ignore_feature_names
+from madi.detectors.base_detector import iter_chunks
 import madi.utils.sample_utils as sample_utils
 import numpy as np
 import pandas as pd
@@ -92,3 +94,13 @@ class OneClassSVMAd(sklearn.svm.OneClassSVM, BaseAnomalyDetectionAlgorithm):
     preds = super(OneClassSVMAd, self).predict(x_test)
     sample_df['class_prob'] = np.where(preds == -1, 0, preds)
     return sample_df
+
+  def score_array(self, x: np.ndarray) -> np.ndarray:
+    out = np.empty(len(x), dtype=np.float64)
+    with ignore_feature_names():
+      for rows in iter_chunks(x):
+        x_test = sample_utils.normalize_array(
+            x[rows], self._normalization_info).astype(np.float32)
+        preds = super(OneClassSVMAd, self).predict(x_test)
+        out[rows] = np.where(preds == -1, 0, preds)
+    return out
@@ -13,11 +13,14 @@
 #     limitations under the License.
 """Utilities to to generate or modify data samples."""
 
-from typing import List, Dict
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
+# Anything accepted as a source of randomness: a Generator, a seed or None.
+RandomState = Optional[Union[int, np.random.Generator]]
+
 
 class Variable(object):
 
@@ -39,9 +42,9 @@ def get_normalization_info(df: pd.DataFrame) -> Dict[str, Variable]:
     df: Pandas dataframe with numeric feature data.
 
   Returns:
-    A dict with Variable.name, Variable.
+    A NormalizationInfo dict with Variable.name, Variable.
   """
-  variables = {}
+  variables = NormalizationInfo()
   for column in df:
     if not np.issubdtype(df[column].dtype, np.number):
       raise ValueError("The feature column %s is not numeric." % column)
@@ -62,12 +65,95 @@ def get_normalization_info(df: pd.DataFrame) -> Dict[str, Variable]:
   return variables
 
 
+class NormalizationInfo(dict):
+  """Dict of column name -> Variable that caches its compiled array form.
+
+  The mean/std vectors and the column order are built on first use and
+  reused by every normalize/denormalize call; they are dropped by every
+  mutating dict method, and are not pickled. Changing a Variable's fields in
+  place is not detected: assign a new Variable to the key instead. Plain
+  dicts (e.g. pickled by older models) are still accepted everywhere and
+  compiled on each call.
+  """
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self._compiled = None
+
+  def __setitem__(self, key, value):
+    self._compiled = None
+    super().__setitem__(key, value)
+
+  def __delitem__(self, key):
+    self._compiled = None
+    super().__delitem__(key)
+
+  def update(self, *args, **kwargs):
+    self._compiled = None
+    super().update(*args, **kwargs)
+
+  def __ior__(self, other):
+    self._compiled = None
+    return super().__ior__(other)
+
+  def pop(self, *args):
+    self._compiled = None
+    return super().pop(*args)
+
+  def popitem(self):
+    self._compiled = None
+    return super().popitem()
+
+  def setdefault(self, key, default=None):
+    self._compiled = None
+    return super().setdefault(key, default)
+
+  def clear(self):
+    self._compiled = None
+    super().clear()
+
+  def __getstate__(self):
+    return {}
+
+  def __setstate__(self, state):
+    self._compiled = None
+
+
+def _compile(
+    normalization_info: Dict[str, Variable]
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+  """Returns (column order, mean vector, std vector) for normalization_info."""
+  compiled = getattr(normalization_info, "_compiled", None)
+  if compiled is not None:
+    return compiled
+  variables = sorted(normalization_info.values(), key=lambda var: var.index)
+  compiled = ([var.name for var in variables],
+              np.array([var.mean for var in variables], dtype=np.float64),
+              np.array([var.std for var in variables], dtype=np.float64))
+  if isinstance(normalization_info, NormalizationInfo):
+    normalization_info._compiled = compiled
+  return compiled
+
+
 def get_column_order(normalization_info: Dict[str, Variable]) -> List[str]:
   """Returns a list of column names, as strings, in model order."""
-  return [
-      var.name
-      for var in sorted(normalization_info.values(), key=lambda var: var.index)
-  ]
+  return list(_compile(normalization_info)[0])
+
+
+def normalize_array(x: np.ndarray,
+                    normalization_info: Dict[str, Variable]) -> np.ndarray:
+  """Normalizes an M x N array whose columns are already in model order.
+
+  Columns with std == 0 become 0.0. The result is float64 unless x is a
+  floating array of another precision (e.g. float32), which is preserved.
+  """
+  _, mean, std = _compile(normalization_info)
+  dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+  constant = std == 0.0
+  out = (x - mean.astype(dtype)) / np.where(constant, 1.0, std).astype(dtype)
+  if constant.any():
+    out[:, constant] = 0.0
+  return out
 
 
 def normalize(df: pd.DataFrame,
@@ -81,21 +167,10 @@ def normalize(df: pd.DataFrame,
   Returns:
     Pandas M x N DataFrame with normalized features.
   """
-
-  normalized_cols = []
-  for column in get_column_order(normalization_info):
-    if normalization_info[column].std == 0.0:
-      normalized_column_series = pd.Series(0.0, name=column, index=df.index)
-    else:
-      normalized_values = (
-          df[column] - normalization_info[column].mean
-      ) / normalization_info[column].std
-      normalized_column_series = pd.Series(
-          normalized_values, name=column, index=df.index
-      )
-
-    normalized_cols.append(normalized_column_series)
-  return pd.concat(normalized_cols, axis=1)
+  columns = _compile(normalization_info)[0]
+  x = df[columns].to_numpy(dtype=np.float64)
+  return pd.DataFrame(normalize_array(x, normalization_info),
+                      index=df.index, columns=columns, copy=False)
 
 
 def denormalize(df_norm: pd.DataFrame,
@@ -109,23 +184,13 @@ def denormalize(df_norm: pd.DataFrame,
   Returns:
     Pandas M x N DataFrame with denormalized features.
   """
-  native_cols = []
-  for column in get_column_order(normalization_info):
-    if normalization_info[column].std == 0.0:
-      native_column_series = pd.Series(
-          normalization_info[column].mean, name=column, index=df_norm.index
-      )
-    else:
-      native_values = (
-          df_norm[column] * normalization_info[column].std
-          + normalization_info[column].mean
-      )
-      native_column_series = pd.Series(
-          native_values, name=column, index=df_norm.index
-      )
-
-    native_cols.append(native_column_series)
-  return pd.concat(native_cols, axis=1)
+  columns, mean, std = _compile(normalization_info)
+  x = df_norm[columns].to_numpy(dtype=np.float64)
+  constant = std == 0.0
+  native = x * std + mean
+  if constant.any():
+    native[:, constant] = mean[constant]
+  return pd.DataFrame(native, index=df_norm.index, columns=columns, copy=False)
 
 
 def write_normalization_info(normalization_info: Dict[str, Variable],
@@ -152,7 +217,7 @@ def read_normalization_info(
   import tensorflow as tf  # deferred: only needed for GCS/gfile paths
 
   def from_df(df):
-    normalization_info = {}
+    normalization_info = NormalizationInfo()
     for name, row in df.iterrows():
       normalization_info[name] = Variable(
           row["index"], name, row["mean"], row["std"])
@@ -167,10 +232,25 @@ def read_normalization_info(
   return normalization_info
 
 
+def _as_generator(rng: RandomState) -> np.random.Generator:
+  """Returns a Generator for rng (Generator, int seed or None).
+
+  With None the seed is drawn from the legacy global np.random state, so
+  callers that reproduce runs with np.random.seed() keep doing so.
+  """
+  if isinstance(rng, np.random.Generator):
+    return rng
+  if rng is None:
+    rng = np.random.randint(0, 2**32 - 1, dtype=np.int64)
+  return np.random.default_rng(rng)
+
+
 def get_neg_sample(pos_sample: pd.DataFrame,
                    n_points: int,
                    do_permute: bool = False,
-                   delta: float = 0.0) -> pd.DataFrame:
+                   delta: float = 0.0,
+                   rng: RandomState = None,
+                   as_array: bool = False) -> Union[pd.DataFrame, np.ndarray]:
   """Creates a negative sample from the cuboid bounded by +/- delta.
 
   Where, [min - delta, max + delta] for each of the dimensions.
@@ -180,63 +260,70 @@ def get_neg_sample(pos_sample: pd.DataFrame,
   labeled 'class_label' where 1.0 indicates Normal, and
   0.0 indicates anomalous.
 
+  All dimensions are drawn at once on a contiguous array: one uniform draw
+  over the (n_points x d) cuboid, or one row resample followed by a single
+  per-column permutation.
+
   Args:
     pos_sample: DF with numeric dimensions
     n_points: number points to be returned
     do_permute: permute or sample
     delta: fraction of [max - min] to extend the sampling.
+    rng: np.random.Generator or seed; None derives one from np.random.
+    as_array: return a float32 (n_points x d) array of the feature columns
+      (in pos_sample order, without 'class_label') instead of a DataFrame.
 
   Returns:
     A dataframe  with the same number of columns, and a label column
-    'class_label' where every point is 0.
+    'class_label' where every point is 0; or the float32 feature array.
   """
-  df_neg = pd.DataFrame()
-
-  pos_sample_n = pos_sample.sample(n=n_points, replace=True)
-
-  for field_name in list(pos_sample):
-
-    if field_name == "class_label":
-      continue
+  rng = _as_generator(rng)
+  columns = [c for c in pos_sample.columns if c != "class_label"]
+  values = np.ascontiguousarray(pos_sample[columns].to_numpy(dtype=np.float64))
 
-    if do_permute:
-      df_neg[field_name] = np.random.permutation(
-          np.array(pos_sample_n[field_name]))
-
-    else:
-      low_val = min(pos_sample[field_name])
-      high_val = max(pos_sample[field_name])
-      delta_val = high_val - low_val
-      df_neg[field_name] = np.random.uniform(
-          low=low_val - delta * delta_val,
-          high=high_val + delta * delta_val,
-          size=n_points)
-
-  df_neg["class_label"] = [0 for _ in range(n_points)]
+  if do_permute:
+    rows = values[rng.integers(0, len(values), size=n_points)]
+    neg = rng.permuted(rows, axis=0)
+  else:
+    low_val = values.min(axis=0)
+    high_val = values.max(axis=0)
+    delta_val = high_val - low_val
+    neg = rng.uniform(low=low_val - delta * delta_val,
+                      high=high_val + delta * delta_val,
+                      size=(n_points, len(columns)))
+
+  if as_array:
+    return neg.astype(np.float32)
+
+  df_neg = pd.DataFrame(neg, columns=columns, copy=False)
+  df_neg["class_label"] = np.zeros(n_points, dtype=np.int64)
   return df_neg
 
 
 def apply_negative_sample(positive_sample: pd.DataFrame, sample_ratio: float,
-                          sample_delta: float) -> pd.DataFrame:
+                          sample_delta: float,
+                          rng: RandomState = None) -> pd.DataFrame:
   """Returns a dataset with negative and positive sample.
 
   Args:
     positive_sample: actual, observed sample where each col is a feature.
     sample_ratio: the desired ratio of negative to positive points
     sample_delta: the extension beyond observed limits to bound the neg sample
+    rng: np.random.Generator or seed; None derives one from np.random.
 
   Returns:
     DataFrame with features + class label, with 1 being observed and 0 negative.
   """
-
+  rng = _as_generator(rng)
   positive_sample["class_label"] = 1
   n_neg_points = int(len(positive_sample) * sample_ratio)
   negative_sample = get_neg_sample(
-      positive_sample, n_neg_points, do_permute=False, delta=sample_delta)
+      positive_sample, n_neg_points, do_permute=False, delta=sample_delta,
+      rng=rng)
   training_sample = pd.concat([positive_sample, negative_sample],
                               ignore_index=True,
                               sort=True)
-  return training_sample.reindex(np.random.permutation(training_sample.index))
+  return training_sample.reindex(rng.permutation(training_sample.index))
 
 
 def get_pos_sample(df_input: pd.DataFrame, n_points: int) -> pd.DataFrame:
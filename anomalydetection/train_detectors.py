@@ -110,7 +110,7 @@ def main():
         # --- Generate and save negative-sampled dataset ---
         print(f"  Generating negative-sampled dataset (ratio=2.0, delta=0.05)…")
         neg_sampled = sample_utils.apply_negative_sample(
-            x_train.copy(), sample_ratio=2.0, sample_delta=0.05
+            x_train.copy(), sample_ratio=2.0, sample_delta=0.05, rng=RANDOM_SEED
         )
         out_path = os.path.join(OUTPUT_DIR, f"node_{node_id}_negative_sampled.csv")
         neg_sampled.to_csv(out_path, index=False)
@@ -0,0 +1,144 @@
+"""
+baseline_deviation.py — z-scores of the latest readings against the baselines.
+
+Each sensor's 168 Baselines buckets are cached per process as two 7×24
+arrays (mean, std), indexed [day_of_week - 1, hour] with MongoDB's
+day_of_week numbering (1 = Sunday).  A gateway's arrays are loaded with one
+Baselines query and stacked into (sensors, 7, 24) blocks, so scoring the
+gateway's SensorsLatest readings is one query plus one vectorized pass:
+
+  z = (value - mean[sensor, dow, hour]) / std[sensor, dow, hour]
+
+with dow and hour local to the baseline's timezone.  Buckets without a
+baseline, or with std 0, give z = None.
+
+A cached gateway is valid while its BaselinesVersion (bumped by every
+baselines.py write) is unchanged, so each request costs one find_one for the
+version; a recompute served by any worker is seen by all of them.  Entries
+are also reloaded after _CACHE_TTL seconds, for writes made outside
+baselines.py, or when invalidate() is called.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import baselines as _bl
+import sensor_common as _sc
+
+logger = logging.getLogger(__name__)
+
+_CACHE_TTL = 3600                  # seconds before a gateway's baselines are reloaded
+_CACHE_SIZE = 4096                 # (gateway, timezone) entries kept per process
+DEFAULT_THRESHOLD = 3.0            # |z| at or above which a reading deviates
+
+
+class _GatewayBaselines:
+    """Stacked baseline arrays of one gateway in one timezone."""
+
+    def __init__(self, docs: List[dict], loaded_at: float, version: int = 0):
+        self.loaded_at = loaded_at
+        self.version = version
+        sensors = sorted({(str(d['node_id']), d['type']) for d in docs})
+        self.index: Dict[Tuple[str, str], int] = {s: i for i, s in enumerate(sensors)}
+        self.mean = np.full((len(sensors), 7, 24), np.nan)
+        self.std = np.full((len(sensors), 7, 24), np.nan)
+        if not docs:
+            return
+        df = pd.DataFrame(docs)
+        rows = np.array([self.index[(str(n), t)] for n, t in zip(df['node_id'], df['type'])])
+        dows = df['day_of_week'].to_numpy(dtype=int) - 1
+        hours = df['hour'].to_numpy(dtype=int)
+        self.mean[rows, dows, hours] = pd.to_numeric(df['mean'], errors='coerce')
+        self.std[rows, dows, hours] = pd.to_numeric(df['std'], errors='coerce')
+
+    def sensor(self, node_id: str, sensor_type: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(mean, std) 7×24 arrays of one sensor, or None without a baseline."""
+        i = self.index.get((str(node_id), sensor_type))
+        return None if i is None else (self.mean[i], self.std[i])
+
+
+_cache: 'OrderedDict[tuple, _GatewayBaselines]' = OrderedDict()
+
+
+def invalidate(gateway_id: Optional[str] = None) -> None:
+    """Drop cached baselines of one gateway (all timezones), or of every gateway."""
+    for key in [k for k in _cache if gateway_id is None or k[0] == gateway_id]:
+        del _cache[key]
+
+
+def gateway_baselines(db, gateway_id: str, tz: str = _bl.DEFAULT_TZ,
+                      now: Optional[float] = None) -> _GatewayBaselines:
+    """Cached baseline arrays of every sensor of a gateway (one query when stale)."""
+    now = time.time() if now is None else now
+    key = (gateway_id, tz)
+    version = _bl.baselines_version(db, gateway_id)
+    cached = _cache.get(key)
+    if (cached is not None and cached.version == version
+            and now - cached.loaded_at < _CACHE_TTL):
+        _cache.move_to_end(key)
+        return cached
+    docs = list(db[_sc.BASELINES_COLLECTION].find(
+        {'gateway_id': gateway_id, 'tz': _bl.tz_query(tz)},
+        {'_id': 0, 'node_id': 1, 'type': 1, 'day_of_week': 1, 'hour': 1,
+         'mean': 1, 'std': 1}))
+    cached = _cache[key] = _GatewayBaselines(docs, now, version)
+    _cache.move_to_end(key)
+    if len(_cache) > _CACHE_SIZE:
+        _cache.popitem(last=False)
+    logger.debug('Loaded %d baseline bucket(s) for %s (%s)', len(docs), gateway_id, tz)
+    return cached
+
+
+def _round(values: np.ndarray, digits: int) -> List[Optional[float]]:
+    return [None if np.isnan(v) else round(float(v), digits) for v in values]
+
+
+def gateway_deviations(db, gateway_id: str, types: Optional[List[str]] = None,
+                       tz: str = _bl.DEFAULT_TZ, threshold: float = DEFAULT_THRESHOLD,
+                       now: Optional[float] = None) -> List[dict]:
+    """z-scores of a gateway's latest readings against their baselines.
+
+    Returns one {node_id, type, value, time, hour, day_of_week, mean, std, z,
+    deviating} per SensorsLatest reading of a sensor with a baseline, sorted
+    by descending |z|.
+    """
+    cached = gateway_baselines(db, gateway_id, tz, now)
+    if not cached.index:
+        return []
+    query = {'gateway_id': gateway_id}
+    if types:
+        query['type'] = {'$in': list(types)}
+    latest = pd.DataFrame(list(db.SensorsLatest.find(
+        query, {'_id': 0, 'node_id': 1, 'type': 1, 'value': 1, 'time': 1})),
+        columns=['node_id', 'type', 'value', 'time'])
+    if latest.empty:
+        return []
+    latest['node_id'] = latest['node_id'].astype(str)
+    rows = np.array([cached.index.get(s, -1) for s in zip(latest['node_id'], latest['type'])])
+    latest = latest[rows >= 0]
+    rows = rows[rows >= 0]
+    if latest.empty:
+        return []
+
+    values = _sc.clean_values(latest['value'])
+    when = _bl.local_dates(latest['time'], tz)
+    dows = ((when.dt.dayofweek.to_numpy() + 1) % 7)      # 0 = Sunday
+    hours = when.dt.hour.to_numpy()
+    mean = cached.mean[rows, dows, hours]
+    std = cached.std[rows, dows, hours]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(std > 0, (values - mean) / std, np.nan)
+
+    results = [{'node_id': node, 'type': sensor_type, 'value': v, 'time': float(t),
+                'hour': int(h), 'day_of_week': int(d) + 1, 'mean': m, 'std': s, 'z': zz,
+                'deviating': zz is not None and abs(zz) >= threshold}
+               for node, sensor_type, v, t, h, d, m, s, zz in zip(
+                   latest['node_id'], latest['type'], _round(values, 3), latest['time'],
+                   hours, dows, _round(mean, 3), _round(std, 3), _round(z, 2))]
+    results.sort(key=lambda r: (r['z'] is None, -abs(r['z'] or 0)))
+    return results
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+baseline_job.py — Nightly fleet-wide baseline update.
+
+Updates the (hour, day_of_week) baselines of every sensor on every gateway
+whose owner enabled baselines in AnalyticsSettings (or the gateways given
+with --gateways), using baselines.update_fleet_baselines: one $group pass
+over Sensors per partition of gateways for the days not yet folded in,
+results written with batched bulk upserts.  Prints a throughput report.
+
+Usage:
+  pipenv run python3 baseline_job.py -d PROD [--days 30] [--types F,H]
+  pipenv run python3 baseline_job.py -d TEST --gateways GW1,GW2
+
+Options:
+  -d / --db              Database alias: PROD or TEST  (required)
+  -n / --days            Baseline window in days  (default: 30)
+  -t / --types           Comma-separated sensor types  (default: F)
+  -g / --gateways        Comma-separated gateway ids  (default: all baseline-enabled)
+  -z / --timezone        IANA timezone for hours and days  (default: UTC)
+  -p / --partition-size  Gateways per aggregation pass  (default: 50)
+  -b / --batch-size      Operations per bulk_write  (default: 1000)
+  -h                     Show this help
+"""
+
+import getopt
+import json
+import os
+import sys
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+import baselines as _bl
+
+DB_MAP = {
+    'PROD': 'gdtechdb_prod',
+    'TEST': 'gdtechdb_test',
+}
+
+
+def printhelp():
+    print(__doc__)
+
+
+def main(argv):
+    db_alias = ''
+    days = 30
+    types = ['F']
+    gateways = None
+    tz = _bl.DEFAULT_TZ
+    partition_size = 50
+    batch_size = 1000
+
+    try:
+        opts, _ = getopt.getopt(argv, 'hd:n:t:g:z:p:b:',
+                                ['db=', 'days=', 'types=', 'gateways=', 'timezone=',
+                                 'partition-size=', 'batch-size='])
+    except getopt.GetoptError as e:
+        print(f'Error: {e}')
+        printhelp()
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            printhelp()
+            sys.exit(0)
+        elif opt in ('-d', '--db'):
+            db_alias = arg.upper()
+        elif opt in ('-n', '--days'):
+            days = int(arg)
+        elif opt in ('-t', '--types'):
+            types = [t for t in arg.split(',') if t]
+        elif opt in ('-g', '--gateways'):
+            gateways = [gw for gw in arg.split(',') if gw]
+        elif opt in ('-z', '--timezone'):
+            tz = arg
+        elif opt in ('-p', '--partition-size'):
+            partition_size = int(arg)
+        elif opt in ('-b', '--batch-size'):
+            batch_size = int(arg)
+
+    if db_alias not in DB_MAP:
+        print(f'Error: --db must be one of {list(DB_MAP.keys())}')
+        printhelp()
+        sys.exit(1)
+    if _bl.resolve_timezone(tz) is None:
+        print(f'Error: unknown timezone {tz!r}')
+        sys.exit(1)
+
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGODB_HOST', 'localhost'), 27017)
+    db = client[DB_MAP[db_alias]]
+
+    if gateways is None:
+        gateways = _bl.baseline_enabled_gateways(db)
+    print(f'[baseline] {len(gateways)} gateway(s), types={",".join(types)}, days={days}, tz={tz}')
+    report = _bl.update_fleet_baselines(db, gateways, types, days, partition_size=partition_size,
+                                        batch_size=batch_size, tz=tz)
+    print(f'[baseline] {report["sensors"]} sensor(s) ({report["rebuilt"]} rebuilt), '
+          f'{report["readings"]} reading(s) in {report["seconds"]:.1f}s — '
+          f'{report["sensors_per_second"]:.1f} sensors/s, '
+          f'{report["readings_per_second"]:.0f} readings/s, '
+          f'{report["write_ops"]} write(s) in {report["bulk_writes"]} bulk_write(s)')
+    print(json.dumps(report))
+
+    client.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,486 @@
+"""
+baselines.py — Incremental (hour, day_of_week) baselines per sensor.
+
+A baseline is the mean and sample standard deviation of a sensor's readings
+in each of the 168 (hour, day_of_week) buckets over the last `days` days.
+Instead of re-aggregating the whole window on every run, each day is
+reduced once to mergeable sufficient statistics — count, sum and sum of
+squares per hour — stored in BaselineDays:
+
+  {gateway_id, node_id, type, tz, day, complete, count: [24], sum: [24], sumsq: [24]}
+
+Days and hours are local to the IANA timezone tz (default UTC): readings are
+bucketed on the server with the timezone-aware $dateToString / $hour, and
+day is the Unix time of local midnight.  Documents written before tz was
+stored are UTC and are adopted as such on the next UTC update.
+
+The Baselines bucket documents keep the totals of the days in the window
+alongside the derived mean/std.  An update aggregates only the days that are
+new (or were still in progress at the last run) and re-sums the buckets from
+the window's day statistics, which it has already read, so a nightly run
+costs time proportional to one day of readings.  Baselines is derived from
+BaselineDays and written after it; buckets whose stored totals disagree with
+their days are rewritten, so a run interrupted between the two writes is
+repaired by the next one instead of counting its days twice.  All bucket
+writes go out as one bulk_write.
+
+update_fleet_baselines applies the same merge to every sensor of many
+gateways at once: one $group pass per partition of gateways for the new
+days (plus one for sensors that need their whole window), with the writes
+batched into bulk upserts.  baseline_job.py runs it nightly.
+
+Every write to a gateway's Baselines bumps its BaselinesVersion document
+({_id: gateway_id, version}), so per-process caches of the buckets
+(baseline_deviation.py) can check freshness with one find_one.
+"""
+
+import datetime as dt
+import itertools
+import logging
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from dateutil.tz import gettz
+from pymongo import DeleteMany, DeleteOne, UpdateOne
+from pymongo.errors import OperationFailure
+
+import sensor_common as _sc
+
+logger = logging.getLogger(__name__)
+
+_DAYS_COLLECTION = 'BaselineDays'
+_VERSION_COLLECTION = 'BaselinesVersion'
+_DAY = 86400
+_SENSOR_KEYS = ('gateway_id', 'node_id', 'type')
+DEFAULT_TZ = 'UTC'
+
+# Reading time as a BSON date, for the timezone-aware date operators
+_TIME_AS_DATE = {'$toDate': {'$multiply': [{'$toDouble': '$time'}, 1000]}}
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def resolve_timezone(name: Optional[str]) -> Optional[str]:
+    """The IANA timezone name if it is known (None/'' mean UTC), else None."""
+    if not name:
+        return DEFAULT_TZ
+    return name if gettz(name) is not None else None
+
+
+def tz_query(tz: str):
+    """Query value for the tz field; documents without one are UTC."""
+    return {'$in': [tz, None]} if tz == DEFAULT_TZ else tz
+
+
+def local_midnight(date: dt.date, tz: str) -> int:
+    """Unix time of midnight starting the given local date."""
+    return int(dt.datetime(date.year, date.month, date.day, tzinfo=gettz(tz)).timestamp())
+
+
+def local_date(ts: float, tz: str) -> dt.date:
+    return dt.datetime.fromtimestamp(ts, gettz(tz)).date()
+
+
+def local_days(first_day: int, last_day: int, tz: str) -> List[int]:
+    """Local midnights from the date of first_day through the date of last_day."""
+    first, last = local_date(first_day, tz), local_date(last_day, tz)
+    return [local_midnight(first + dt.timedelta(days=i), tz)
+            for i in range((last - first).days + 1)]
+
+
+def local_date_expr(tz: str) -> dict:
+    """Aggregation expression: the reading's local date as 'YYYY-MM-DD'."""
+    return {'$dateToString': {'format': '%Y-%m-%d', 'date': _TIME_AS_DATE, 'timezone': tz}}
+
+
+def local_dates(times: pd.Series, tz: str) -> pd.Series:
+    """Client-side local_date_expr over Unix times (for servers without $convert)."""
+    return pd.to_datetime(times, unit='s', utc=True).dt.tz_convert(tz)
+
+
+def _day_of_week(day: int, tz: str = DEFAULT_TZ) -> int:
+    """MongoDB $dayOfWeek numbering (1 = Sunday … 7 = Saturday) of a local day."""
+    return (local_date(day, tz).weekday() + 1) % 7 + 1
+
+
+def _merge_stats(count: float, total: float, sumsq: float) -> Tuple[float, float]:
+    """(mean, sample std) from sufficient statistics; std is 0.0 below 2 readings."""
+    mean = total / count
+    if count < 2:
+        return mean, 0.0
+    var = (sumsq - count * mean * mean) / (count - 1)
+    return mean, math.sqrt(max(var, 0.0))
+
+
+# ---------------------------------------------------------------------------
+# Daily sufficient statistics
+# ---------------------------------------------------------------------------
+
+def _hourly_stats_pipeline(match: Dict, keys: Sequence[str], tz: str) -> list:
+    """$group parseable readings into (keys…, local date, local hour) with count, sum, sumsq."""
+    value = {'$convert': {
+        'input': {'$cond': [{'$eq': [{'$type': '$value'}, 'string']},
+                            {'$trim': {'input': '$value', 'chars': "b'"}},
+                            '$value']},
+        'to': 'double', 'onError': None, 'onNull': None,
+    }}
+    return [
+        {'$match': match},
+        {'$project': {'_id': 0, **{k: 1 for k in keys}, 'v': value,
+                      'date': local_date_expr(tz),
+                      'slot': {'$hour': {'date': _TIME_AS_DATE, 'timezone': tz}}}},
+        {'$match': {'v': {'$ne': None}}},
+        {'$group': {'_id': {**{k: f'${k}' for k in keys}, 'date': '$date', 'slot': '$slot'},
+                    'count': {'$sum': 1}, 'sum': {'$sum': '$v'},
+                    'sumsq': {'$sum': {'$multiply': ['$v', '$v']}}}},
+    ]
+
+
+def _hourly_stats_streamed(db, match: Dict, keys: Sequence[str], tz: str) -> pd.DataFrame:
+    """Client-side fallback of _hourly_stats_pipeline, folded chunk by chunk."""
+    cursor = db.Sensors.find(match, {'_id': 0, 'value': 1, 'time': 1, **{k: 1 for k in keys}})
+    group_by = [*keys, 'date', 'slot']
+    parts = []
+    while True:
+        chunk = list(itertools.islice(cursor, _sc.CHUNK_ROWS))
+        if not chunk:
+            break
+        df = pd.DataFrame(chunk)
+        v = _sc.clean_values(df['value'])
+        ok = ~np.isnan(v)
+        when = local_dates(df.loc[ok, 'time'], tz)
+        part = df.loc[ok, list(keys)].assign(
+            date=when.dt.strftime('%Y-%m-%d'), slot=when.dt.hour,
+            count=1, sum=v[ok], sumsq=v[ok] ** 2)
+        parts.append(part.groupby(group_by, as_index=False).sum())
+    if not parts:
+        return pd.DataFrame(columns=[*group_by, 'count', 'sum', 'sumsq'])
+    return pd.concat(parts).groupby(group_by, as_index=False).sum()
+
+
+def _hourly_stats(db, match: Dict, keys: Sequence[str] = (),
+                  tz: str = DEFAULT_TZ) -> pd.DataFrame:
+    """Local-hour statistics (keys…, date, slot, count, sum, sumsq), on the server when possible."""
+    try:
+        rows = list(db.Sensors.aggregate(_hourly_stats_pipeline(match, keys, tz),
+                                         allowDiskUse=True))
+    except (OperationFailure, NotImplementedError) as exc:
+        logger.debug('Baseline aggregation unavailable (%s); folding client-side', exc)
+        return _hourly_stats_streamed(db, match, keys, tz)
+    if not rows:
+        return pd.DataFrame(columns=[*keys, 'date', 'slot', 'count', 'sum', 'sumsq'])
+    return pd.DataFrame([{**row.pop('_id'), **row} for row in rows])
+
+
+def _day_stats(hourly: pd.DataFrame, days: List[int], tz: str) -> Dict[int, dict]:
+    """Per-day 24-slot statistics for each local midnight in days.
+
+    Days without readings get all-zero slots so they are not re-aggregated on
+    the next run.  The repeated hour of a DST fall-back day shares its slot.
+    """
+    index = {local_date(day, tz).isoformat(): i for i, day in enumerate(days)}
+    stats = np.zeros((3, len(days), 24))
+    if len(hourly):
+        day_idx = hourly['date'].map(index)
+        ok = day_idx.notna().to_numpy()
+        rows = (day_idx[ok].to_numpy(dtype=int), hourly['slot'].to_numpy(dtype=int)[ok])
+        for i, col in enumerate(('count', 'sum', 'sumsq')):
+            np.add.at(stats[i], rows, hourly[col].to_numpy(dtype=np.float64)[ok])
+    return {day: {'count': stats[0, i].astype(int).tolist(),
+                  'sum': stats[1, i].tolist(),
+                  'sumsq': stats[2, i].tolist()}
+            for i, day in enumerate(days)}
+
+
+# ---------------------------------------------------------------------------
+# Incremental update
+# ---------------------------------------------------------------------------
+
+class _SensorState:
+    """Stored BaselineDays / Baselines of one sensor and what a run must do.
+
+    rebuild — the stored totals cannot be merged (window length changed, or
+              buckets predate the stored sums): start from an empty window.
+    start   — first day to aggregate: the first day in the window missing
+              from BaselineDays or stored while still in progress.
+    aged    — stored days that fell out of the window.
+    """
+
+    def __init__(self, sensor: Dict, tz: str, days: int, window: List[int],
+                 stored: Optional[Dict[int, dict]] = None,
+                 buckets: Optional[Dict[Tuple[int, int], dict]] = None):
+        self.sensor = sensor
+        self.tz = tz
+        self.key = {**sensor, 'tz': tz}
+        self.stored = stored or {}
+        self.buckets = buckets or {}
+        self.rebuild = bool(self.stored) != bool(self.buckets) or any(
+            doc.get('window_days') != days or 'sum' not in doc for doc in self.buckets.values())
+        self.in_window = {} if self.rebuild else {
+            d: doc for d, doc in self.stored.items() if d >= window[0]}
+        self.fresh_days = window[next((i for i, d in enumerate(window)
+                                       if not self.in_window.get(d, {}).get('complete')),
+                                      len(window) - 1):]
+        self.start = self.fresh_days[0]
+        self.aged = [d for d in self.stored if d < window[0]]
+
+    def ops(self, fresh: Dict[int, dict], days: int, today: int,
+            computed_at: int) -> Tuple[list, list, int]:
+        """(Baselines ops, BaselineDays ops, resulting bucket count) for the fresh days.
+
+        Bucket totals are re-summed from the window's day statistics (fresh
+        days replacing their stored versions), never added to the stored
+        totals.  Buckets of the days that changed are written, and so is any
+        other bucket whose stored totals disagree with its days.
+        """
+        totals: Dict[Tuple[int, int], np.ndarray] = {}
+        for day, stats in {**self.in_window, **fresh}.items():
+            dow = _day_of_week(day, self.tz)
+            for hour in range(24):
+                if stats['count'][hour]:
+                    total = totals.setdefault((hour, dow), np.zeros(3))
+                    total += np.array([stats['count'][hour], stats['sum'][hour],
+                                       stats['sumsq'][hour]], dtype=np.float64)
+        changed = {_day_of_week(day, self.tz)
+                   for day in itertools.chain(fresh, [] if self.rebuild else self.aged)}
+
+        bucket_ops = []
+        for key in sorted(set(self.buckets) | set(totals)):
+            doc = self.buckets.get(key)
+            total = totals.get(key, np.zeros(3))
+            hour, dow = key
+            if not (self.rebuild or dow in changed or doc is None or not np.allclose(
+                    [doc['count'], doc['sum'], doc['sumsq']], total, rtol=1e-9)):
+                continue
+            bucket = {**self.key, 'hour': hour, 'day_of_week': dow}
+            if total[0] < 0.5:
+                if doc is not None:
+                    bucket_ops.append(DeleteOne(bucket))
+                continue
+            mean, std = _merge_stats(*total)
+            bucket_ops.append(UpdateOne(bucket, {'$set': {
+                'mean': mean, 'std': std, 'count': int(round(total[0])),
+                'sum': float(total[1]), 'sumsq': float(total[2]),
+                'window_days': days, 'computed_at': computed_at,
+            }}, upsert=True))
+
+        day_ops = [UpdateOne({**self.key, 'day': day},
+                             {'$set': {**stats, 'complete': day < today}}, upsert=True)
+                   for day, stats in fresh.items()]
+        stale = [d for d in (self.stored if self.rebuild else self.aged) if d not in fresh]
+        if stale:
+            day_ops.append(DeleteMany({**self.key, 'day': {'$in': stale}}))
+        return bucket_ops, day_ops, sum(1 for total in totals.values() if total[0] >= 0.5)
+
+
+def _window(days: int, now: Optional[float], tz: str) -> Tuple[float, int, List[int]]:
+    """(now, today, window): local midnights of the last `days` whole days plus today."""
+    now = time.time() if now is None else now
+    today = local_date(now, tz)
+    window = [local_midnight(today - dt.timedelta(days=i), tz) for i in range(days, -1, -1)]
+    return now, window[-1], window
+
+
+def _adopt_legacy_utc(db, scope: Dict, docs: Iterable[dict]) -> None:
+    """Stamp tz='UTC' on documents written before tz was stored, so upserts match them."""
+    if any('tz' not in doc for doc in docs):
+        for name in (_DAYS_COLLECTION, _sc.BASELINES_COLLECTION):
+            db[name].update_many({**scope, 'tz': None}, {'$set': {'tz': DEFAULT_TZ}})
+
+
+def bump_baselines_version(db, gateway_ids: Iterable[str]) -> None:
+    """Mark the gateways' Baselines as changed; caches reload them on their next read."""
+    ops = [UpdateOne({'_id': gw}, {'$inc': {'version': 1}}, upsert=True)
+           for gw in sorted(set(gateway_ids))]
+    if ops:
+        db[_VERSION_COLLECTION].bulk_write(ops, ordered=False)
+
+
+def baselines_version(db, gateway_id: str) -> int:
+    """Current BaselinesVersion of a gateway (0 if its baselines were never written)."""
+    doc = db[_VERSION_COLLECTION].find_one({'_id': gateway_id}, {'version': 1})
+    return doc['version'] if doc else 0
+
+
+def update_baseline(db, gateway_id: str, node_id: str, sensor_type: str = 'F',
+                    days: int = 30, now: Optional[float] = None, tz: str = DEFAULT_TZ) -> dict:
+    """Bring one sensor's Baselines up to date; return a summary of the run.
+
+    The window is the last `days` whole local days plus the current one.  Only
+    days missing from BaselineDays (and the previously incomplete day) are
+    aggregated, and the buckets are re-summed from the window's days; days
+    that fell out of the window are deleted.  A change of `days`, or buckets
+    written before daily statistics existed, triggers a rebuild of the whole
+    window.
+
+    Returns {'bucket_count', 'computed_at', 'days_aggregated', 'days_aged_out',
+    'rebuilt', 'tz'}.
+    """
+    now, today, window = _window(days, now, tz)
+    sensor = {'gateway_id': gateway_id, 'node_id': node_id, 'type': sensor_type}
+    scope = {**sensor, 'tz': tz_query(tz)}
+    stored = list(db[_DAYS_COLLECTION].find(scope, {'_id': 0, 'day': 1, 'tz': 1, 'complete': 1,
+                                                    'count': 1, 'sum': 1, 'sumsq': 1}))
+    buckets = list(db[_sc.BASELINES_COLLECTION].find(scope, {'_id': 0}))
+    _adopt_legacy_utc(db, sensor, stored + buckets)
+    state = _SensorState(sensor, tz, days, window,
+                         {doc['day']: doc for doc in stored},
+                         {(doc['hour'], doc['day_of_week']): doc for doc in buckets})
+
+    hourly = _hourly_stats(db, {**sensor, 'time': {'$gte': state.start, '$lt': now}}, tz=tz)
+    fresh = _day_stats(hourly, state.fresh_days, tz)
+    bucket_ops, day_ops, bucket_count = state.ops(fresh, days, today, int(now))
+    if day_ops:
+        db[_DAYS_COLLECTION].bulk_write(day_ops, ordered=False)
+    if bucket_ops:
+        db[_sc.BASELINES_COLLECTION].bulk_write(bucket_ops, ordered=False)
+        bump_baselines_version(db, [gateway_id])
+
+    logger.info('Baseline %s/%s/%s (%s): %d day(s) aggregated, %d aged out, %d buckets%s',
+                gateway_id, node_id, sensor_type, tz, len(fresh), len(state.aged),
+                bucket_count, ' (rebuilt)' if state.rebuild else '')
+    return {'bucket_count': bucket_count, 'computed_at': int(now),
+            'days_aggregated': len(fresh), 'days_aged_out': len(state.aged),
+            'rebuilt': state.rebuild, 'tz': tz}
+
+
+# ---------------------------------------------------------------------------
+# Fleet-wide update
+# ---------------------------------------------------------------------------
+
+def baseline_enabled_gateways(db) -> List[str]:
+    """Gateway ids of every user whose AnalyticsSettings enable baselines."""
+    emails = [doc['email'] for doc in db.AnalyticsSettings.find(
+        {'baseline_enabled': True}, {'_id': 0, 'email': 1})]
+    if not emails:
+        return []
+    gateways = set()
+    for doc in db.UserProfiles.find({'email': {'$in': emails}}, {'_id': 0, 'gateway_ids': 1}):
+        gateways.update(doc.get('gateway_ids') or [])
+    return sorted(gateways)
+
+
+class _BulkWriter:
+    """Buffer write ops per collection and flush them in unordered batches."""
+
+    def __init__(self, db, batch_size: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.pending: Dict[str, list] = {}
+        self.batches = 0
+        self.ops = 0
+
+    def add(self, collection: str, ops: list) -> None:
+        buf = self.pending.setdefault(collection, [])
+        buf.extend(ops)
+        if len(buf) >= self.batch_size:
+            self.flush(collection)
+
+    def flush(self, collection: Optional[str] = None) -> None:
+        for name in ([collection] if collection else list(self.pending)):
+            buf = self.pending.pop(name, [])
+            if buf:
+                self.db[name].bulk_write(buf, ordered=False)
+                self.batches += 1
+                self.ops += len(buf)
+
+
+def _load_states(db, gateway_ids: List[str], types: Sequence[str], tz: str, days: int,
+                 window: List[int]) -> Dict[Tuple[str, str, str], _SensorState]:
+    """_SensorState for every sensor of the gateways with stored baseline data."""
+    sensors = {'gateway_id': {'$in': gateway_ids}, 'type': {'$in': list(types)}}
+    scope = {**sensors, 'tz': tz_query(tz)}
+    day_docs = list(db[_DAYS_COLLECTION].find(scope, {'_id': 0}))
+    bucket_docs = list(db[_sc.BASELINES_COLLECTION].find(scope, {'_id': 0}))
+    _adopt_legacy_utc(db, sensors, day_docs + bucket_docs)
+    stored: Dict[tuple, dict] = {}
+    for doc in day_docs:
+        stored.setdefault(tuple(doc[k] for k in _SENSOR_KEYS), {})[doc['day']] = doc
+    buckets: Dict[tuple, dict] = {}
+    for doc in bucket_docs:
+        key = tuple(doc[k] for k in _SENSOR_KEYS)
+        buckets.setdefault(key, {})[(doc['hour'], doc['day_of_week'])] = doc
+    return {key: _SensorState(dict(zip(_SENSOR_KEYS, key)), tz, days, window,
+                              stored.get(key), buckets.get(key))
+            for key in set(stored) | set(buckets)}
+
+
+def update_fleet_baselines(db, gateway_ids: Iterable[str], types: Sequence[str] = ('F',),
+                           days: int = 30, now: Optional[float] = None,
+                           partition_size: int = 50, batch_size: int = 1000,
+                           tz: str = DEFAULT_TZ) -> dict:
+    """Update the baselines of every sensor of the given gateways.
+
+    Gateways are processed in partitions of partition_size.  Per partition,
+    the stored state of all its sensors is read with one query per
+    collection, the days every sensor still needs are aggregated with one
+    $group over Sensors (keyed by gateway, node, type, local date and hour
+    in tz), and a second
+    pass reads the rest of the window only for sensors that are new or must
+    be rebuilt.  Writes are buffered and sent as unordered bulk_writes of up
+    to batch_size operations.
+
+    Returns a throughput report: sensors, rebuilt, hourly_rows, readings,
+    buckets, bulk_writes, write_ops, seconds, sensors_per_second and
+    readings_per_second.
+    """
+    started = time.perf_counter()
+    now, today, window = _window(days, now, tz)
+    window_start = window[0]
+    gateway_ids = sorted(set(gateway_ids))
+    writer = _BulkWriter(db, batch_size)
+    report = {'gateways': len(gateway_ids), 'tz': tz, 'sensors': 0, 'rebuilt': 0,
+              'hourly_rows': 0, 'readings': 0, 'buckets': 0}
+    base = {'type': {'$in': list(types)}, 'node_id': {'$ne': _sc.NOAA_NODE_ID}}
+    changed = set()
+
+    for i in range(0, len(gateway_ids), partition_size):
+        partition = gateway_ids[i:i + partition_size]
+        states = _load_states(db, partition, types, tz, days, window)
+        incremental = [s.start for s in states.values() if not s.rebuild]
+        pass_start = min(incremental) if incremental else window_start
+
+        hourly = _hourly_stats(db, {**base, 'gateway_id': {'$in': partition},
+                                    'time': {'$gte': pass_start, '$lt': now}}, _SENSOR_KEYS, tz)
+        frames = {key: rows for key, rows in hourly.groupby(list(_SENSOR_KEYS))} if len(hourly) else {}
+        for key in frames:
+            if key not in states:
+                states[key] = _SensorState(dict(zip(_SENSOR_KEYS, key)), tz, days, window)
+
+        early = [s.sensor for s in states.values() if s.start < pass_start]
+        if early:
+            older = _hourly_stats(db, {'$or': early, 'time': {'$gte': window_start,
+                                                               '$lt': pass_start}}, _SENSOR_KEYS, tz)
+            for key, rows in (older.groupby(list(_SENSOR_KEYS)) if len(older) else ()):
+                frames[key] = pd.concat([rows, frames[key]]) if key in frames else rows
+
+        empty = hourly.iloc[:0]
+        for key, state in states.items():
+            rows = frames.get(key, empty)
+            fresh = _day_stats(rows, state.fresh_days, tz)
+            bucket_ops, day_ops, bucket_count = state.ops(fresh, days, today, int(now))
+            writer.add(_DAYS_COLLECTION, day_ops)
+            writer.add(_sc.BASELINES_COLLECTION, bucket_ops)
+            if bucket_ops:
+                changed.add(state.sensor['gateway_id'])
+            report['sensors'] += 1
+            report['rebuilt'] += state.rebuild
+            report['hourly_rows'] += len(rows)
+            report['readings'] += int(rows['count'].sum()) if len(rows) else 0
+            report['buckets'] += bucket_count
+    writer.flush(_DAYS_COLLECTION)
+    writer.flush()
+    bump_baselines_version(db, changed)
+
+    seconds = time.perf_counter() - started
+    report.update(bulk_writes=writer.batches, write_ops=writer.ops, seconds=round(seconds, 3),
+                  sensors_per_second=round(report['sensors'] / max(seconds, 1e-9), 1),
+                  readings_per_second=round(report['readings'] / max(seconds, 1e-9), 1))
+    logger.info('Fleet baselines: %d sensor(s) on %d gateway(s), %d readings in %.1fs',
+                report['sensors'], report['gateways'], report['readings'], seconds)
+    return report
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+bench_model_share.py — Measure per-worker memory for each model_store layout.
+
+Trains a gateway-sized One-Class SVM and NS-RandomForest detector, saves each
+as a compressed joblib artifact, an uncompressed joblib artifact and a shared
+(sidecar .npy) artifact, then starts --workers fresh interpreters that load
+the same artifact with mmap_mode='r' (like load_cached_model in the gunicorn
+workers), score a batch and report memory while all of them are alive:
+
+  private  growth of the worker's private pages (its own copy of the model)
+  mapped   resident pages of memory-mapped artifact files; these live in the
+           page cache once and are shared by every worker
+  total    workers x private + mapped: what the worker pool really costs
+
+Linux only (reads /proc/self/smaps).
+
+Usage:
+  python3 benchmarks/bench_model_share.py [--workers 4] [--rows 10000] [--nodes 12]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anomaly_training as _at  # noqa: E402
+import model_store  # noqa: E402
+
+LAYOUTS = {
+    'joblib compress=3': {'compress': 3, 'shared': False},
+    'joblib compress=0': {'compress': 0, 'shared': False},
+    'shared .npy':       {'shared': True},
+}
+
+
+def memory_kb(mapped_prefix: str) -> tuple:
+    """(private kB, resident kB of files under mapped_prefix) for this process."""
+    private = mapped = 0
+    in_mapping = False
+    with open('/proc/self/smaps') as f:
+        for line in f:
+            parts = line.split()
+            if not parts[0].endswith(':'):   # mapping header line
+                in_mapping = len(parts) >= 6 and parts[5].startswith(mapped_prefix)
+            elif parts[0] in ('Private_Clean:', 'Private_Dirty:'):
+                private += int(parts[1])
+            elif parts[0] == 'Rss:' and in_mapping:
+                mapped += int(parts[1])
+    return private, mapped
+
+
+def worker(path: str) -> None:
+    """Worker process: load path, score, report memory once told to."""
+    with open(path + '.manifest.json') as f:
+        manifest, columns = json.load(f)
+    x = np.random.default_rng(1).normal(size=(2000, len(columns)))
+    prefix = os.path.dirname(path)
+    private_before, _ = memory_kb(prefix)
+    model = model_store.load_artifact(path, manifest, mmap_mode='r')
+    _at._class_probs(model, x, columns)
+    print('ready', flush=True)
+    sys.stdin.readline()   # measure only once every worker has loaded
+    private_after, mapped = memory_kb(prefix)
+    print(private_after - private_before, mapped, flush=True)
+
+
+def measure(path: str, n_workers: int) -> tuple:
+    """Run n_workers loaders concurrently; return mean (private, mapped) kB."""
+    procs = [subprocess.Popen([sys.executable, __file__, '--worker', path],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True)
+             for _ in range(n_workers)]
+    for p in procs:
+        while p.stdout.readline().strip() != 'ready':
+            pass
+    rows = []
+    for p in procs:
+        p.stdin.write('go\n')
+        p.stdin.flush()
+        rows.append(list(map(int, p.stdout.readline().split())))
+        p.wait()
+    return tuple(np.mean(rows, axis=0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--nodes', type=int, default=12)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args.worker)
+
+    rng = np.random.default_rng(0)
+    columns = [f'{i}_{t}' for i in range(1, args.nodes + 1) for t in ('F', 'H')]
+    df = pd.DataFrame(rng.normal(size=(args.rows, len(columns))), columns=columns)
+    models = {
+        'OneClassSVM': _at.OneClassSVMAd(nu=0.5),
+        'NS-RandomForest': _at.NegativeSamplingRandomForestAd(
+            n_estimators=100, random_state=0,
+            sample_ratio=_at._SAMPLE_RATIO, sample_delta=_at._SAMPLE_DELTA),
+    }
+
+    print(f'{args.workers} workers, {args.rows} rows x {len(columns)} features\n')
+    print(f"{'model':16s} {'layout':18s} {'disk MB':>8s} {'private MB':>10s} "
+          f"{'mapped MB':>9s} {'total MB':>9s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, det in models.items():
+            det.train_model(df)
+            for i, (layout, kwargs) in enumerate(LAYOUTS.items()):
+                path = os.path.join(tmp, f'{name}-{i}.joblib')
+                manifest = model_store.save_artifact(det, path, **kwargs)
+                with open(path + '.manifest.json', 'w') as f:
+                    json.dump([manifest, columns], f)
+                private, mapped = measure(path, args.workers)
+                disk = manifest['size_bytes'] + manifest.get('array_bytes', 0)
+                total = args.workers * private + mapped
+                print(f'{name:16s} {layout:18s} {disk / 2**20:8.1f} {private / 1024:10.1f} '
+                      f'{mapped / 1024:9.1f} {total / 1024:9.1f}')
+
+
+if __name__ == '__main__':
+    main()
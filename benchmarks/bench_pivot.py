@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+bench_pivot.py — Compare the factorized pivot in anomaly_training against pivot_table.
+
+Generates a synthetic long-format gateway history (node_id, type, value, time),
+pivots it with the original pandas path (string '{node_id}_{type}' column +
+pivot_table aggfunc='first') and with anomaly_training._pivot_readings, checks
+the two frames are identical and prints the timings.
+
+Usage:
+  python3 benchmarks/bench_pivot.py [--rows 1000000] [--nodes 20] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anomaly_training as _at  # noqa: E402
+
+BUCKET_SECS = 300
+
+
+def make_readings(n_rows: int, n_nodes: int, seed: int = 42) -> pd.DataFrame:
+    """Random readings spread over 90 days for n_nodes nodes × F/H/P."""
+    rng = np.random.default_rng(seed)
+    nodes = np.array([str(i) for i in range(1, n_nodes + 1)] + [_at._NOAA_NODE_ID])
+    df = pd.DataFrame({
+        'node_id': rng.choice(nodes, n_rows),
+        'type':    rng.choice(np.array(['F', 'H', 'P']), n_rows),
+        'value':   rng.normal(70.0, 5.0, n_rows),
+        'time':    time.time() - rng.uniform(0, 90 * 86400, n_rows),
+    })
+    df['node_id'] = df['node_id'].astype(str)
+    return df
+
+
+def pivot_table_path(df: pd.DataFrame, bucket_secs: int) -> pd.DataFrame:
+    """The original get_gateway_dataframe pivot, kept here as the reference."""
+    df = df.copy()
+    df['bucket'] = (df['time'] // bucket_secs).astype(int) * bucket_secs
+    df['col'] = df['node_id'] + '_' + df['type']
+    pivoted = df.pivot_table(index='bucket', columns='col', values='value', aggfunc='first')
+    pivoted.columns.name = None
+    return pivoted
+
+
+def best_of(fn, repeat: int):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--nodes', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_readings(args.rows, args.nodes)
+    print(f'{args.rows:,} readings, {args.nodes} nodes, {BUCKET_SECS} s buckets')
+
+    t_ref, ref = best_of(lambda: pivot_table_path(df, BUCKET_SECS), args.repeat)
+    t_new, new = best_of(lambda: _at._pivot_readings(df, BUCKET_SECS), args.repeat)
+    pd.testing.assert_frame_equal(ref, new)
+
+    print(f'  pivot_table       : {t_ref * 1000:8.1f} ms')
+    print(f'  _pivot_readings   : {t_new * 1000:8.1f} ms  ({t_ref / t_new:.1f}x)')
+    print(f'  result            : {new.shape[0]:,} buckets × {new.shape[1]} columns (identical)')
+
+
+if __name__ == '__main__':
+    main()
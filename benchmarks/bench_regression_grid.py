@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+bench_regression_grid.py — Compare the raced regression grid against the full
+grid on the bundled sensor export.
+
+Builds the hourly training frame for every F/H sensor in
+anomalydetection/data/gdtechdb_prod.Sensors.csv (the same bucketing as
+regression_training.get_sensor_dataframe; the export has no NOAA rows),
+runs train_regression_for_sensor with race=False and race=True and prints
+the winner, mean CV R² and total CV fit time of each.
+
+Usage:
+  python3 benchmarks/bench_regression_grid.py [--csv PATH] [--jobs 1]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import regression_training as _rt  # noqa: E402
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'anomalydetection', 'data', 'gdtechdb_prod.Sensors.csv')
+
+
+def sensor_frames(csv_path: str):
+    """Yield (node_id, type, hourly frame) per F/H sensor in the export."""
+    raw = pd.read_csv(csv_path)
+    raw['value'] = raw['value'].map(_rt._clean_value)
+    raw = raw.dropna(subset=['value'])
+    raw['hour_bucket'] = (raw['time'] // 3600).astype(int) * 3600
+    for (node_id, sensor_type), rows in raw.groupby(['node_id', 'type']):
+        if sensor_type not in _rt._TYPES_TO_PREDICT:
+            continue
+        df = (rows.groupby('hour_bucket')['value'].mean().reset_index()
+                  .rename(columns={'value': 'sensor_value'}))
+        if len(df) < _rt._MIN_ROWS:
+            continue
+        df['noaa_temp_f'] = float('nan')
+        yield node_id, sensor_type, _rt._add_time_features(df).sort_values('hour_bucket')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=DEFAULT_CSV)
+    parser.add_argument('--jobs', type=int, default=1)
+    args = parser.parse_args()
+    _rt.logger.setLevel(logging.WARNING)
+
+    totals = {False: 0.0, True: 0.0}
+    same = 0
+    print(f"{'sensor':10s} {'rows':>5s}  {'full grid':34s}  {'raced grid':34s}")
+    frames = list(sensor_frames(args.csv))
+    for node_id, sensor_type, df in frames:
+        cells = {}
+        for race in (False, True):
+            t0 = time.perf_counter()
+            pipe, name, params, r2, *_ = _rt.train_regression_for_sensor(
+                df, 0.0, n_jobs=args.jobs, race=race)
+            wall = time.perf_counter() - t0
+            totals[race] += wall
+            cells[race] = (name, params, r2, wall, len(getattr(pipe, 'cv_pruned_', {})))
+        same += cells[False][:2] == cells[True][:2]
+        print(f'{node_id}/{sensor_type:7s} {len(df):5d}  ' + '  '.join(
+            f'{name[:16]:16s} R²={r2:+.3f} {wall:5.1f}s' + (f' -{n}' if n else '   ')
+            for name, _, r2, wall, n in (cells[False], cells[True])))
+
+    print(f'\nsame winner on {same}/{len(frames)} sensors; total '
+          f'{totals[False]:.1f}s full vs {totals[True]:.1f}s raced '
+          f'({totals[False] / max(totals[True], 1e-9):.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+daily_summaries.py — Per-day min/max/avg/count of each sensor for the heatmap.
+
+A year heatmap has one cell per local day, and only the current day's cell
+can still change.  Closed days are therefore summarized once into
+DailySummaries:
+
+  {gateway_id, node_id, type, tz, day, date: 'YYYY-MM-DD', min, max, avg, count}
+
+Days are local to the IANA timezone tz (default UTC) and grouped on the server
+with the timezone-aware $dateToString; day is the Unix time of local
+midnight.  Documents written before tz was stored are UTC.
+
+Every closed day between the sensor's first and last reading is written when
+it is finalized — days without readings as count 0 — so a summary document
+marks the day as done and the next request only has to aggregate the days
+since.  Days outside that range are empty and never stored, so requesting a
+year without data writes nothing.  A day is finalized
+_FINALIZE_GRACE seconds after it ends, to pick up readings that gateways
+upload late; until then it is aggregated live with the current day.
+
+Once every day of a year is finalized the whole response is immutable and is
+kept in a per-process cache.
+"""
+
+import datetime as dt
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+import baselines as _bl
+import sensor_common as _sc
+
+logger = logging.getLogger(__name__)
+
+_COLLECTION = 'DailySummaries'
+_FINALIZE_GRACE = 3600              # seconds after midnight before a day is finalized
+_YEAR_CACHE_SIZE = 1024             # finalized years kept per process
+
+_year_cache: 'OrderedDict[tuple, List[dict]]' = OrderedDict()
+
+
+# ---------------------------------------------------------------------------
+# Aggregation
+# ---------------------------------------------------------------------------
+
+def _daily_pipeline(match: Dict, tz: str) -> list:
+    """$group readings into local dates: all readings counted, parseable ones summarized."""
+    value = {'$convert': {
+        'input': {'$cond': [{'$eq': [{'$type': '$value'}, 'string']},
+                            {'$trim': {'input': '$value', 'chars': "b'"}},
+                            '$value']},
+        'to': 'double', 'onError': None, 'onNull': None,
+    }}
+    return [
+        {'$match': match},
+        {'$project': {'_id': 0, 'v': value, 'date': _bl.local_date_expr(tz)}},
+        {'$group': {'_id': '$date', 'min': {'$min': '$v'}, 'max': {'$max': '$v'},
+                    'avg': {'$avg': '$v'}, 'count': {'$sum': 1}}},
+    ]
+
+
+def _daily_streamed(db, match: Dict, tz: str) -> Dict[str, dict]:
+    """Client-side fallback of _daily_pipeline, folded chunk by chunk."""
+    cursor = db.Sensors.find(match, {'_id': 0, 'value': 1, 'time': 1})
+    parts = []
+    while True:
+        chunk = list(itertools.islice(cursor, _sc.CHUNK_ROWS))
+        if not chunk:
+            break
+        df = pd.DataFrame(chunk)
+        v = _sc.clean_values(df['value'])
+        part = pd.DataFrame({'date': _bl.local_dates(df['time'], tz).dt.strftime('%Y-%m-%d'),
+                             'v': v, 'valid': ~np.isnan(v)})
+        parts.append(part.groupby('date').agg(min=('v', 'min'), max=('v', 'max'),
+                                             sum=('v', 'sum'), valid=('valid', 'sum'),
+                                             count=('v', 'size')))
+    if not parts:
+        return {}
+    merged = pd.concat(parts).groupby(level=0).agg(
+        {'min': 'min', 'max': 'max', 'sum': 'sum', 'valid': 'sum', 'count': 'sum'})
+    return {date: {'min': None if row['valid'] == 0 else float(row['min']),
+                   'max': None if row['valid'] == 0 else float(row['max']),
+                   'avg': None if row['valid'] == 0 else float(row['sum'] / row['valid']),
+                   'count': int(row['count'])}
+            for date, row in merged.iterrows()}
+
+
+def _daily_stats(db, sensor: Dict, start: int, end: float,
+                 tz: str = _bl.DEFAULT_TZ) -> Dict[str, dict]:
+    """{local date: {min, max, avg, count}} for readings in [start, end)."""
+    match = {**sensor, 'time': {'$gte': start, '$lt': end}}
+    try:
+        rows = list(db.Sensors.aggregate(_daily_pipeline(match, tz)))
+    except (OperationFailure, NotImplementedError) as exc:
+        logger.debug('Daily aggregation unavailable (%s); folding client-side', exc)
+        return _daily_streamed(db, match, tz)
+    return {row['_id']: {k: row[k] for k in ('min', 'max', 'avg', 'count')} for row in rows}
+
+
+def _reading_range(db, sensor: Dict) -> Optional[Tuple[float, float]]:
+    """(first, last) reading time of a sensor, or None without readings."""
+    first = db.Sensors.find_one(sensor, {'_id': 0, 'time': 1}, sort=[('time', 1)])
+    if first is None:
+        return None
+    last = db.Sensors.find_one(sensor, {'_id': 0, 'time': 1}, sort=[('time', -1)])
+    return first['time'], last['time']
+
+
+def _cells(days: Dict[str, dict]) -> List[dict]:
+    """Heatmap cells for the days with readings, in date order."""
+    return [{'date': date, 'min': s['min'], 'max': s['max'],
+             'avg': s['avg'], 'count': s['count']}
+            for date, s in sorted(days.items()) if s['count']]
+
+
+# ---------------------------------------------------------------------------
+# Heatmap
+# ---------------------------------------------------------------------------
+
+def _year_bounds(year: int, tz: str) -> Tuple[int, int]:
+    return (_bl.local_midnight(dt.date(year, 1, 1), tz),
+            _bl.local_midnight(dt.date(year + 1, 1, 1), tz))
+
+
+def year_is_final(year: int, now: Optional[float] = None, tz: str = _bl.DEFAULT_TZ) -> bool:
+    """True once every day of the year has been finalized (the response is immutable)."""
+    now = time.time() if now is None else now
+    return _year_bounds(year, tz)[1] + _FINALIZE_GRACE <= now
+
+
+def heatmap_year(db, gateway_id: str, node_id: str, sensor_type: str, year: int,
+                 now: Optional[float] = None, tz: str = _bl.DEFAULT_TZ) -> List[dict]:
+    """Daily {date, min, max, avg, count} cells of one sensor for a year in tz.
+
+    Finalized days come from DailySummaries; closed days not summarized yet
+    within the sensor's reading range are aggregated with one range query
+    and written with one bulk_write; the days still open are aggregated
+    live.  Fully finalized years are
+    served from the per-process cache.
+    """
+    now = time.time() if now is None else now
+    key = (gateway_id, node_id, sensor_type, year, tz)
+    if key in _year_cache:
+        _year_cache.move_to_end(key)
+        return _year_cache[key]
+
+    year_start, year_end = _year_bounds(year, tz)
+    # Days ending at least _FINALIZE_GRACE ago are closed
+    closed_end = max(year_start, min(year_end, _bl.local_midnight(
+        _bl.local_date(now - _FINALIZE_GRACE, tz), tz)))
+    sensor = {'gateway_id': gateway_id, 'node_id': node_id, 'type': sensor_type}
+    col = db[_COLLECTION]
+
+    days = {doc['date']: doc for doc in col.find(
+        {**sensor, 'tz': _bl.tz_query(tz), 'day': {'$gte': year_start, '$lt': closed_end}},
+        {'_id': 0, 'date': 1, 'min': 1, 'max': 1, 'avg': 1, 'count': 1})}
+    closed = _bl.local_days(year_start, closed_end - 1, tz) if closed_end > year_start else []
+    missing = [d for d in closed if _bl.local_date(d, tz).isoformat() not in days]
+    if missing:
+        # Days before the first or after the last reading stay empty unstored
+        readings = _reading_range(db, sensor)
+        if readings is None:
+            missing = []
+        else:
+            first_day, last_day = (_bl.local_midnight(_bl.local_date(t, tz), tz)
+                                   for t in readings)
+            missing = [d for d in missing if first_day <= d <= last_day]
+    if missing:
+        empty = {'min': None, 'max': None, 'avg': None, 'count': 0}
+        stats = _daily_stats(db, sensor, missing[0], closed_end, tz)
+        finalized = {_bl.local_date(d, tz).isoformat(): d for d in missing}
+        col.bulk_write([UpdateOne({**sensor, 'tz': tz, 'day': d},
+                                  {'$set': {**stats.get(date, empty), 'date': date}}, upsert=True)
+                        for date, d in finalized.items()], ordered=False)
+        days.update({date: stats.get(date, empty) for date in finalized})
+        logger.info('Daily summaries %s/%s/%s (%s): finalized %d day(s)',
+                    gateway_id, node_id, sensor_type, tz, len(missing))
+
+    live_end = min(year_end, now)
+    if closed_end < live_end:
+        days.update(_daily_stats(db, sensor, closed_end, live_end, tz))
+
+    cells = _cells(days)
+    if year_is_final(year, now, tz):
+        _year_cache[key] = cells
+        if len(_year_cache) > _YEAR_CACHE_SIZE:
+            _year_cache.popitem(last=False)
+    return cells
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+forecast_refresher.py — Background job that keeps the RegressionForecasts
+collection current.
+
+Each pass fingerprints the NOAA forecast documents in range for every
+gateway with regression models (and every horizon already cached) and
+recomputes only the forecasts whose fingerprint or model trained_at changed,
+so a new NOAA batch or a retrain is picked up within one interval and
+/regression_forecasts stays a cache read.
+
+Usage:
+  python3 forecast_refresher.py -d PROD [--interval 300] [--once]
+
+Options:
+  -d / --db        Database alias: PROD or TEST  (required)
+  -i / --interval  Seconds between refresh passes  (default: 300)
+  -1 / --once      Run a single pass and exit (for cron)
+  -h               Show this help
+"""
+
+import getopt
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+import regression_training as _rt
+
+DB_MAP = {
+    'PROD': 'gdtechdb_prod',
+    'TEST': 'gdtechdb_test',
+}
+
+
+def printhelp():
+    print(__doc__)
+
+
+def main(argv):
+    db_alias = ''
+    interval = 300
+    once = False
+
+    try:
+        opts, _ = getopt.getopt(argv, 'h1d:i:', ['db=', 'interval=', 'once'])
+    except getopt.GetoptError as e:
+        print(f'Error: {e}')
+        printhelp()
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            printhelp()
+            sys.exit(0)
+        elif opt in ('-d', '--db'):
+            db_alias = arg.upper()
+        elif opt in ('-i', '--interval'):
+            interval = int(arg)
+        elif opt in ('-1', '--once'):
+            once = True
+
+    if db_alias not in DB_MAP:
+        print(f'Error: --db must be one of {list(DB_MAP.keys())}')
+        printhelp()
+        sys.exit(1)
+
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGODB_HOST', 'localhost'), 27017)
+    db = client[DB_MAP[db_alias]]
+
+    while True:
+        started = time.time()
+        try:
+            recomputed = _rt.refresh_cached_forecasts(db)
+            if recomputed or once:
+                print(f'[forecasts] Pass done in {time.time() - started:.1f}s: '
+                      f'{recomputed} forecast(s) recomputed')
+        except Exception as exc:
+            print(f'[forecasts] Pass failed: {exc}')
+        if once:
+            break
+        time.sleep(max(0.0, interval - (time.time() - started)))
+
+    client.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
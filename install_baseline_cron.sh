@@ -0,0 +1,18 @@
+#!/bin/bash
+# Installs a nightly cron job that updates baselines for every baseline-enabled gateway.
+# Run once: ./install_baseline_cron.sh
+# To remove the job later: crontab -e  and delete the baseline_job line.
+
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+LOG_FILE="$SCRIPT_DIR/baseline_job.log"
+CRON_CMD="30 0 * * * cd $SCRIPT_DIR && pipenv run python3 baseline_job.py -d PROD >> $LOG_FILE 2>&1"
+
+# Add the line only if it isn't already present
+if crontab -l 2>/dev/null | grep -q 'baseline_job.py'; then
+    echo "Cron job already installed. Current crontab:"
+    crontab -l | grep 'baseline_job.py'
+else
+    (crontab -l 2>/dev/null; echo "$CRON_CMD") | crontab -
+    echo "Cron job installed:"
+    echo "  $CRON_CMD"
+fi
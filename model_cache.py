@@ -0,0 +1,135 @@
+"""model_cache.py — per-worker in-memory cache of trained ML models.
+
+Every gunicorn worker keeps the models it has recently served in an LRU map
+keyed by (gateway_id, node_id, type); gateway-level anomaly models use
+node_id=None and type=None. The cache is bounded by an estimate of resident
+model memory, not by entry count: the loaders size each entry from the
+uncompressed byte count in the artifact manifest (model_store.resident_bytes),
+since a compressed file or a shared-layout skeleton is far smaller on disk
+than the loaded model. Without a sizer, the files' on-disk size is used.
+
+An entry is reused without touching the filesystem for _REVALIDATE_SECONDS.
+After that its files are re-stat'ed and the entry is reloaded if any mtime or
+size changed. Saving a model in this process bumps the key's version stamp, so
+the worker that ran the training sees the new model immediately; other workers
+pick it up on their next revalidation.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+_MAX_BYTES          = int(os.getenv('MODEL_CACHE_MAX_MB', '512')) * 1024 * 1024
+_REVALIDATE_SECONDS = 30.0
+
+
+def _stat_stamp(paths: List[str]) -> Tuple:
+    """Return (mtime_ns, size) for each path. Raises FileNotFoundError if absent."""
+    stamp = []
+    for path in paths:
+        st = os.stat(path)
+        stamp.append((st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+class _Entry:
+    __slots__ = ('value', 'paths', 'stamp', 'version', 'nbytes', 'checked_at')
+
+    def __init__(self, value, paths, stamp, version, nbytes, checked_at):
+        self.value = value
+        self.paths = paths
+        self.stamp = stamp
+        self.version = version
+        self.nbytes = nbytes
+        self.checked_at = checked_at
+
+
+class ModelCache:
+    """LRU cache of loaded models bounded by estimated memory."""
+
+    def __init__(self, max_bytes: int = _MAX_BYTES,
+                 revalidate_seconds: float = _REVALIDATE_SECONDS):
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self._entries: 'OrderedDict[Hashable, _Entry]' = OrderedDict()
+        self._versions: dict = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(e.nbytes for e in self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, paths: List[str], loader: Callable[[], object],
+            size_of: Optional[Callable[[Any], int]] = None):
+        """Return the cached value for key, calling loader() on a miss.
+
+        paths are the files the value was loaded from; they are stat'ed to
+        detect changes. size_of(value) gives the entry's memory estimate
+        (default: the files' total size). Raises FileNotFoundError (and
+        evicts the key) if any of them is missing.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            version = self._versions.get(key, 0)
+            if (entry is not None and entry.paths == paths and entry.version == version
+                    and now - entry.checked_at < self.revalidate_seconds):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+
+        try:
+            stamp = _stat_stamp(paths)
+        except FileNotFoundError:
+            self.invalidate(key)
+            raise
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is not None and entry.paths == paths and entry.version == version
+                    and entry.stamp == stamp):
+                entry.checked_at = now
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+
+        value = loader()
+        nbytes = size_of(value) if size_of is not None else sum(size for _, size in stamp)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = _Entry(value, list(paths), stamp, version, nbytes, now)
+            self._entries.move_to_end(key)
+            self._evict()
+        return value
+
+    def _evict(self) -> None:
+        # Always keep the most recently used entry, even if it alone exceeds the budget
+        while len(self._entries) > 1 and self.total_bytes > self.max_bytes:
+            self._entries.popitem(last=False)
+
+    def bump_version(self, key: Hashable) -> None:
+        """Mark key's cached value stale (called after saving a new model)."""
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Drop one key, or every entry when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+# Process-wide instance shared by anomaly_training and regression_training.
+cache = ModelCache()
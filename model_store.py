@@ -0,0 +1,303 @@
+"""model_store.py — on-disk format for trained model artifacts.
+
+Models are written with joblib using a configurable compression level
+(MODEL_COMPRESS, a joblib `compress` value). The default 0 leaves artifacts
+uncompressed so the workers can memory-map them; compressed artifacts are
+smaller on disk but every worker unpickles a private copy. Every save
+returns a manifest that callers store in the model's metadata JSON:
+
+  {'format': 1, 'compress': 0, 'size_bytes': ..., 'resident_bytes': ...,
+   'sha256': ..., 'saved_at': ...}
+
+resident_bytes is the uncompressed pickled size of the model, which is what
+a loaded copy occupies whatever the compression; the model cache budgets
+with it. The artifact is written to a temporary file and only then renamed
+into place, so readers never see a partial file and workers with the
+previous artifact memory-mapped keep a valid mapping. save_artifact(verify=
+True) additionally loads the file back before the rename and records
+load_seconds; both training pipelines save that way, so their manifests
+carry the load time. The cached model loaders check the sha256 whenever
+they load an artifact from disk (load_artifact(verify=True)), i.e. once
+per cache miss.
+
+With MODEL_SHARED=1 the artifact is written in a shared layout instead:
+every numpy array of at least MODEL_SHARED_MIN_KB is stored as an
+uncompressed .npy file in a sidecar directory next to the artifact, and the
+artifact itself is a small pickle that references them. Loading with
+mmap_mode='r' maps those files, so all gunicorn workers (and the trainer)
+share one copy through the page cache. Arrays that the estimator copies on
+unpickling gain nothing from this: sklearn's Tree.__setstate__ copies its
+node arrays into its own buffer, so tree ensembles stay per-worker while
+e.g. SVM support vectors, scaler statistics and IsolationForest path-length
+caches are shared.
+
+Tree ensembles can optionally be compacted before saving (compact_ensemble):
+trailing trees are pruned, and each candidate is accepted only if its
+holdout score stays within a tolerance of the full model's. Node values are
+left as they are: sklearn's Tree only accepts float64 node arrays, so
+storing them as float32 would save nothing once loaded.
+"""
+
+import copy
+import glob
+import hashlib
+import os
+import pickle
+import shutil
+import time
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+import joblib
+import numpy as np
+from sklearn.ensemble import (GradientBoostingRegressor, RandomForestClassifier,
+                              RandomForestRegressor)
+
+_FORMAT   = 1
+_COMPRESS = int(os.getenv('MODEL_COMPRESS', '0'))
+SHARED_ENABLED    = os.getenv('MODEL_SHARED', '0') == '1'
+_SHARED_MIN_BYTES = int(os.getenv('MODEL_SHARED_MIN_KB', '64')) * 1024
+_SHARED_MAGIC     = b'SIOT-SHARED-1\n'   # first line of a shared-layout artifact
+_SHARED_KEEP      = 2                     # sidecar generations kept per artifact
+COMPACT_ENABLED  = os.getenv('MODEL_COMPACT', '0') == '1'
+_PRUNE_FRACTIONS = (0.25, 0.5, 0.75)   # tree-count fractions tried, smallest first
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _ByteCounter:
+    """Write-only file object that only counts the bytes written to it."""
+
+    def __init__(self):
+        self.nbytes = 0
+
+    def write(self, data) -> int:
+        n = memoryview(data).nbytes
+        self.nbytes += n
+        return n
+
+
+def _pickled_size(obj) -> int:
+    """Uncompressed pickled size of obj, without materializing the pickle."""
+    counter = _ByteCounter()
+    pickle.Pickler(counter, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    return counter.nbytes
+
+
+def resident_bytes(obj, manifest: Optional[Dict] = None) -> int:
+    """Estimated memory of a loaded artifact: the manifest's resident_bytes.
+
+    Manifests written before resident_bytes was recorded fall back to
+    measuring the loaded object.
+    """
+    if manifest and manifest.get('resident_bytes'):
+        return int(manifest['resident_bytes'])
+    return _pickled_size(obj)
+
+
+def save_artifact(obj, path: str, compress: Optional[int] = None,
+                  shared: Optional[bool] = None, verify: bool = False) -> Dict:
+    """Atomically write obj to path; return its manifest dict.
+
+    shared selects the sidecar layout (default: MODEL_SHARED); compress is
+    ignored for it. With verify the written file is loaded back before it is
+    renamed into place and the load time is recorded. Raises whatever
+    joblib/pickle raises; the temporary file is removed on failure.
+    """
+    compress = _COMPRESS if compress is None else compress
+    shared = SHARED_ENABLED if shared is None else shared
+    tmp_path = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        if shared:
+            array_dir, n_arrays, array_bytes = _dump_shared(obj, path, tmp_path)
+        else:
+            joblib.dump(obj, tmp_path, compress=compress)
+        manifest = {'format':         _FORMAT,
+                    'compress':       0 if shared else compress,
+                    'size_bytes':     os.path.getsize(tmp_path),
+                    'resident_bytes': _pickled_size(obj),
+                    'sha256':         _sha256(tmp_path),
+                    'saved_at':       time.time()}
+        if shared:
+            manifest.update(layout='shared', array_dir=array_dir,
+                            arrays=n_arrays, array_bytes=array_bytes)
+        if verify:
+            started = time.perf_counter()
+            load_artifact(tmp_path)
+            manifest['load_seconds'] = round(time.perf_counter() - started, 4)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _prune_sidecars(path)
+    return manifest
+
+
+def load_artifact(path: str, manifest: Optional[Dict] = None,
+                  mmap_mode: Optional[str] = None, verify: bool = False):
+    """Load an artifact written by save_artifact (or a legacy joblib dump).
+
+    mmap_mode is only honoured for uncompressed artifacts; legacy artifacts
+    without a manifest are assumed uncompressed. Shared-layout artifacts are
+    recognised from the file itself, so a manifest from an older metadata
+    file cannot misdirect the load. With verify, the file's sha256 must
+    match the manifest (ValueError otherwise).
+    """
+    manifest = manifest or {}
+    if verify and manifest.get('sha256') and _sha256(path) != manifest['sha256']:
+        raise ValueError(f'{path}: content hash does not match manifest')
+    with open(path, 'rb') as f:
+        if f.read(len(_SHARED_MAGIC)) == _SHARED_MAGIC:
+            array_dir = os.path.join(os.path.dirname(path), f.readline().decode().strip())
+            return _SidecarUnpickler(f, array_dir, mmap_mode).load()
+    if manifest.get('compress'):
+        mmap_mode = None
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+# ---------------------------------------------------------------------------
+# Shared (sidecar) layout
+# ---------------------------------------------------------------------------
+
+class _SidecarPickler(pickle.Pickler):
+    """Pickler that writes large numeric arrays to .npy files in array_dir."""
+
+    def __init__(self, f, array_dir: str):
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.array_dir = array_dir
+        self.array_bytes = []
+
+    def persistent_id(self, obj):
+        if (isinstance(obj, np.ndarray) and not obj.dtype.hasobject
+                and obj.nbytes >= _SHARED_MIN_BYTES):
+            name = f'{len(self.array_bytes)}.npy'
+            np.save(os.path.join(self.array_dir, name), np.ascontiguousarray(obj),
+                    allow_pickle=False)
+            self.array_bytes.append(obj.nbytes)
+            return ('npy', name)
+        return None
+
+
+class _SidecarUnpickler(pickle.Unpickler):
+    def __init__(self, f, array_dir: str, mmap_mode: Optional[str]):
+        super().__init__(f)
+        self.array_dir = array_dir
+        self.mmap_mode = mmap_mode
+
+    def persistent_load(self, pid):
+        kind, name = pid
+        if kind != 'npy':
+            raise pickle.UnpicklingError(f'unknown persistent id {pid!r}')
+        return np.load(os.path.join(self.array_dir, name),
+                       mmap_mode=self.mmap_mode, allow_pickle=False)
+
+
+def _dump_shared(obj, path: str, tmp_path: str) -> Tuple[str, int, int]:
+    """Write obj's skeleton to tmp_path and its arrays to a fresh sidecar dir.
+
+    Each save gets a new directory, so workers still mapping the previous
+    generation's files are unaffected. Returns (dir name, arrays, bytes).
+    """
+    array_dir = f'{os.path.basename(path)}.arrays.{uuid.uuid4().hex[:8]}'
+    full_dir = os.path.join(os.path.dirname(path), array_dir)
+    os.makedirs(full_dir)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_SHARED_MAGIC)
+            f.write(array_dir.encode() + b'\n')
+            pickler = _SidecarPickler(f, full_dir)
+            pickler.dump(obj)
+    except Exception:
+        shutil.rmtree(full_dir, ignore_errors=True)
+        raise
+    return array_dir, len(pickler.array_bytes), int(sum(pickler.array_bytes))
+
+
+def _prune_sidecars(path: str) -> None:
+    """Remove all but the newest _SHARED_KEEP sidecar dirs of path.
+
+    The previous generation is kept so a reader that opened the old artifact
+    just before the rename can still open its arrays; mapped files stay valid
+    after removal.
+    """
+    dirs = sorted(glob.glob(glob.escape(path) + '.arrays.*'), key=os.path.getmtime)
+    for stale in dirs[:-_SHARED_KEEP]:
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# Ensemble compaction
+# ---------------------------------------------------------------------------
+
+def _ensemble(model):
+    """Return the tree ensemble inside model (or a Pipeline's last step), or None."""
+    est = model.steps[-1][1] if hasattr(model, 'steps') else model
+    if isinstance(est, (RandomForestRegressor, RandomForestClassifier,
+                        GradientBoostingRegressor)) and hasattr(est, 'estimators_'):
+        return est
+    return None
+
+
+def _truncate(est, n_trees: int) -> None:
+    est.estimators_ = est.estimators_[:n_trees]
+    est.n_estimators = n_trees
+    if hasattr(est, 'n_estimators_'):   # gradient boosting: stages are a prefix sum
+        est.n_estimators_ = n_trees
+        est.train_score_ = est.train_score_[:n_trees]
+
+
+def _compacted(model, fraction: float):
+    """Return a deep copy of model with the first `fraction` of its trees."""
+    candidate = copy.deepcopy(model)
+    est = _ensemble(candidate)
+    n_trees = max(1, int(round(len(est.estimators_) * fraction)))
+    if n_trees < len(est.estimators_):
+        _truncate(est, n_trees)
+    return candidate
+
+
+def compact_ensemble(model, score_fn: Callable[[object], float],
+                     tolerance: float) -> Tuple[object, Dict]:
+    """Prune trailing trees of an ensemble while its holdout score holds.
+
+    score_fn(model) returns a higher-is-better holdout score (R² or F1).
+    Tree-count fractions are tried smallest first; the first candidate whose
+    score is within tolerance of the full model's is kept. Non-ensemble
+    models are returned unchanged. Returns (model, report); the report
+    records tree counts and scores for the metadata and can be replayed on a
+    sibling model with apply_compaction.
+    """
+    est = _ensemble(model)
+    if est is None:
+        return model, {'applied': False, 'reason': 'not a tree ensemble'}
+
+    n_full = len(est.estimators_)
+    baseline = float(score_fn(model))
+    report = {'applied': False, 'trees_before': n_full,
+              'score_before': round(baseline, 4), 'tolerance': tolerance}
+
+    for fraction in _PRUNE_FRACTIONS:
+        candidate = _compacted(model, fraction)
+        score = float(score_fn(candidate))
+        if score >= baseline - tolerance:
+            report.update(applied=True, fraction=fraction,
+                          trees_after=len(_ensemble(candidate).estimators_),
+                          score_after=round(score, 4))
+            return candidate, report
+
+    report['reason'] = 'no candidate within tolerance'
+    return model, report
+
+
+def apply_compaction(model, report: Dict):
+    """Apply an accepted compact_ensemble decision to another fit of the same variant."""
+    if not report.get('applied') or _ensemble(model) is None:
+        return model
+    return _compacted(model, report['fraction'])
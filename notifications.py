@@ -0,0 +1,261 @@
+"""
+notifications.py — Batched push delivery of fired alerts to DeviceTokens.
+
+NotificationDispatcher decouples delivery from whoever fires the alerts:
+enqueue() only puts the alert on a bounded queue and never blocks, so an
+alert storm (a regional heat wave tripping hundreds of rules at once) cannot
+stall the caller.  A dispatcher thread drains the queue in batches:
+
+  1. alerts collected within batch_window seconds are grouped per user email
+     — a user with several fired rules gets one notification;
+  2. the users' tokens are looked up with one DeviceTokens query ($in);
+  3. one send per token is submitted to a pool of `workers` threads, which
+     bounds the concurrent requests to the push service.
+
+Sending goes through a pluggable transport with send(token, title, body,
+data) -> bool | None, where False means the token is no longer registered
+(it is then removed from DeviceTokens).  FCMTransport talks to the FCM HTTP
+v1 API over one authorized requests session, so connections are reused
+across sends; LogTransport only logs and is the default when FCM is not
+configured.
+
+Delivery latency (enqueue to send completed) and send counts are kept in
+memory and reported by stats().
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_FCM_SCOPE = 'https://www.googleapis.com/auth/firebase.messaging'
+_FCM_URL = 'https://fcm.googleapis.com/v1/projects/{project}/messages:send'
+_LATENCY_WINDOW = 10000            # recent deliveries kept for latency percentiles
+
+
+# ---------------------------------------------------------------------------
+# Transports
+# ---------------------------------------------------------------------------
+
+class LogTransport:
+    """Transport that only logs each notification."""
+
+    def send(self, token: str, title: str, body: str, data: Dict[str, str]) -> bool:
+        logger.info('Push to %s…: %s — %s', token[:12], title, body)
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class FCMTransport:
+    """FCM HTTP v1 transport over one pooled, authorized session.
+
+    Args:
+      credentials_file: service-account JSON with Firebase messaging access.
+      project_id: Firebase project id.
+      pool_size: HTTP connections kept open (match the dispatcher workers).
+      timeout: per-request timeout in seconds.
+    """
+
+    def __init__(self, credentials_file: str, project_id: str, pool_size: int = 8,
+                 timeout: float = 10.0):
+        from google.auth.transport.requests import AuthorizedSession
+        from google.oauth2 import service_account
+        from requests.adapters import HTTPAdapter
+
+        credentials = service_account.Credentials.from_service_account_file(
+            credentials_file, scopes=[_FCM_SCOPE])
+        self.session = AuthorizedSession(credentials)
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.url = _FCM_URL.format(project=project_id)
+        self.timeout = timeout
+
+    def send(self, token: str, title: str, body: str, data: Dict[str, str]) -> bool:
+        resp = self.session.post(self.url, timeout=self.timeout, json={'message': {
+            'token': token,
+            'notification': {'title': title, 'body': body},
+            'data': data,
+        }})
+        if resp.status_code == 404 or (resp.status_code == 400 and 'UNREGISTERED' in resp.text):
+            return False
+        resp.raise_for_status()
+        return True
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def transport_from_env(pool_size: int = 8):
+    """FCMTransport when FCM_CREDENTIALS and FCM_PROJECT_ID are set, else LogTransport."""
+    credentials_file = os.getenv('FCM_CREDENTIALS')
+    project_id = os.getenv('FCM_PROJECT_ID')
+    if credentials_file and project_id:
+        return FCMTransport(credentials_file, project_id, pool_size=pool_size)
+    logger.info('FCM not configured; push notifications are only logged')
+    return LogTransport()
+
+
+# ---------------------------------------------------------------------------
+# Dispatcher
+# ---------------------------------------------------------------------------
+
+def _compose(alerts: List[dict]):
+    """(title, body, data) of one notification for a user's alerts."""
+    if len(alerts) == 1:
+        return 'Sensor alert', alerts[0]['message'], {'rule_id': alerts[0]['rule_id']}
+    shown = [a['message'] for a in alerts[:3]]
+    more = len(alerts) - len(shown)
+    body = '; '.join(shown) + (f' (+{more} more)' if more else '')
+    return f'{len(alerts)} sensor alerts', body, {
+        'rule_ids': ','.join(a['rule_id'] for a in alerts)}
+
+
+class NotificationDispatcher:
+    """Queue plus worker pool delivering alerts per user.
+
+    Args:
+      db: database holding DeviceTokens.
+      transport: object with send(token, title, body, data); defaults to
+        transport_from_env().
+      workers: concurrent sends.
+      batch_window: seconds to keep collecting alerts before a batch is sent.
+      max_queue: queued alerts beyond which new ones are dropped.
+    """
+
+    def __init__(self, db, transport=None, workers: int = 8, batch_window: float = 0.5,
+                 max_queue: int = 10000):
+        self.db = db
+        self.transport = transport or transport_from_env(pool_size=workers)
+        self.batch_window = batch_window
+        self.queue: 'queue.Queue[tuple]' = queue.Queue(maxsize=max_queue)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='push')
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=_LATENCY_WINDOW)
+        self._counts = {'enqueued': 0, 'dropped': 0, 'sent': 0, 'failed': 0,
+                        'no_tokens': 0, 'tokens_removed': 0, 'batches': 0}
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='push-dispatcher', daemon=True)
+        self._thread.start()
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[key] += n
+
+    # ── Producer side ────────────────────────────────────────────────────────
+
+    def enqueue(self, alert: dict) -> bool:
+        """Queue a fired alert for delivery; never blocks.  False if dropped."""
+        try:
+            self.queue.put_nowait((time.monotonic(), alert))
+        except queue.Full:
+            self._count('dropped')
+            logger.warning('Notification queue full; dropped alert %s', alert.get('rule_id'))
+            return False
+        self._count('enqueued')
+        return True
+
+    __call__ = enqueue   # usable directly as AlertEngine(push=dispatcher)
+
+    # ── Dispatcher thread ────────────────────────────────────────────────────
+
+    def _next_batch(self) -> List[tuple]:
+        try:
+            batch = [self.queue.get(timeout=0.2)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_window
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0
+                             else self.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _run(self) -> None:
+        while not (self._stopping.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self._dispatch(batch)
+                except Exception as exc:
+                    self._count('failed', len(batch))
+                    logger.warning('Notification batch failed: %s', exc)
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+
+    def _dispatch(self, batch: List[tuple]) -> None:
+        by_user: Dict[str, List[tuple]] = {}
+        for queued_at, alert in batch:
+            by_user.setdefault(alert.get('email'), []).append((queued_at, alert))
+        tokens: Dict[str, List[str]] = {}
+        for doc in self.db.DeviceTokens.find({'email': {'$in': list(by_user)}},
+                                             {'_id': 0, 'email': 1, 'token': 1}):
+            if doc.get('token'):
+                tokens.setdefault(doc['email'], []).append(doc['token'])
+        self._count('batches')
+
+        futures = []
+        for email, items in by_user.items():
+            if email not in tokens:
+                self._count('no_tokens', len(items))
+                continue
+            title, body, data = _compose([alert for _, alert in items])
+            queued_at = min(q for q, _ in items)
+            for token in tokens[email]:
+                futures.append(self.pool.submit(self._send, token, title, body, data, queued_at))
+        stale = [token for f in futures for token in [f.result()] if token]
+        if stale:
+            result = self.db.DeviceTokens.delete_many({'token': {'$in': stale}})
+            self._count('tokens_removed', result.deleted_count)
+
+    def _send(self, token: str, title: str, body: str, data: Dict[str, str],
+              queued_at: float) -> Optional[str]:
+        """Send one notification; return the token if it is no longer registered."""
+        try:
+            ok = self.transport.send(token, title, body, data)
+        except Exception as exc:
+            self._count('failed')
+            logger.warning('Push to %s… failed: %s', token[:12], exc)
+            return None
+        if ok is False:
+            return token
+        with self._lock:
+            self._counts['sent'] += 1
+            self._latencies.append(time.monotonic() - queued_at)
+        return None
+
+    # ── Lifecycle / metrics ──────────────────────────────────────────────────
+
+    def flush(self) -> None:
+        """Block until every queued alert has been dispatched."""
+        self.queue.join()
+
+    def close(self) -> None:
+        """Deliver what is queued, then stop the dispatcher and the transport."""
+        self._stopping.set()
+        self._thread.join()
+        self.pool.shutdown(wait=True)
+        self.transport.close()
+
+    def stats(self) -> dict:
+        """Counts plus delivery latency percentiles (seconds) of recent sends."""
+        with self._lock:
+            latencies = np.array(self._latencies)
+            stats = {**self._counts, 'queued': self.queue.qsize()}
+        if latencies.size:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            stats['latency'] = {'p50': round(float(p50), 4), 'p95': round(float(p95), 4),
+                                'p99': round(float(p99), 4),
+                                'max': round(float(latencies.max()), 4)}
+        return stats
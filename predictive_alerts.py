@@ -0,0 +1,158 @@
+"""
+predictive_alerts.py — Frost / heat warnings from stored NOAA forecasts.
+
+Users with predictive_alerts_enabled in NOAASettings are warned when the NOAA
+forecast for their gateway (Sensors documents with node_id 'noaa_forecast',
+type F) drops to frost_threshold or below, or reaches heat_threshold or
+above, within the scan horizon.
+
+One scan costs two reads however many gateways are enabled: all enabled
+NOAASettings in one query, and the upcoming forecasts of all their gateways
+in one $in range query.  Thresholds are then compared for the whole fleet at
+once on a single frame.
+
+Only new crossings are emitted.  The state of each (email, gateway_id, kind)
+is kept in PredictiveAlertState:
+
+  {email, gateway_id, kind: 'frost'|'heat', active, first_time, extreme,
+   updated_at}
+
+A warning fires when a crossing appears while the state is inactive; the
+state goes inactive again once the forecast no longer crosses the threshold,
+so the next cold snap or heat wave warns again.  Gateways without forecast
+data keep their state.
+"""
+
+import logging
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+
+import sensor_common as _sc
+
+logger = logging.getLogger(__name__)
+
+_STATE_COLLECTION = 'PredictiveAlertState'
+_DEFAULT_FROST = 35.0
+_DEFAULT_HEAT = 95.0
+
+# kind -> (threshold field, default, crossing test, extreme)
+_KINDS = {
+    'frost': ('frost_threshold', _DEFAULT_FROST, np.less_equal, 'min'),
+    'heat': ('heat_threshold', _DEFAULT_HEAT, np.greater_equal, 'max'),
+}
+
+
+def _enabled_settings(db) -> pd.DataFrame:
+    """Enabled predictive-alert settings: one row per (email, gateway_id)."""
+    docs = list(db.NOAASettings.find(
+        {'predictive_alerts_enabled': True, 'enabled': {'$ne': False},
+         'gateway_id': {'$nin': [None, '']}},
+        {'_id': 0, 'email': 1, 'gateway_id': 1, 'frost_threshold': 1, 'heat_threshold': 1}))
+    settings = pd.DataFrame(docs, columns=['email', 'gateway_id',
+                                           'frost_threshold', 'heat_threshold'])
+    for field, default, _, _ in _KINDS.values():
+        settings[field] = pd.to_numeric(settings[field], errors='coerce').fillna(default)
+    return settings
+
+
+def _forecasts(db, gateway_ids: List[str], now: float, hours: int) -> pd.DataFrame:
+    """Upcoming NOAA forecast readings (gateway_id, time, value) of all gateways."""
+    docs = list(db.Sensors.find(
+        {'gateway_id': {'$in': gateway_ids}, 'node_id': _sc.NOAA_NODE_ID, 'type': 'F',
+         'time': {'$gte': now, '$lte': now + hours * 3600}},
+        {'_id': 0, 'gateway_id': 1, 'time': 1, 'value': 1}))
+    df = pd.DataFrame(docs, columns=['gateway_id', 'time', 'value'])
+    df['value'] = _sc.clean_values(df['value']) if len(df) else np.array([], dtype=float)
+    return df.dropna(subset=['value'])
+
+
+def _crossings(settings: pd.DataFrame, forecasts: pd.DataFrame) -> pd.DataFrame:
+    """Per (email, gateway_id, kind) with forecast data: whether and when it crosses.
+
+    Columns: email, gateway_id, kind, threshold, crossing, first_time, extreme.
+    """
+    merged = settings.merge(forecasts, on='gateway_id', how='inner')
+    frames = []
+    for kind, (field, _, crosses, extreme) in _KINDS.items():
+        hit = crosses(merged['value'].to_numpy(), merged[field].to_numpy())
+        part = merged[['email', 'gateway_id', field]].rename(columns={field: 'threshold'})
+        part = part.assign(kind=kind, crossing=hit,
+                           hit_time=np.where(hit, merged['time'], np.nan),
+                           hit_value=np.where(hit, merged['value'], np.nan))
+        frames.append(part.groupby(['email', 'gateway_id', 'kind'], as_index=False).agg(
+            threshold=('threshold', 'first'), crossing=('crossing', 'any'),
+            first_time=('hit_time', 'min'), extreme=('hit_value', extreme)))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _message(kind: str, extreme: float, first_time: float, threshold: float, now: float) -> str:
+    hours = max(0, int(round((first_time - now) / 3600)))
+    if kind == 'frost':
+        return f'Frost forecast: low of {extreme:g}°F in {hours} h (threshold {threshold:g}°F)'
+    return f'Heat forecast: high of {extreme:g}°F in {hours} h (threshold {threshold:g}°F)'
+
+
+def scan(db, push: Optional[Callable[[dict], None]] = None, now: Optional[float] = None,
+         hours: int = 48) -> dict:
+    """Warn enabled users of new frost/heat crossings in the next `hours`.
+
+    Each new crossing is passed to push (same shape as an alerts.AlertEngine
+    alert, with rule_id 'predictive:<kind>:<gateway_id>').  Returns
+    {settings, gateways, forecasts, crossings, emitted, alerts}.
+    """
+    now = time.time() if now is None else now
+    settings = _enabled_settings(db)
+    report = {'settings': len(settings), 'gateways': 0, 'forecasts': 0,
+              'crossings': 0, 'emitted': 0, 'alerts': []}
+    if settings.empty:
+        return report
+    gateway_ids = sorted(settings['gateway_id'].astype(str).unique())
+    forecasts = _forecasts(db, gateway_ids, now, hours)
+    report.update(gateways=len(gateway_ids), forecasts=len(forecasts))
+    if forecasts.empty:
+        return report
+    result = _crossings(settings, forecasts)
+
+    col = db[_STATE_COLLECTION]
+    active = {(doc['email'], doc['gateway_id'], doc['kind']) for doc in col.find(
+        {'email': {'$in': sorted(result['email'].unique())}, 'active': True},
+        {'_id': 0, 'email': 1, 'gateway_id': 1, 'kind': 1})}
+
+    ops, alerts = [], []
+    for row in result.itertuples(index=False):
+        key = (row.email, row.gateway_id, row.kind)
+        state = {'email': row.email, 'gateway_id': row.gateway_id, 'kind': row.kind}
+        if not row.crossing:
+            if key in active:
+                ops.append(UpdateOne(state, {'$set': {'active': False, 'updated_at': now}}))
+            continue
+        report['crossings'] += 1
+        if key in active:
+            continue
+        ops.append(UpdateOne(state, {'$set': {
+            'active': True, 'first_time': float(row.first_time),
+            'extreme': float(row.extreme), 'updated_at': now}}, upsert=True))
+        alerts.append({
+            'rule_id': f'predictive:{row.kind}:{row.gateway_id}', 'email': row.email,
+            'gateway_id': row.gateway_id, 'node_id': _sc.NOAA_NODE_ID, 'type': 'F',
+            'kind': row.kind, 'value': float(row.extreme), 'threshold': float(row.threshold),
+            'time': float(row.first_time), 'fired_at': now,
+            'message': _message(row.kind, float(row.extreme), float(row.first_time),
+                                float(row.threshold), now),
+        })
+    if ops:
+        col.bulk_write(ops, ordered=False)
+    for alert in alerts:
+        if push is not None:
+            try:
+                push(alert)
+            except Exception as exc:
+                logger.warning('Predictive alert push for %s failed: %s', alert['email'], exc)
+    report.update(emitted=len(alerts), alerts=alerts)
+    logger.info('Predictive scan: %d gateway(s), %d forecast reading(s), %d new crossing(s)',
+                len(gateway_ids), len(forecasts), len(alerts))
+    return report
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+predictive_scanner.py — Scheduled frost/heat warning scan over stored NOAA
+forecasts.
+
+Each pass loads every NOAASettings document with predictive_alerts_enabled,
+reads the upcoming noaa_forecast readings of all those gateways with one
+query, compares them against each user's frost_threshold / heat_threshold and
+pushes only crossings that were not already reported (see
+predictive_alerts.py).  Warnings are delivered through the same
+NotificationDispatcher as the alert rules.
+
+Usage:
+  python3 predictive_scanner.py -d PROD [--hours 48] [--interval 900] [--once]
+
+Options:
+  -d / --db        Database alias: PROD or TEST  (required)
+  -H / --hours     Forecast horizon to scan, in hours  (default: 48)
+  -i / --interval  Seconds between scans  (default: 900)
+  -1 / --once      Run a single scan and exit (for cron)
+  -h               Show this help
+"""
+
+import getopt
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+import notifications as _notifications
+import predictive_alerts as _pa
+
+DB_MAP = {
+    'PROD': 'gdtechdb_prod',
+    'TEST': 'gdtechdb_test',
+}
+
+
+def printhelp():
+    print(__doc__)
+
+
+def main(argv):
+    db_alias = ''
+    hours = 48
+    interval = 900
+    once = False
+
+    try:
+        opts, _ = getopt.getopt(argv, 'h1d:H:i:', ['db=', 'hours=', 'interval=', 'once'])
+    except getopt.GetoptError as e:
+        print(f'Error: {e}')
+        printhelp()
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            printhelp()
+            sys.exit(0)
+        elif opt in ('-d', '--db'):
+            db_alias = arg.upper()
+        elif opt in ('-H', '--hours'):
+            hours = int(arg)
+        elif opt in ('-i', '--interval'):
+            interval = int(arg)
+        elif opt in ('-1', '--once'):
+            once = True
+
+    if db_alias not in DB_MAP:
+        print(f'Error: --db must be one of {list(DB_MAP.keys())}')
+        printhelp()
+        sys.exit(1)
+
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGODB_HOST', 'localhost'), 27017)
+    db = client[DB_MAP[db_alias]]
+    db[_pa._STATE_COLLECTION].create_index(
+        [('email', 1), ('gateway_id', 1), ('kind', 1)], unique=True)
+    dispatcher = _notifications.NotificationDispatcher(db)
+
+    while True:
+        started = time.time()
+        try:
+            report = _pa.scan(db, push=dispatcher.enqueue, hours=hours)
+            if report['emitted'] or once:
+                print(f'[predictive] Scan done in {time.time() - started:.1f}s: '
+                      f'{report["gateways"]} gateway(s), {report["forecasts"]} forecast '
+                      f'reading(s), {report["emitted"]} new crossing(s)')
+        except Exception as exc:
+            print(f'[predictive] Scan failed: {exc}')
+        if once:
+            break
+        time.sleep(max(0.0, interval - (time.time() - started)))
+
+    dispatcher.close()
+    client.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
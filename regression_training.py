@@ -12,6 +12,9 @@ refitted on the full dataset.
 Saved models can predict indoor readings for future NOAA forecast hours.
 """
 
+import datetime
+import hashlib
+import itertools
 import json
 import logging
 import os
@@ -19,9 +22,11 @@ import sys
 import time
 from typing import Dict, List, Optional, Tuple
 
-import joblib
 import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
 from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
 from sklearn.linear_model import Ridge
 from sklearn.metrics import mean_squared_error, r2_score
@@ -31,6 +36,9 @@ from sklearn.preprocessing import StandardScaler
 
 # Re-use NOAA constants and backfill function from anomaly_training
 import anomaly_training as _at
+import model_cache as _model_cache
+import model_store as _model_store
+import sensor_common as _sc
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -59,10 +67,22 @@ _REGRESSION_SUBDIR      = 'regression'     # models/{gw}/regression/
 _TYPES_TO_PREDICT       = ('F', 'H')       # sensor types to train regression for
 _MIN_ROWS               = 100              # skip sensor if fewer qualifying rows
 _CV_SPLITS              = 5               # TimeSeriesSplit cross-validation folds
+_CV_JOBS                = int(os.getenv('REGRESSION_CV_JOBS',   # cores for (variant, fold) fits
+                                        str(max(1, (os.cpu_count() or 1) // 2))))
 _NOAA_COVERAGE_THRESHOLD = 0.5            # fraction of rows with valid NOAA to include it
 _NOAA_BACKFILL_DAYS     = 365             # NOAA history backfill window for training
-
-# Hyperparameter grid: all variants trained; winner by mean CV R² is kept.
+_COMPACT_TOLERANCE      = 0.005           # max last-fold R² loss accepted when compacting
+_RACE_TOLERANCE         = 0.2             # drop a variant this far below the leader's running R²
+_RACE_MIN_FOLDS         = 2               # folds every variant gets before it can be dropped
+_HOURLY_CHUNK_ROWS      = _sc.CHUNK_ROWS   # readings per chunk when hourly means are built client-side
+MAX_FORECAST_HOURS      = 168             # longest forecast horizon served (NOAA hourly range)
+_FORECAST_TOUCH_SECS    = 3600            # cached forecasts record a read at most this often
+_FORECAST_IDLE_SECS     = 86400           # non-default horizons unread this long are not refreshed
+_FORECAST_TTL_SECS      = 7 * 86400       # cached forecasts unread this long are expired by MongoDB
+
+# Hyperparameter grid: winner by mean CV R² is kept.  Ridge variants are
+# always fully cross-validated (cheap baseline); the tree ensembles race
+# fold by fold and stop once clearly behind (see _cross_validate).
 # Format: (model_class, param_dict)
 _REGRESSION_GRID: List[Tuple] = [
     # Ridge regression — fast linear baseline
@@ -84,12 +104,8 @@ _REGRESSION_GRID: List[Tuple] = [
 # Helpers
 # ---------------------------------------------------------------------------
 
-def _clean_value(v) -> float:
-    """Convert stored sensor values (incl. legacy b'...' strings) to float."""
-    try:
-        return float(str(v).replace("b'", '').replace("'", ''))
-    except (ValueError, TypeError):
-        return float('nan')
+_clean_value = _sc.clean_value
+_clean_values = _sc.clean_values
 
 
 def _add_time_features(df: pd.DataFrame, ts_col: str = 'hour_bucket') -> pd.DataFrame:
@@ -132,92 +148,288 @@ def get_sensor_dataframe(
     """Load all historical readings for one sensor and join with NOAA outdoor temp.
 
     No lookback cap — all Sensors collection records are used to maximise
-    training data.  Each reading is rounded to the nearest hour bucket;
-    multiple readings in the same hour are averaged.
+    training data.  Readings are averaged per hour bucket (server-side, see
+    _hourly_readings), so memory is bounded by the number of hours.
 
     Returns (df, noaa_coverage) where:
       df has columns: hour_bucket, sensor_value, noaa_temp_f, hour_sin,
                       hour_cos, dow_sin, dow_cos
       noaa_coverage is the fraction of rows (0.0–1.0) with valid NOAA data.
-    Returns None if fewer than _MIN_ROWS valid hour-buckets are found.
+    Returns None if fewer than _MIN_ROWS readings or valid hour-buckets are
+    found, or if the query fails.
     """
-    # --- Load all sensor readings ---
     try:
-        rows = list(db.Sensors.find(
-            {'gateway_id': gateway_id, 'node_id': str(node_id), 'type': sensor_type},
-            {'_id': 0, 'value': 1, 'time': 1},
-        ))
+        frames = get_gateway_sensor_frames(db, gateway_id, node_id=str(node_id),
+                                           types=(sensor_type,))
     except Exception as exc:
         logger.warning('MongoDB query failed for %s/%s/%s: %s',
                        gateway_id, node_id, sensor_type, exc)
         return None
+    result = frames.get((str(node_id), sensor_type))
+    if result is None:
+        logger.info('Skipping %s/%s/%s: fewer than %d rows',
+                    gateway_id, node_id, sensor_type, _MIN_ROWS)
+    return result
+
+
+# Hourly aggregate columns: per (node_id, type, hour_bucket) the number of raw
+# readings, the sum and count of parseable values, and the first parseable value.
+_HOURLY_COLUMNS = ['node_id', 'type', 'hour_bucket', 'count', 'sum', 'valid', 'first']
+
+
+def _hourly_match(gateway_id: str, node_id: Optional[str], types) -> Dict:
+    """$match for the given sensor types (of one node, or all) plus NOAA F."""
+    if node_id is None:
+        return {'gateway_id': gateway_id, 'type': {'$in': sorted(set(types) | {'F'})}}
+    return {'gateway_id': gateway_id,
+            '$or': [{'node_id': node_id, 'type': {'$in': list(types)}},
+                    {'node_id': _at._NOAA_NODE_ID, 'type': 'F'}]}
+
+
+def _hourly_pipeline(match: Dict) -> List[Dict]:
+    """$group readings into (node_id, type, hour) buckets on the server."""
+    # Older records store value as b'39.61' (Python bytes repr): strings are
+    # trimmed of b and ' first; $convert onError/onNull yields null, which
+    # $sum ignores and the 'valid' counter skips.
+    value = {'$convert': {
+        'input': {'$cond': [{'$eq': [{'$type': '$value'}, 'string']},
+                            {'$trim': {'input': '$value', 'chars': "b'"}},
+                            '$value']},
+        'to': 'double', 'onError': None, 'onNull': None,
+    }}
+    # $first is only the hour's earliest reading in time order; the sort right
+    # after $match can use the (gateway_id, ..., time) index.  Parseable and
+    # unparseable readings are grouped apart first, so 'first' is the
+    # earliest parseable value (as in the streamed fold) while 'count' still
+    # counts every reading; $max then skips the unparseable group's null.
+    return [
+        {'$match': match},
+        {'$sort': {'time': 1}},
+        {'$project': {'_id': 0, 'node_id': 1, 'type': 1, 'v': value,
+                      'hour': {'$subtract': ['$time', {'$mod': ['$time', 3600]}]}}},
+        {'$group': {
+            '_id':   {'node_id': '$node_id', 'type': '$type', 'hour': '$hour',
+                      'valid': {'$ne': ['$v', None]}},
+            'count': {'$sum': 1},
+            'sum':   {'$sum': '$v'},
+            'first': {'$first': '$v'},
+        }},
+        {'$group': {
+            '_id':   {'node_id': '$_id.node_id', 'type': '$_id.type', 'hour': '$_id.hour'},
+            'count': {'$sum': '$count'},
+            'sum':   {'$sum': '$sum'},
+            'valid': {'$sum': {'$cond': ['$_id.valid', '$count', 0]}},
+            'first': {'$max': '$first'},
+        }},
+    ]
 
-    if len(rows) < _MIN_ROWS:
-        logger.info('Skipping %s/%s/%s: only %d rows',
-                    gateway_id, node_id, sensor_type, len(rows))
-        return None
-
-    df = pd.DataFrame(rows)
-    df['value'] = df['value'].apply(_clean_value)
-    df = df.dropna(subset=['value'])
-    df['hour_bucket'] = (df['time'] // 3600).astype(int) * 3600
-
-    # One reading per hour bucket (mean)
-    df = (df.groupby('hour_bucket')['value']
-            .mean()
-            .reset_index()
-            .rename(columns={'value': 'sensor_value'}))
 
-    if len(df) < _MIN_ROWS:
-        logger.info('Skipping %s/%s/%s: only %d unique hour-buckets after dedup',
-                    gateway_id, node_id, sensor_type, len(df))
-        return None
+def _hourly_readings_streamed(db, match: Dict) -> pd.DataFrame:
+    """Client-side fallback for _hourly_readings.
 
-    # --- Load NOAA hourly records for this gateway ---
+    Used when the server cannot run the pipeline (no $convert before MongoDB
+    4.0, mongomock).  The cursor is consumed in _HOURLY_CHUNK_ROWS chunks and
+    each chunk is folded into the running hourly aggregate, so memory stays
+    bounded by hours, not readings.  Readings are read in time order, so
+    NOAA 'first' is the hour's earliest parseable value, as the server-side
+    $first after the time $sort (for the numeric NOAA values).
+    """
+    cursor = db.Sensors.find(match, {'_id': 0, 'node_id': 1, 'type': 1, 'value': 1, 'time': 1}
+                             ).sort('time', 1)
+    keys = ['node_id', 'type', 'hour_bucket']
+    agg = None
+    while True:
+        chunk = list(itertools.islice(cursor, _HOURLY_CHUNK_ROWS))
+        if not chunk:
+            break
+        df = pd.DataFrame(chunk)
+        df['node_id'] = df['node_id'].astype(str)
+        df['hour_bucket'] = (df['time'] // 3600).astype(np.int64) * 3600
+        df['v'] = _clean_values(df['value'])
+        part = df.groupby(keys, sort=False).agg(
+            count=('v', 'size'), sum=('v', 'sum'), valid=('v', 'count'), first=('v', 'first'))
+        agg = part if agg is None else (
+            pd.concat([agg, part]).groupby(level=keys, sort=False)
+              .agg({'count': 'sum', 'sum': 'sum', 'valid': 'sum', 'first': 'first'}))
+    if agg is None:
+        return pd.DataFrame(columns=_HOURLY_COLUMNS)
+    return agg.reset_index()[_HOURLY_COLUMNS]
+
+
+def _hourly_readings(db, match: Dict) -> pd.DataFrame:
+    """Return the per-(node_id, type, hour) aggregate of readings matching match.
+
+    The $group runs server-side, so one row per sensor-hour crosses the wire
+    instead of every reading.  Falls back to _hourly_readings_streamed when
+    the server rejects the pipeline.
+    """
     try:
-        noaa_rows = list(db.Sensors.find(
-            {'gateway_id': gateway_id, 'node_id': _at._NOAA_NODE_ID, 'type': 'F'},
-            {'_id': 0, 'value': 1, 'time': 1},
-        ))
-    except Exception as exc:
-        logger.warning('NOAA query failed for gateway %s: %s', gateway_id, exc)
-        noaa_rows = []
-
-    if noaa_rows:
-        noaa_df = pd.DataFrame(noaa_rows)
-        noaa_df['value'] = noaa_df['value'].apply(_clean_value)
-        noaa_df = noaa_df.dropna(subset=['value'])
-        noaa_df['hour_bucket'] = (noaa_df['time'] // 3600).astype(int) * 3600
-        noaa_df = (noaa_df.groupby('hour_bucket')['value']
-                          .first()
-                          .reset_index()
-                          .rename(columns={'value': 'noaa_temp_f'}))
-        df = df.merge(noaa_df, on='hour_bucket', how='left')
-    else:
-        df['noaa_temp_f'] = float('nan')
-
-    # --- Temporal features ---
-    df = _add_time_features(df, ts_col='hour_bucket')
-    df = df.sort_values('hour_bucket').reset_index(drop=True)
+        docs = list(db.Sensors.aggregate(_hourly_pipeline(match), allowDiskUse=True))
+    except (OperationFailure, NotImplementedError) as exc:
+        logger.info('Server-side hourly aggregation unavailable (%s); streaming readings', exc)
+        return _hourly_readings_streamed(db, match)
+    if not docs:
+        return pd.DataFrame(columns=_HOURLY_COLUMNS)
+    ids = pd.DataFrame([d['_id'] for d in docs])
+    return pd.DataFrame({
+        'node_id':     ids['node_id'].astype(str).to_numpy(),
+        'type':        ids['type'].to_numpy(),
+        'hour_bucket': ids['hour'].to_numpy(dtype=np.float64).astype(np.int64),
+        'count':       np.array([d['count'] for d in docs], dtype=np.int64),
+        'sum':         np.array([d['sum'] for d in docs], dtype=np.float64),
+        'valid':       np.array([d['valid'] for d in docs], dtype=np.int64),
+        'first':       np.array([d['first'] for d in docs], dtype=np.float64),
+    })
+
+
+def get_gateway_sensor_frames(
+    db,
+    gateway_id: str,
+    node_id: Optional[str] = None,
+    types: Tuple[str, ...] = _TYPES_TO_PREDICT,
+) -> Dict[Tuple[str, str], Optional[Tuple[pd.DataFrame, float]]]:
+    """Load every F/H sensor of a gateway (or of one node), plus NOAA.
+
+    One aggregation returns hourly readings for all sensors and the NOAA
+    history together (_hourly_readings); NOAA is joined and time features
+    are added once, and each sensor's frame is a contiguous slice of that
+    table.  Returns {(node_id, type): (df, noaa_coverage)}, or None for
+    sensors with fewer than _MIN_ROWS readings or valid hour-buckets.
+    Query errors propagate to the caller.
+    """
+    hourly = _hourly_readings(db, _hourly_match(gateway_id, node_id, types))
+    if hourly.empty:
+        return {}
+
+    is_noaa = (hourly['node_id'] == _at._NOAA_NODE_ID).to_numpy()
+    noaa = hourly[is_noaa & (hourly['type'] == 'F').to_numpy()]
+    noaa_by_hour = noaa.dropna(subset=['first']).set_index('hour_bucket')['first']
+
+    sensors = hourly[~is_noaa & hourly['type'].isin(types).to_numpy()]
+    counts = sensors.groupby(['node_id', 'type'])['count'].sum()
+    sensors = (sensors[sensors['valid'] > 0]
+               .sort_values(['node_id', 'type', 'hour_bucket'], kind='stable')
+               .reset_index(drop=True))
+    table = pd.DataFrame({
+        'hour_bucket':  sensors['hour_bucket'].to_numpy(dtype=np.int64),
+        'sensor_value': (sensors['sum'] / sensors['valid']).to_numpy(dtype=np.float64),
+    })
+    table['noaa_temp_f'] = table['hour_bucket'].map(noaa_by_hour).astype(np.float64)
+    table = _add_time_features(table, ts_col='hour_bucket')
+
+    # Sorted by (node_id, type, hour_bucket): every sensor is one row range
+    pair_codes = sensors.groupby(['node_id', 'type'], sort=True).ngroup().to_numpy()
+    starts = np.flatnonzero(np.diff(pair_codes, prepend=-1))
+    ends = np.append(starts[1:], len(table))
+    frames: Dict[Tuple[str, str], Optional[Tuple[pd.DataFrame, float]]] = {}
+    for start, end in zip(starts, ends):
+        key = (sensors['node_id'].iat[start], sensors['type'].iat[start])
+        df = table.iloc[start:end].reset_index(drop=True)
+        if counts.get(key, 0) < _MIN_ROWS or len(df) < _MIN_ROWS:
+            frames[key] = None
+            continue
+        frames[key] = (df, float(df['noaa_temp_f'].notna().mean()))
+    for key in counts.index:   # sensors whose readings were all unparseable
+        frames.setdefault(key, None)
 
-    noaa_coverage = float(df['noaa_temp_f'].notna().mean())
-    logger.info('%s/%s/%s: %d hour-buckets, NOAA coverage=%.1f%%',
-                gateway_id, node_id, sensor_type, len(df), noaa_coverage * 100)
-    return df, noaa_coverage
+    logger.info('Gateway %s: %d sensor-hours, %d NOAA hours -> %d sensor frames',
+                gateway_id, len(sensors), len(noaa_by_hour),
+                sum(f is not None for f in frames.values()))
+    return frames
 
 
 # ---------------------------------------------------------------------------
 # Training & model selection
 # ---------------------------------------------------------------------------
 
+def _fit_fold(model_cls, params: dict, X: np.ndarray, y: np.ndarray,
+              train: slice, val: slice, keep_model: bool) -> Dict:
+    """Fit one (variant, fold) pipeline; errors are returned, not raised."""
+    started = time.perf_counter()
+    try:
+        pipe = Pipeline([
+            ('scaler', StandardScaler()),
+            ('model',  model_cls(**params)),
+        ])
+        pipe.fit(X[train], y[train])
+        y_pred = pipe.predict(X[val])
+    except Exception as exc:
+        return {'error': str(exc)}
+    return {'r2':      float(r2_score(y[val], y_pred)),
+            'rmse':    float(np.sqrt(mean_squared_error(y[val], y_pred))),
+            'seconds': time.perf_counter() - started,
+            'pipe':    pipe if keep_model else None}
+
+
+def _cross_validate(X: np.ndarray, y: np.ndarray, folds: List[Tuple[slice, slice]],
+                    n_jobs: int, race: bool) -> Tuple[Dict[int, List[Dict]], Dict[int, int]]:
+    """Cross-validate _REGRESSION_GRID; return ({variant: fold fits}, pruned).
+
+    Without race every (variant, fold) fit is dispatched at once.  With race,
+    the Ridge variants are fully cross-validated first as a cheap baseline,
+    then the remaining variants are evaluated one fold at a time (in
+    parallel across variants).  After _RACE_MIN_FOLDS folds, a variant whose
+    running mean R² is more than _RACE_TOLERANCE below the best running mean
+    over the same folds (Ridge baselines included) is dropped; pruned maps
+    it to the number of folds it completed.  Because later folds train on
+    more data, dropped variants skip the most expensive fits.
+    """
+    last = len(folds) - 1
+    by_variant: Dict[int, List[Dict]] = {v: [] for v in range(len(_REGRESSION_GRID))}
+
+    def run(tasks):
+        fits = Parallel(n_jobs=n_jobs)(
+            delayed(_fit_fold)(*_REGRESSION_GRID[variant], X, y, *folds[fold],
+                               _model_store.COMPACT_ENABLED and fold == last)
+            for variant, fold in tasks)
+        for (variant, _), fit in zip(tasks, fits):
+            by_variant[variant].append(fit)
+
+    if not race:
+        run([(v, f) for v in by_variant for f in range(len(folds))])
+        return by_variant, {}
+
+    baseline = [v for v, (cls, _) in enumerate(_REGRESSION_GRID) if cls is Ridge]
+    run([(v, f) for v in baseline for f in range(len(folds))])
+
+    pruned: Dict[int, int] = {}
+    alive = [v for v in by_variant if v not in baseline]
+    for fold in range(len(folds)):
+        if not alive:
+            break
+        run([(v, fold) for v in alive])
+        alive = [v for v in alive if 'error' not in by_variant[v][-1]]
+        if not alive or fold + 1 < _RACE_MIN_FOLDS:
+            continue
+        running = {v: np.mean([fit['r2'] for fit in fits[:fold + 1]])
+                   for v, fits in by_variant.items()
+                   if len(fits) > fold and not any('error' in fit for fit in fits)}
+        leader = max(running.values())
+        for v in [v for v in alive if running[v] < leader - _RACE_TOLERANCE]:
+            pruned[v] = fold + 1
+            alive.remove(v)
+    return by_variant, pruned
+
+
 def train_regression_for_sensor(
     df: pd.DataFrame,
     noaa_coverage: float,
+    n_jobs: Optional[int] = None,
+    race: bool = True,
 ) -> Tuple[Pipeline, str, dict, float, float, List[str], float]:
     """Train all hyperparameter variants and return the best pipeline.
 
     Uses TimeSeriesSplit CV to preserve temporal ordering.  The variant with
-    the highest mean R² across folds is refitted on the full dataset.
+    the highest mean R² across folds is refitted on the full dataset.  The
+    (variant, fold) fits run on a joblib pool of n_jobs workers (default
+    REGRESSION_CV_JOBS); each variant's total fit time is recorded in
+    pipeline.cv_seconds_.  With race, losing variants are abandoned early
+    (see _cross_validate) and listed with their fit time in
+    pipeline.cv_pruned_.  With MODEL_COMPACT=1, tree ensembles are
+    compacted: the tree count is chosen on the winner's last-fold model
+    against that fold's holdout, applied to the refitted pipeline and kept
+    only if the refit still scores within _COMPACT_TOLERANCE on that holdout
+    (report in pipeline.compaction_).
 
     Returns:
         (pipeline, model_name, best_params, mean_r2, mean_rmse,
@@ -235,34 +447,39 @@ def train_regression_for_sensor(
     if has_noaa:
         X['noaa_temp_f'] = X['noaa_temp_f'].fillna(noaa_mean)
 
-    tscv = TimeSeriesSplit(n_splits=_CV_SPLITS)
-    results = {}
+    # One contiguous float matrix for every fold; TimeSeriesSplit folds are
+    # contiguous index ranges, so each fold is a slice (a view, not a copy).
+    X_arr = np.ascontiguousarray(X.to_numpy(dtype=np.float64))
+    folds = [(slice(0, train_idx[-1] + 1), slice(val_idx[0], val_idx[-1] + 1))
+             for train_idx, val_idx in TimeSeriesSplit(n_splits=_CV_SPLITS).split(X_arr)]
+
+    by_variant, pruned = _cross_validate(
+        X_arr, y, folds, _CV_JOBS if n_jobs is None else n_jobs, race)
 
-    for model_cls, params in _REGRESSION_GRID:
+    results, pruned_seconds = {}, {}
+    for variant, (model_cls, params) in enumerate(_REGRESSION_GRID):
         variant_key = f'{model_cls.__name__}_{json.dumps(params, sort_keys=True)}'
-        cv_r2s, cv_rmses = [], []
-        try:
-            for train_idx, val_idx in tscv.split(X):
-                X_tr,  X_val  = X.iloc[train_idx], X.iloc[val_idx]
-                y_tr,  y_val  = y[train_idx],       y[val_idx]
-                pipe = Pipeline([
-                    ('scaler', StandardScaler()),
-                    ('model',  model_cls(**params)),
-                ])
-                pipe.fit(X_tr, y_tr)
-                y_pred = pipe.predict(X_val)
-                cv_r2s.append(float(r2_score(y_val, y_pred)))
-                cv_rmses.append(float(np.sqrt(mean_squared_error(y_val, y_pred))))
-
-            mean_r2   = float(np.mean(cv_r2s))
-            mean_rmse = float(np.mean(cv_rmses))
-            results[variant_key] = {
-                'model_cls': model_cls, 'params': params,
-                'mean_r2':   mean_r2,   'mean_rmse': mean_rmse,
-            }
-            logger.info('  %-65s R²=%+.4f  RMSE=%.4f', variant_key, mean_r2, mean_rmse)
-        except Exception as exc:
-            logger.warning('  Variant %s failed: %s', variant_key, exc)
+        variant_fits = by_variant[variant]
+        errors = [fit['error'] for fit in variant_fits if 'error' in fit]
+        if errors:
+            logger.warning('  Variant %s failed: %s', variant_key, errors[0])
+            continue
+        if variant in pruned:
+            seconds = sum(fit['seconds'] for fit in variant_fits)
+            pruned_seconds[variant_key] = round(seconds, 3)
+            logger.info('  %-65s pruned after %d fold(s)  %.2fs',
+                        variant_key, len(variant_fits), seconds)
+            continue
+        mean_r2   = float(np.mean([fit['r2'] for fit in variant_fits]))
+        mean_rmse = float(np.mean([fit['rmse'] for fit in variant_fits]))
+        seconds   = float(sum(fit['seconds'] for fit in variant_fits))
+        results[variant_key] = {
+            'model_cls': model_cls, 'params': params,
+            'mean_r2':   mean_r2,   'mean_rmse': mean_rmse,
+            'seconds':   seconds,
+            'last_fold': (variant_fits[-1]['pipe'], X_arr[folds[-1][1]], y[folds[-1][1]]),
+        }
+        logger.info('  %-65s R²=%+.4f  RMSE=%.4f  %.2fs', variant_key, mean_r2, mean_rmse, seconds)
 
     if not results:
         raise RuntimeError('All regression variants failed during cross-validation')
@@ -279,6 +496,33 @@ def train_regression_for_sensor(
         ('model',  best['model_cls'](**best['params'])),
     ])
     final_pipe.fit(X, y)
+    final_pipe.cv_seconds_ = {key: round(r['seconds'], 3) for key, r in results.items()}
+    final_pipe.cv_pruned_ = pruned_seconds
+
+    if _model_store.COMPACT_ENABLED:
+        fold_pipe, X_val, y_val = best['last_fold']
+        _, report = _model_store.compact_ensemble(
+            fold_pipe, lambda p: r2_score(y_val, p.predict(X_val)), _COMPACT_TOLERANCE)
+        if report['applied']:
+            # The tree count was chosen on the fold model; re-score the refitted
+            # pipeline on the same holdout before shipping it, and keep it only
+            # if it holds both the uncompacted refit's R² and the CV R² that
+            # goes into the metadata.
+            compacted = _model_store.apply_compaction(final_pipe, report)
+            X_hold = X.iloc[folds[-1][1]]
+            full_r2 = float(r2_score(y_val, final_pipe.predict(X_hold)))
+            compact_r2 = float(r2_score(y_val, compacted.predict(X_hold)))
+            report.update(final_score_before=round(full_r2, 4),
+                          final_score_after=round(compact_r2, 4))
+            if compact_r2 < max(full_r2, best['mean_r2']) - _COMPACT_TOLERANCE:
+                logger.info('Rejected compaction of %s: refit holdout R² %.4f -> %.4f '
+                            '(CV R² %.4f)', model_display_name, full_r2, compact_r2,
+                            best['mean_r2'])
+            else:
+                final_pipe, final_pipe.compaction_ = compacted, report
+                logger.info('Compacted %s: %d -> %d trees (last-fold R² %.4f -> %.4f)',
+                            model_display_name, report['trees_before'], report['trees_after'],
+                            report['score_before'], report['score_after'])
 
     return (
         final_pipe, model_display_name, best['params'],
@@ -300,7 +544,10 @@ def save_regression_model(
     reg_dir = _regression_dir(gateway_id, models_dir)
     os.makedirs(reg_dir, exist_ok=True)
 
-    joblib.dump(pipeline, _model_path(gateway_id, node_id, sensor_type, models_dir))
+    # save_artifact writes then renames so workers with the old artifact
+    # memory-mapped keep a valid mapping until they reload.
+    artifact = _model_store.save_artifact(
+        pipeline, _model_path(gateway_id, node_id, sensor_type, models_dir), verify=True)
 
     meta = {
         'node_id':         node_id,
@@ -314,25 +561,62 @@ def save_regression_model(
         'noaa_mean':       noaa_mean,
         'num_rows':        num_rows,
         'trained_at':      time.time(),
+        'artifact':        artifact,
     }
+    if getattr(pipeline, 'cv_seconds_', None):
+        meta['variant_seconds'] = pipeline.cv_seconds_
+    if getattr(pipeline, 'cv_pruned_', None):
+        meta['pruned_variants'] = pipeline.cv_pruned_
+    if getattr(pipeline, 'compaction_', None):
+        meta['compaction'] = pipeline.compaction_
     with open(_meta_path(gateway_id, node_id, sensor_type, models_dir), 'w') as f:
         json.dump(meta, f)
+    _model_cache.cache.bump_version((str(gateway_id), str(node_id), sensor_type))
 
-    logger.info('Saved regression model %s/%s/%s: %s R²=%.4f RMSE=%.4f rows=%d',
-                gateway_id, node_id, sensor_type, model_name, r2, rmse, num_rows)
+    logger.info('Saved regression model %s/%s/%s: %s R²=%.4f RMSE=%.4f rows=%d '
+                '(%.1f KB, load %.3fs)', gateway_id, node_id, sensor_type, model_name,
+                r2, rmse, num_rows, artifact['size_bytes'] / 1024, artifact['load_seconds'])
 
 
 def load_regression_model(
     gateway_id: str, node_id: str, sensor_type: str,
     models_dir: str = MODELS_DIR,
+    mmap_mode: Optional[str] = None,
+    verify: bool = False,
 ) -> Tuple[Pipeline, dict]:
-    """Load (pipeline, metadata). Raises FileNotFoundError if absent."""
-    pipeline = joblib.load(_model_path(gateway_id, node_id, sensor_type, models_dir))
+    """Load (pipeline, metadata). Raises FileNotFoundError if absent.
+
+    mmap_mode is ignored for compressed artifacts. With verify the artifact's
+    sha256 is checked against the metadata (ValueError on mismatch).
+    """
     with open(_meta_path(gateway_id, node_id, sensor_type, models_dir)) as f:
         metadata = json.load(f)
+    pipeline = _model_store.load_artifact(
+        _model_path(gateway_id, node_id, sensor_type, models_dir),
+        metadata.get('artifact'), mmap_mode=mmap_mode, verify=verify)
     return pipeline, metadata
 
 
+def load_cached_regression_model(
+    gateway_id: str, node_id: str, sensor_type: str,
+    models_dir: str = MODELS_DIR,
+) -> Tuple[Pipeline, dict]:
+    """Load (pipeline, metadata) through the per-worker model cache.
+
+    Arrays are memory-mapped on load, and a miss checks the artifact's
+    content hash. Raises FileNotFoundError if absent and ValueError if the
+    hash does not match (nothing is cached, so the next call retries).
+    """
+    return _model_cache.cache.get(
+        (str(gateway_id), str(node_id), sensor_type),
+        [_model_path(gateway_id, node_id, sensor_type, models_dir),
+         _meta_path(gateway_id, node_id, sensor_type, models_dir)],
+        lambda: load_regression_model(gateway_id, node_id, sensor_type, models_dir,
+                                      mmap_mode='r', verify=True),
+        size_of=lambda loaded: _model_store.resident_bytes(loaded[0], loaded[1].get('artifact')),
+    )
+
+
 def regression_model_exists(
     gateway_id: str,
     node_id: Optional[str] = None,
@@ -379,7 +663,8 @@ def train_regression_for_gateway(
 
     Uses all available historical sensor data (no lookback cap).  If NOAA is
     configured for the gateway, backfills _NOAA_BACKFILL_DAYS of observations
-    first so outdoor temp is available as a predictor feature.
+    first so outdoor temp is available as a predictor feature.  All sensors
+    and the NOAA history are then loaded once (get_gateway_sensor_frames).
     """
     # Backfill NOAA history if enabled for this gateway
     noaa_doc = db.NOAASettings.find_one({'gateway_id': gateway_id, 'enabled': True})
@@ -389,22 +674,17 @@ def train_regression_for_gateway(
         _at._backfill_noaa_history(
             db, gateway_id,
             float(noaa_doc['lat']), float(noaa_doc['lon']),
-            _NOAA_BACKFILL_DAYS,
+            _NOAA_BACKFILL_DAYS, models_dir,
         )
 
-    # Discover all unique (node_id, type) pairs present in the Sensors collection
+    # One query for every F/H sensor and the NOAA history
     try:
-        agg = list(db.Sensors.aggregate([
-            {'$match': {'gateway_id': gateway_id,
-                        'type': {'$in': list(_TYPES_TO_PREDICT)},
-                        'node_id': {'$ne': _at._NOAA_NODE_ID}}},
-            {'$group': {'_id': {'node_id': '$node_id', 'type': '$type'}}},
-        ]))
+        frames = get_gateway_sensor_frames(db, gateway_id)
     except Exception as exc:
-        logger.error('Aggregation failed for gateway %s: %s', gateway_id, exc)
+        logger.error('Loading sensors failed for gateway %s: %s', gateway_id, exc)
         return [{'gateway_id': gateway_id, 'status': 'failed', 'error': str(exc)}]
 
-    pairs = [(doc['_id']['node_id'], doc['_id']['type']) for doc in agg]
+    pairs = list(frames)
 
     if not pairs:
         logger.info('Gateway %s: no eligible (node, type) pairs found', gateway_id)
@@ -416,7 +696,7 @@ def train_regression_for_gateway(
 
     all_results = []
     for node_id, sensor_type in pairs:
-        result = get_sensor_dataframe(db, gateway_id, node_id, sensor_type)
+        result = frames[(node_id, sensor_type)]
         if result is None:
             all_results.append({
                 'gateway_id': gateway_id, 'node_id': node_id,
@@ -465,6 +745,175 @@ def train_regression_for_gateway(
 # Forecasting
 # ---------------------------------------------------------------------------
 
+_FORECAST_COLLECTION = 'RegressionForecasts'
+
+
+def _noaa_forecast_rows(db, gateway_id: str, now_ts: float, hours: int) -> List[dict]:
+    """Raw NOAA forecast documents (value, time) between now and now + hours."""
+    try:
+        return list(db.Sensors.find(
+            {'gateway_id': gateway_id, 'node_id': _at._NOAA_NODE_ID,
+             'type': 'F', 'time': {'$gte': now_ts, '$lte': now_ts + hours * 3600}},
+            {'_id': 0, 'value': 1, 'time': 1},
+        ))
+    except Exception as exc:
+        logger.warning('NOAA forecast query failed: %s', exc)
+        return []
+
+
+def _noaa_forecast_features(noaa_rows: List[dict]) -> Optional[pd.DataFrame]:
+    """Hourly NOAA forecast frame (hour_bucket, noaa_temp_f + time features).
+
+    Returns None when there are no forecast records.
+    """
+    if not noaa_rows:
+        return None
+    noaa_df = pd.DataFrame(noaa_rows)
+    noaa_df['value'] = _clean_values(noaa_df['value'])
+    noaa_df = noaa_df.dropna(subset=['value'])
+    noaa_df['hour_bucket'] = (noaa_df['time'] // 3600).astype(int) * 3600
+    feat_df = (noaa_df.groupby('hour_bucket')['value']
+                      .first()
+                      .reset_index()
+                      .rename(columns={'value': 'noaa_temp_f'}))
+    return _add_time_features(feat_df)
+
+
+def _synthetic_features(now_ts: float, hours: int) -> pd.DataFrame:
+    """Hourly timestamps from the next full hour, with time features only."""
+    start_bucket = int(now_ts // 3600 + 1) * 3600
+    feat_df = pd.DataFrame({'hour_bucket': start_bucket + 3600 * np.arange(hours, dtype=np.int64)})
+    return _add_time_features(feat_df)
+
+
+def _forecast_with(pipeline: Pipeline, meta: dict, noaa_feat: Optional[pd.DataFrame],
+                   synthetic_feat: pd.DataFrame) -> List[dict]:
+    """Run one pipeline over the shared forecast feature frames.
+
+    Models trained with NOAA use the NOAA forecast frame when there is one;
+    otherwise the synthetic frame is used with noaa_temp_f at the training mean.
+    """
+    feature_cols = meta.get('feature_columns', [])
+    noaa_mean    = meta.get('noaa_mean', 0.0)
+    if meta.get('has_noaa', False) and noaa_feat is not None:
+        feat_df = noaa_feat
+    else:
+        feat_df = synthetic_feat
+    if feat_df.empty:
+        return []
+
+    # Every training feature must be present; missing ones get noaa_mean / 0
+    X = pd.DataFrame({col: (feat_df[col] if col in feat_df.columns
+                            else (noaa_mean if col == 'noaa_temp_f' else 0.0))
+                      for col in feature_cols}, index=feat_df.index).fillna(noaa_mean)
+    predictions = np.round(pipeline.predict(X), 2)
+    timestamps = feat_df['hour_bucket'].to_numpy(dtype=np.float64)
+    return [{'timestamp': ts, 'predicted': pred}
+            for ts, pred in zip(timestamps.tolist(), predictions.tolist())]
+
+
+# ---------------------------------------------------------------------------
+# Forecast cache
+#
+# Forecasts are materialized in the RegressionForecasts collection, one
+# document per (gateway, node, type, hours). A document is valid while its
+# fingerprint matches the current inputs — the NOAA forecast documents in
+# range (or, for time-only models, the first forecast hour) — and its
+# trained_at matches the model's, so requests are a cache read until a new
+# NOAA batch lands or the model is retrained. forecast_refresher.py recomputes
+# stale documents in the background for the default horizon and for
+# horizons read within _FORECAST_IDLE_SECS (read_at, updated at most every
+# _FORECAST_TOUCH_SECS); a TTL index on read_at drops unread documents.
+# ---------------------------------------------------------------------------
+
+def _utc(ts: float) -> datetime.datetime:
+    """Naive UTC datetime of a timestamp, as stored in BSON dates (TTL index)."""
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).replace(tzinfo=None)
+
+
+class _ForecastInputs:
+    """NOAA rows and feature frames for one gateway at one point in time."""
+
+    def __init__(self, db, gateway_id: str, hours: int, need_noaa: bool,
+                 now_ts: Optional[float] = None):
+        now_ts = time.time() if now_ts is None else now_ts
+        self.noaa_rows = _noaa_forecast_rows(db, gateway_id, now_ts, hours) if need_noaa else []
+        self.start_bucket = int(now_ts // 3600 + 1) * 3600
+        self._now_ts = now_ts
+        self._hours = hours
+        self._noaa_feat = self._synthetic_feat = None
+
+        digest = hashlib.sha1(f'{hours}:{self.start_bucket}'.encode())
+        self.synthetic_fingerprint = digest.hexdigest()
+        for row in sorted(self.noaa_rows, key=lambda r: r['time']):
+            digest.update(f"|{row['time']}={row['value']}".encode())
+        self.noaa_fingerprint = digest.hexdigest() if self.noaa_rows else None
+
+    def fingerprint(self, meta: dict) -> str:
+        if meta.get('has_noaa', False) and self.noaa_fingerprint:
+            return self.noaa_fingerprint
+        return self.synthetic_fingerprint
+
+    def forecast(self, pipeline: Pipeline, meta: dict) -> List[dict]:
+        if self._synthetic_feat is None:
+            self._noaa_feat = _noaa_forecast_features(self.noaa_rows)
+            self._synthetic_feat = _synthetic_features(self._now_ts, self._hours)
+        return _forecast_with(pipeline, meta, self._noaa_feat, self._synthetic_feat)
+
+
+def _cached_forecasts(db, gateway_id: str, models: List[Tuple[str, str, Pipeline, dict]],
+                      hours: int, now_ts: Optional[float] = None,
+                      touch: bool = True) -> Tuple[List[List[dict]], int]:
+    """Forecasts for models [(node_id, type, pipeline, meta)] through the cache.
+
+    Reads every cached document for the gateway with one query, recomputes
+    only those whose fingerprint or trained_at no longer match and writes
+    them back with one bulk_write. With touch (requests, not the refresher)
+    documents record the read in read_at. Returns (forecasts, recomputed count).
+    """
+    inputs = _ForecastInputs(db, gateway_id, hours,
+                             any(meta.get('has_noaa', False) for *_, meta in models), now_ts)
+    col = db[_FORECAST_COLLECTION]
+    try:
+        cached = {(doc['node_id'], doc['type']): doc for doc in col.find(
+            {'gateway_id': gateway_id, 'hours': hours},
+            {'_id': 0, 'node_id': 1, 'type': 1, 'fingerprint': 1, 'trained_at': 1,
+             'forecast': 1, 'read_at': 1})}
+    except Exception as exc:
+        logger.warning('Forecast cache read failed for %s: %s', gateway_id, exc)
+        cached = {}
+
+    read_at = _utc(time.time())
+    touch_before = read_at - datetime.timedelta(seconds=_FORECAST_TOUCH_SECS)
+    results, ops, recomputed = [], [], 0
+    for node_id, sensor_type, pipeline, meta in models:
+        fingerprint = inputs.fingerprint(meta)
+        key = {'gateway_id': gateway_id, 'node_id': node_id, 'type': sensor_type, 'hours': hours}
+        doc = cached.get((node_id, sensor_type))
+        if (doc is not None and doc.get('fingerprint') == fingerprint
+                and doc.get('trained_at') == meta.get('trained_at')):
+            results.append(doc['forecast'])
+            if touch and (doc.get('read_at') is None or doc['read_at'] < touch_before):
+                ops.append(UpdateOne(key, {'$set': {'read_at': read_at}}))
+            continue
+        forecast = inputs.forecast(pipeline, meta)
+        results.append(forecast)
+        update = {'$set': {'fingerprint': fingerprint, 'trained_at': meta.get('trained_at'),
+                           'forecast': forecast, 'computed_at': time.time()}}
+        if touch:
+            update['$set']['read_at'] = read_at
+        else:
+            update['$setOnInsert'] = {'read_at': read_at}
+        ops.append(UpdateOne(key, update, upsert=True))
+        recomputed += 1
+    if ops:
+        try:
+            col.bulk_write(ops, ordered=False)
+        except Exception as exc:
+            logger.warning('Forecast cache write failed for %s: %s', gateway_id, exc)
+    return results, recomputed
+
+
 def predict_sensor_forecast(
     gateway_id: str,
     node_id: str,
@@ -477,68 +926,97 @@ def predict_sensor_forecast(
 
     Returns [{'timestamp': float, 'predicted': float}, ...] — one entry per
     forecast hour found in the Sensors collection (or per synthetic hour if
-    the model was trained without NOAA).  Empty list if no model exists.
+    the model was trained without NOAA, or no forecast records exist).
+    Served from the RegressionForecasts cache while its inputs are unchanged.
+    Empty list if no model exists.
     """
-    if not regression_model_exists(gateway_id, node_id, sensor_type, models_dir):
+    try:
+        pipeline, meta = load_cached_regression_model(
+            gateway_id, node_id, sensor_type, models_dir)
+    except FileNotFoundError:
         return []
+    (forecast,), _ = _cached_forecasts(
+        db, gateway_id, [(str(node_id), sensor_type, pipeline, meta)], hours)
+    return forecast
 
-    pipeline, meta = load_regression_model(gateway_id, node_id, sensor_type, models_dir)
-    has_noaa     = meta.get('has_noaa', False)
-    feature_cols = meta.get('feature_columns', [])
-    noaa_mean    = meta.get('noaa_mean', 0.0)
 
-    now_ts = time.time()
-    cutoff = now_ts + hours * 3600
+def list_regression_sensors(gateway_id: str,
+                            models_dir: str = MODELS_DIR) -> List[Tuple[str, str]]:
+    """Return the (node_id, type) pairs with a saved regression model."""
+    reg_dir = _regression_dir(gateway_id, models_dir)
+    if not os.path.isdir(reg_dir):
+        return []
+    return sorted(tuple(fname[:-len('.joblib')].rsplit('_', 1))
+                  for fname in os.listdir(reg_dir)
+                  if fname.endswith('.joblib') and '_' in fname)
+
 
-    if has_noaa:
-        # Attempt to use real NOAA forecast records
+def _load_gateway_models(gateway_id: str,
+                         models_dir: str) -> List[Tuple[str, str, Pipeline, dict]]:
+    models = []
+    for node_id, sensor_type in list_regression_sensors(gateway_id, models_dir):
         try:
-            noaa_rows = list(db.Sensors.find(
-                {'gateway_id': gateway_id, 'node_id': _at._NOAA_NODE_ID,
-                 'type': 'F', 'time': {'$gte': now_ts, '$lte': cutoff}},
-                {'_id': 0, 'value': 1, 'time': 1},
-            ))
-        except Exception as exc:
-            logger.warning('NOAA forecast query failed: %s', exc)
-            noaa_rows = []
-
-        if noaa_rows:
-            noaa_df = pd.DataFrame(noaa_rows)
-            noaa_df['value'] = noaa_df['value'].apply(_clean_value)
-            noaa_df = noaa_df.dropna(subset=['value'])
-            noaa_df['hour_bucket'] = (noaa_df['time'] // 3600).astype(int) * 3600
-            feat_df = (noaa_df.groupby('hour_bucket')['value']
-                              .first()
-                              .reset_index()
-                              .rename(columns={'value': 'noaa_temp_f'}))
-            feat_df = _add_time_features(feat_df)
-        else:
-            # Fall back: time-only features, fill noaa_temp_f with training mean
-            logger.info('No NOAA forecast records for %s; using time features + mean',
-                        gateway_id)
-            has_noaa = False  # reuse synthetic path below
-
-    if not has_noaa:
-        # Generate synthetic hourly timestamps from now to cutoff
-        start_bucket = int(now_ts // 3600 + 1) * 3600
-        timestamps = [start_bucket + i * 3600 for i in range(hours)]
-        feat_df = pd.DataFrame({'hour_bucket': timestamps})
-        feat_df = _add_time_features(feat_df)
-        if 'noaa_temp_f' in feature_cols:
-            feat_df['noaa_temp_f'] = noaa_mean
+            pipeline, meta = load_cached_regression_model(
+                gateway_id, node_id, sensor_type, models_dir)
+        except (FileNotFoundError, ValueError) as exc:
+            logger.warning('Skipping regression model %s/%s/%s: %s',
+                           gateway_id, node_id, sensor_type, exc)
+            continue
+        models.append((node_id, sensor_type, pipeline, meta))
+    return models
 
-    if feat_df.empty:
-        return []
 
-    # Ensure every training feature is present; fill any missing with noaa_mean
-    for col in feature_cols:
-        if col not in feat_df.columns:
-            feat_df[col] = noaa_mean if col == 'noaa_temp_f' else 0.0
+def predict_gateway_forecasts(
+    gateway_id: str,
+    db,
+    hours: int = 48,
+    models_dir: str = MODELS_DIR,
+) -> List[dict]:
+    """Forecast every sensor of a gateway that has a regression model.
 
-    X = feat_df[feature_cols].fillna(noaa_mean)
-    predictions = pipeline.predict(X)
+    The NOAA forecast is queried once (only if some model uses it) and
+    cached forecasts are read with one query; only stale ones are recomputed,
+    over feature frames built once for all pipelines.  Returns one entry per
+    model: {'node_id', 'type', 'model_type', 'r2', 'forecast': [...]}.
+    """
+    models = _load_gateway_models(gateway_id, models_dir)
+    if not models:
+        return []
+    forecasts, _ = _cached_forecasts(db, gateway_id, models, hours)
+    return [{'node_id':    node_id,
+             'type':       sensor_type,
+             'model_type': meta.get('model_type'),
+             'r2':         meta.get('r2'),
+             'forecast':   forecast}
+            for (node_id, sensor_type, _, meta), forecast in zip(models, forecasts)]
+
+
+def refresh_cached_forecasts(db, models_dir: str = MODELS_DIR, hours: int = 48) -> int:
+    """Recompute stale RegressionForecasts documents; return how many changed.
+
+    Covers the default horizon for every gateway with regression models plus
+    every (gateway, hours) combination in the cache that was read within
+    _FORECAST_IDLE_SECS, so forecasts stay warm as NOAA batches arrive and
+    models are retrained. Documents for models that no longer exist are
+    removed; unread ones expire through the TTL index on read_at.
+    """
+    col = db[_FORECAST_COLLECTION]
+    col.create_index([('gateway_id', 1), ('node_id', 1), ('type', 1), ('hours', 1)], unique=True)
+    col.create_index('read_at', expireAfterSeconds=_FORECAST_TTL_SECS)
+    targets = {(gw, hours) for gw in (os.listdir(models_dir) if os.path.isdir(models_dir) else [])
+               if list_regression_sensors(gw, models_dir)}
+    read_since = _utc(time.time() - _FORECAST_IDLE_SECS)
+    targets.update((key['_id']['gateway_id'], key['_id']['hours']) for key in col.aggregate([
+        {'$match': {'read_at': {'$gte': read_since}}},
+        {'$group': {'_id': {'gateway_id': '$gateway_id', 'hours': '$hours'}}}]))
+
+    recomputed = 0
+    for gateway_id, gw_hours in sorted(targets):
+        models = _load_gateway_models(gateway_id, models_dir)
+        present = [{'node_id': node_id, 'type': sensor_type} for node_id, sensor_type, *_ in models]
+        col.delete_many({'gateway_id': gateway_id, 'hours': gw_hours, '$nor': present}
+                        if present else {'gateway_id': gateway_id, 'hours': gw_hours})
+        if models:
+            recomputed += _cached_forecasts(db, gateway_id, models, gw_hours, touch=False)[1]
+    return recomputed
 
-    return [
-        {'timestamp': float(row['hour_bucket']), 'predicted': round(float(pred), 2)}
-        for (_, row), pred in zip(feat_df.iterrows(), predictions)
-    ]
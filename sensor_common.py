@@ -0,0 +1,31 @@
+"""
+sensor_common.py — Value parsing and names shared by the modules reading Sensors.
+
+Sensor values are stored as numbers or, for older gateways, as legacy
+b'...' strings; clean_value / clean_values turn either into floats (NaN when
+unparseable).  Modules that fold readings client-side read their cursors in
+CHUNK_ROWS chunks.
+"""
+
+import numpy as np
+import pandas as pd
+
+NOAA_NODE_ID         = 'noaa_forecast'   # node_id of stored NOAA forecast readings
+BASELINES_COLLECTION = 'Baselines'       # hourly baseline buckets (baselines.py)
+CHUNK_ROWS           = 200_000           # readings per chunk when folding a cursor client-side
+
+
+def clean_value(v) -> float:
+    """Convert stored sensor values (incl. legacy b'...' strings) to float."""
+    try:
+        return float(str(v).replace("b'", '').replace("'", ''))
+    except (ValueError, TypeError):
+        return float('nan')
+
+
+def clean_values(values: pd.Series) -> np.ndarray:
+    """Vectorized clean_value: parse stored values (incl. b'...' strings) to float."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.float64)
+    text = values.astype(str).str.replace("b'", '', regex=False).str.replace("'", '', regex=False)
+    return pd.to_numeric(text, errors='coerce').to_numpy(dtype=np.float64)
@@ -19,7 +19,11 @@ import datetime as dt
 import base64
 load_dotenv()
 
+import alerts as _alerts
 import anomaly_training as _at
+import baseline_deviation as _bd
+import baselines as _bl
+import daily_summaries as _ds
 import regression_training as _rt
 
 # ---------------------------------------------------------------------------
@@ -635,13 +639,16 @@ def predict_anomaly():
     if not gateway_id or not node_id:
         return json.dumps({'error': 'gateway_id and node_id required'}), 400
 
-    if not _at.model_exists(gateway_id):
-        return json.dumps({'error': 'no model trained yet for this gateway'}), 404
-
     try:
-        model, metadata = _at.load_model(gateway_id)
+        model, metadata = _at.load_cached_model(gateway_id)
     except FileNotFoundError:
-        return json.dumps({'error': 'model files not found'}), 404
+        return json.dumps({'error': 'no model trained yet for this gateway'}), 404
+
+    # Fast path: range query over the scores materialized after training
+    start_ts = time.time() - period_days * 86400
+    anomalous_ts = _at.query_anomaly_scores(db, gateway_id, metadata, start_ts, node_id)
+    if anomalous_ts is not None:
+        return json.dumps({'anomalous_timestamps': anomalous_ts})
 
     feature_columns = metadata.get('feature_columns', [])
 
@@ -735,20 +742,37 @@ def regression_model_status():
     return json.dumps({'models': metas})
 
 
+_FORECAST_HOURS_ERROR = f'hours must be an integer from 1 to {_rt.MAX_FORECAST_HOURS}'
+
+
+def _forecast_hours():
+    """The forecast horizon of the request (default 48), or None if invalid.
+
+    Every distinct horizon is a separate RegressionForecasts document the
+    refresher keeps warm, so only 1..MAX_FORECAST_HOURS are accepted.
+    """
+    try:
+        hours = int(request.args.get('hours', '48'))
+    except (ValueError, TypeError):
+        return None
+    return hours if 1 <= hours <= _rt.MAX_FORECAST_HOURS else None
+
+
 @app.route('/regression_forecast', methods=['GET'])
 def regression_forecast():
     gateway_id  = request.args.get('gateway_id', '')
     node_id     = request.args.get('node_id', '')
     sensor_type = request.args.get('type', 'F')
-    try:
-        hours = int(request.args.get('hours', '48'))
-    except (ValueError, TypeError):
-        hours = 48
+    hours       = _forecast_hours()
 
     if not gateway_id or not node_id:
         return json.dumps({'error': 'gateway_id and node_id required'}), 400
+    if hours is None:
+        return json.dumps({'error': _FORECAST_HOURS_ERROR}), 400
 
-    if not _rt.regression_model_exists(gateway_id, node_id, sensor_type):
+    try:
+        _rt.load_cached_regression_model(gateway_id, node_id, sensor_type)
+    except FileNotFoundError:
         return json.dumps({'error': 'no regression model trained for this sensor'}), 404
 
     forecast = _rt.predict_sensor_forecast(
@@ -756,6 +780,19 @@ def regression_forecast():
     return json.dumps({'forecast': forecast})
 
 
+@app.route('/regression_forecasts/<gw>', methods=['GET'])
+def regression_forecasts(gw):
+    """Forecasts for every sensor of the gateway with a regression model."""
+    hours = _forecast_hours()
+    if hours is None:
+        return json.dumps({'error': _FORECAST_HOURS_ERROR}), 400
+
+    forecasts = _rt.predict_gateway_forecasts(gw, db, hours=hours)
+    if not forecasts:
+        return json.dumps({'error': 'no regression models trained for this gateway'}), 404
+    return json.dumps({'forecasts': forecasts})
+
+
 # ---------------------------------------------------------------------------
 # Alert Rules & Device Tokens
 # ---------------------------------------------------------------------------
@@ -783,6 +820,7 @@ def create_alert_rule():
     body.pop('_id', None)
     db.AlertRules.insert_one(body)
     body.pop('_id', None)
+    _alerts.bump_rules_version(db)
     print(f'[AlertRules] POST — inserted rule_id={body.get("rule_id")}, label={body.get("label")!r}')
     return json.dumps(body), 201
 
@@ -800,6 +838,7 @@ def update_alert_rule(rule_id):
     )
     if result.matched_count == 0:
         return json.dumps({'error': 'not found or not yours'}), 404
+    _alerts.bump_rules_version(db)
     return json.dumps({'updated': True})
 
 
@@ -811,6 +850,7 @@ def delete_alert_rule(rule_id):
     )
     if result.deleted_count == 0:
         return json.dumps({'error': 'not found or not yours'}), 404
+    _alerts.bump_rules_version(db)
     return json.dumps({'deleted': True})
 
 
@@ -841,71 +881,32 @@ def compute_baseline():
     node_id    = body.get('node_id', '')
     sensor_type = body.get('type', 'F')
     days       = int(body.get('days', 30))
+    tz         = _bl.resolve_timezone(body.get('timezone'))
 
     if not gateway_id or not node_id:
         return json.dumps({'error': 'gateway_id and node_id required'}), 400
+    if tz is None:
+        return json.dumps({'error': 'unknown timezone'}), 400
 
-    cutoff_unix = int(dt.datetime.utcnow().timestamp()) - days * 86400
-
-    # Some older records have value stored as b'39.61' (Python bytes repr).
-    # $trim strips the b and ' characters from both ends before conversion;
-    # $convert onError:null silently skips any remaining unparseable values.
-    _safe_val = {'$convert': {
-        'input': {'$trim': {'input': '$value', 'chars': "b'"}},
-        'to': 'double', 'onError': None,
-    }}
-
-    pipeline = [
-        {'$match': {
-            'gateway_id': gateway_id,
-            'node_id':    node_id,
-            'type':       sensor_type,
-            'time':       {'$gte': cutoff_unix},
-        }},
-        {'$group': {
-            '_id': {
-                'hour':        {'$hour': {'$toDate': {'$multiply': [{'$toDouble': '$time'}, 1000]}}},
-                'day_of_week': {'$dayOfWeek': {'$toDate': {'$multiply': [{'$toDouble': '$time'}, 1000]}}},
-            },
-            'mean':  {'$avg': _safe_val},
-            'std':   {'$stdDevSamp': _safe_val},
-            'count': {'$sum': 1},
-        }},
-    ]
-
-    cursor = sensors.aggregate(pipeline)
-    computed_at = int(dt.datetime.utcnow().timestamp())
-    bucket_count = 0
-
-    for doc in cursor:
-        hour = doc['_id']['hour']
-        dow  = doc['_id']['day_of_week']
-        db.Baselines.update_one(
-            {'gateway_id': gateway_id, 'node_id': node_id, 'type': sensor_type,
-             'hour': hour, 'day_of_week': dow},
-            {'$set': {
-                'mean': doc['mean'],
-                'std':  doc['std'] or 0.0,
-                'count': doc['count'],
-                'computed_at': computed_at,
-            }},
-            upsert=True,
-        )
-        bucket_count += 1
-
-    return json.dumps({'bucket_count': bucket_count, 'computed_at': computed_at})
+    # Only days not yet folded into the stored sums are aggregated; days that
+    # left the window are subtracted (see baselines.update_baseline)
+    result = _bl.update_baseline(db, gateway_id, node_id, sensor_type, days, tz=tz)
+    return json.dumps(result)
 
 
 @app.route('/baseline/<gw>', methods=['GET'])
 def get_baseline(gw):
     node = request.args.get('node', '')
     sensor_type = request.args.get('type', 'F')
+    tz = _bl.resolve_timezone(request.args.get('timezone'))
     if not node:
         return json.dumps({'error': 'node parameter required'}), 400
+    if tz is None:
+        return json.dumps({'error': 'unknown timezone'}), 400
 
     cursor = db.Baselines.find(
-        {'gateway_id': gw, 'node_id': node, 'type': sensor_type},
-        {'_id': 0, 'gateway_id': 0, 'node_id': 0, 'type': 0},
+        {'gateway_id': gw, 'node_id': node, 'type': sensor_type, 'tz': _bl.tz_query(tz)},
+        {'_id': 0, 'gateway_id': 0, 'node_id': 0, 'type': 0, 'tz': 0, 'sum': 0, 'sumsq': 0},
     )
     return json.dumps(list(cursor))
 
@@ -914,10 +915,13 @@ def get_baseline(gw):
 def baseline_status(gw):
     node = request.args.get('node', '')
     sensor_type = request.args.get('type', 'F')
+    tz = _bl.resolve_timezone(request.args.get('timezone'))
+    if tz is None:
+        return json.dumps({'error': 'unknown timezone'}), 400
     if not node:
         # Gateway-level check: does any baseline exist for this gateway?
         doc = db.Baselines.find_one(
-            {'gateway_id': gw},
+            {'gateway_id': gw, 'tz': _bl.tz_query(tz)},
             {'computed_at': 1, '_id': 0},
             sort=[('computed_at', -1)],
         )
@@ -925,19 +929,39 @@ def baseline_status(gw):
             return json.dumps({'exists': False})
         return json.dumps({'exists': True, 'computed_at': doc.get('computed_at')})
 
-    doc = db.Baselines.find_one(
-        {'gateway_id': gw, 'node_id': node, 'type': sensor_type},
-        {'computed_at': 1, '_id': 0},
-    )
+    sensor = {'gateway_id': gw, 'node_id': node, 'type': sensor_type, 'tz': _bl.tz_query(tz)}
+    doc = db.Baselines.find_one(sensor, {'computed_at': 1, '_id': 0})
     if not doc:
         return json.dumps({})
 
-    count = db.Baselines.count_documents(
-        {'gateway_id': gw, 'node_id': node, 'type': sensor_type}
-    )
+    count = db.Baselines.count_documents(sensor)
     return json.dumps({'computed_at': doc['computed_at'], 'bucket_count': count})
 
 
+@app.route('/baseline_deviation/<gw>', methods=['GET'])
+def baseline_deviation(gw):
+    """z-scores of the gateway's latest readings against their baselines.
+
+    Query params:
+      type       — comma-separated sensor types (default: all)
+      timezone   — IANA name the baselines were computed in (default: UTC)
+      threshold  — |z| flagged as deviating (default: 3)
+    """
+    types = [t for t in request.args.get('type', '').split(',') if t]
+    tz = _bl.resolve_timezone(request.args.get('timezone'))
+    if tz is None:
+        return json.dumps({'error': 'unknown timezone'}), 400
+    try:
+        threshold = float(request.args.get('threshold', _bd.DEFAULT_THRESHOLD))
+    except ValueError:
+        return json.dumps({'error': 'threshold must be a number'}), 400
+
+    readings = _bd.gateway_deviations(db, gw, types or None, tz=tz, threshold=threshold)
+    return json.dumps({'gateway_id': gw, 'tz': tz, 'threshold': threshold,
+                       'deviating': sum(r['deviating'] for r in readings),
+                       'readings': readings})
+
+
 # ---------------------------------------------------------------------------
 # Heatmap / Calendar View
 # ---------------------------------------------------------------------------
@@ -946,50 +970,22 @@ def baseline_status(gw):
 def heatmap(gw):
     node = request.args.get('node', '')
     sensor_type = request.args.get('type', 'F')
+    tz = _bl.resolve_timezone(request.args.get('timezone'))
+    if tz is None:
+        return json.dumps({'error': 'unknown timezone'}), 400
     try:
-        year = int(request.args.get('year', dt.datetime.utcnow().year))
+        year = int(request.args.get('year', _bl.local_date(time.time(), tz).year))
     except ValueError:
         return json.dumps({'error': 'year must be an integer'}), 400
 
     if not node:
         return json.dumps({'error': 'node parameter required'}), 400
 
-    year_start = dt.datetime(year, 1, 1, tzinfo=dt.timezone.utc)
-    year_end   = dt.datetime(year + 1, 1, 1, tzinfo=dt.timezone.utc)
-    year_start_unix = int(year_start.timestamp())
-    year_end_unix   = int(year_end.timestamp())
-
-    _safe_val = {'$convert': {
-        'input': {'$trim': {'input': '$value', 'chars': "b'"}},
-        'to': 'double', 'onError': None,
-    }}
-
-    pipeline = [
-        {'$match': {
-            'gateway_id': gw,
-            'node_id':    node,
-            'type':       sensor_type,
-            'time':       {'$gte': year_start_unix, '$lt': year_end_unix},
-        }},
-        {'$group': {
-            '_id': {'$dateToString': {
-                'format': '%Y-%m-%d',
-                'date': {'$toDate': {'$multiply': [{'$toDouble': '$time'}, 1000]}},
-            }},
-            'min':   {'$min': _safe_val},
-            'max':   {'$max': _safe_val},
-            'avg':   {'$avg': _safe_val},
-            'count': {'$sum': 1},
-        }},
-        {'$sort': {'_id': 1}},
-    ]
-
-    cursor = sensors.aggregate(pipeline)
-    results = [
-        {'date': doc['_id'], 'min': doc['min'], 'max': doc['max'],
-         'avg': doc['avg'], 'count': doc['count']}
-        for doc in cursor
-    ]
+    # Closed days come from DailySummaries; only the open ones are aggregated,
+    # grouped by local date on the server
+    results = _ds.heatmap_year(db, gw, node, sensor_type, year, tz=tz)
+    if _ds.year_is_final(year, tz=tz):
+        return json.dumps(results), 200, {'Cache-Control': 'public, max-age=31536000, immutable'}
     return json.dumps(results)
 
 
@@ -2,6 +2,20 @@
 #nginx -c /etc/nginx/nginx.conf &
 nginx &
 
+# Score new sensor buckets online as readings arrive; the hourly pass catches
+# up anything the stream missed (e.g. while restarting)
+python3 anomaly_scorer.py -d PROD --stream &
+python3 anomaly_scorer.py -d PROD -i 3600 &
+
+# Recompute cached regression forecasts when a new NOAA batch arrives
+python3 forecast_refresher.py -d PROD &
+
+# Evaluate alert rules against SensorsLatest updates and push fired alerts
+python3 alert_evaluator.py -d PROD &
+
+# Warn of forecast frost/heat crossings for predictive_alerts_enabled users
+python3 predictive_scanner.py -d PROD &
+
 gunicorn --timeout 120 --access-logfile - --log-file gunicorn.log -w 4 -b 0.0.0.0:5050 server:app
 
 # Wait for any process to exit
@@ -15,6 +15,18 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import mongomock
 import pytest
 
+# ── mongomock / pymongo compatibility ────────────────────────────────────────
+# pymongo >= 4.11 passes sort= when UpdateOne is added to a bulk_write, which
+# mongomock 4.3's BulkOperationBuilder does not accept. Drop the (unused) kwarg.
+_mongomock_add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+
+def _add_update_ignoring_sort(self, *args, sort=None, **kwargs):
+    return _mongomock_add_update(self, *args, **kwargs)
+
+
+mongomock.collection.BulkOperationBuilder.add_update = _add_update_ignoring_sort
+
 # ── Activate mongomock before server is imported ─────────────────────────────
 _mongo_patcher = mongomock.patch(servers=(('localhost', 27017),))
 _mongo_patcher.start()
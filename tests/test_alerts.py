@@ -0,0 +1,156 @@
+"""Unit tests for alerts: indexed rule evaluation, cooldowns and push delivery."""
+import mongomock
+import pytest
+
+import alert_evaluator
+import alerts as _alerts
+
+T0 = 1_700_000_000
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+class _Clock:
+    def __init__(self, now=T0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _rule(rule_id, **kw):
+    return {'rule_id': rule_id, 'email': 'a@x', 'gateway_id': 'GW-1', 'node_id': '1',
+            'type': 'F', 'operator': '>', 'threshold': 80, 'label': rule_id,
+            'enabled': True, 'cooldown_minutes': 60, 'push_enabled': True, **kw}
+
+
+def _reading(value, node='1', sensor_type='F', gw='GW-1', time=T0):
+    return {'gateway_id': gw, 'node_id': node, 'type': sensor_type, 'value': value, 'time': time}
+
+
+def _engine(db, clock=None):
+    pushed = []
+    engine = _alerts.AlertEngine(db, push=pushed.append, clock=clock or _Clock())
+    engine.refresh()
+    return engine, pushed
+
+
+# ── Evaluation ────────────────────────────────────────────────────────────────
+
+class TestAlertEngine:
+    def test_fires_matching_rule_and_pushes(self, db):
+        db.AlertRules.insert_one(_rule('hot'))
+        engine, pushed = _engine(db)
+        fired = engine.evaluate([_reading("b'85.5'")])
+        assert [a['rule_id'] for a in fired] == ['hot']
+        assert pushed[0]['value'] == 85.5
+        assert pushed[0]['message'] == 'hot: 85.5 > 80'
+
+    def test_only_matching_rules_are_evaluated(self, db):
+        db.AlertRules.insert_many([_rule('hot'), _rule('other-node', node_id='2'),
+                                   _rule('humid', type='H'), _rule('gw-wide', node_id=None),
+                                   _rule('off', enabled=False)])
+        engine, _ = _engine(db)
+        assert [r['rule_id'] for r in engine.rules_for('GW-1', '1', 'F')] == ['hot', 'gw-wide']
+        assert [r['rule_id'] for r in engine.rules_for('GW-1', 3, 'F')] == ['gw-wide']
+        assert engine.rules_for('GW-2', '1', 'F') == []
+        fired = engine.evaluate([_reading('90', node='3')])
+        assert [a['rule_id'] for a in fired] == ['gw-wide']
+
+    @pytest.mark.parametrize('op,value,fires', [
+        ('<', 30, True), ('<', 40, False), ('<=', 35, True),
+        ('>=', 35, True), ('==', 35, True), ('!=', 35, False), ('below', 20, True),
+    ])
+    def test_operators(self, db, op, value, fires):
+        db.AlertRules.insert_one(_rule('r', operator=op, threshold=35))
+        engine, _ = _engine(db)
+        assert bool(engine.evaluate([_reading(value)])) is fires
+
+    def test_malformed_rules_and_values_are_skipped(self, db):
+        db.AlertRules.insert_many([_rule('bad-op', operator='~'), _rule('bad-thr', threshold='x')])
+        engine, pushed = _engine(db)
+        assert engine.rules_for('GW-1', '1', 'F') == []
+        db.AlertRules.insert_one(_rule('hot'))
+        engine.refresh()
+        assert engine.evaluate([_reading('garbage')]) == []
+        assert pushed == []
+
+    def test_push_disabled_fires_without_push(self, db):
+        db.AlertRules.insert_one(_rule('quiet', push_enabled=False))
+        engine, pushed = _engine(db)
+        assert len(engine.evaluate([_reading(90)])) == 1
+        assert pushed == []
+
+    def test_push_failure_does_not_stop_delivery(self, db):
+        db.AlertRules.insert_many([_rule('a'), _rule('b')])
+        delivered = []
+
+        def push(alert):
+            if alert['rule_id'] == 'a':
+                raise RuntimeError('transport down')
+            delivered.append(alert['rule_id'])
+
+        engine = _alerts.AlertEngine(db, push=push, clock=_Clock())
+        engine.refresh()
+        assert len(engine.evaluate([_reading(90)])) == 2
+        assert delivered == ['b']
+
+
+# ── Cooldown ──────────────────────────────────────────────────────────────────
+
+class TestCooldown:
+    def test_cooldown_suppresses_until_elapsed(self, db):
+        db.AlertRules.insert_one(_rule('hot', cooldown_minutes=10))
+        clock = _Clock()
+        engine, pushed = _engine(db, clock)
+        assert engine.evaluate([_reading(90)])
+        clock.now += 599
+        assert engine.evaluate([_reading(91)]) == []
+        clock.now += 1
+        assert engine.evaluate([_reading(92)])
+        assert len(pushed) == 2
+
+    def test_last_fired_persisted_across_restarts(self, db):
+        db.AlertRules.insert_one(_rule('hot'))
+        clock = _Clock()
+        engine, _ = _engine(db, clock)
+        engine.evaluate([_reading(90), _reading(95)])
+        assert db.AlertState.find_one({'rule_id': 'hot'})['last_fired'] == T0
+
+        clock.now += 1800
+        restarted, pushed = _engine(db, clock)
+        assert restarted.evaluate([_reading(90)]) == []
+        clock.now += 1800
+        assert restarted.evaluate([_reading(90)])
+        assert len(pushed) == 1
+
+
+# ── Index refresh on CRUD ─────────────────────────────────────────────────────
+
+class TestRefresh:
+    def test_reloads_only_after_version_bump(self, db):
+        engine, _ = _engine(db)
+        assert not engine.refresh_if_stale()
+        db.AlertRules.insert_one(_rule('hot'))
+        assert engine.rules_for('GW-1', '1', 'F') == []
+        _alerts.bump_rules_version(db)
+        assert engine.refresh_if_stale()
+        assert [r['rule_id'] for r in engine.rules_for('GW-1', '1', 'F')] == ['hot']
+
+    def test_evaluate_pass_reads_new_updates_only(self, db):
+        db.AlertRules.insert_one(_rule('hot', cooldown_minutes=0))
+        db.SensorsLatest.insert_many([_reading(90, time=T0 - 10), _reading(90, node='2', time=T0 + 5),
+                                      _reading(90, gw='GW-9', time=T0 + 5)])
+        engine, pushed = _engine(db)
+        fired, since = alert_evaluator.evaluate_pass(db, engine, T0)
+        assert fired == [] and since == T0 + 5
+
+        db.SensorsLatest.update_one({'node_id': '1'}, {'$set': {'time': T0 + 10}})
+        fired, since = alert_evaluator.evaluate_pass(db, engine, since)
+        assert [a['rule_id'] for a in fired] == ['hot']
+        assert since == T0 + 10
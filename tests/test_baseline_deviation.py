@@ -0,0 +1,118 @@
+"""Unit tests for baseline_deviation: cached 7×24 arrays and vectorized z-scores."""
+import mongomock
+import numpy as np
+import pytest
+
+import baseline_deviation as _bd
+
+NOW = 1_700_000_000          # Tuesday 2023-11-14 22:13 UTC
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    _bd.invalidate()
+    yield
+    _bd.invalidate()
+
+
+def _baseline(db, node, sensor_type='F', mean=70.0, std=2.0, tz='UTC'):
+    """168 buckets; mean is offset by the hour so lookups must hit the right slot."""
+    db.Baselines.insert_many([
+        {'gateway_id': 'GW-1', 'node_id': node, 'type': sensor_type, 'tz': tz,
+         'day_of_week': dow, 'hour': hour, 'mean': mean + hour + dow / 10, 'std': std,
+         'count': 10, 'computed_at': NOW}
+        for dow in range(1, 8) for hour in range(24)])
+
+
+def _latest(db, node, value, sensor_type='F', time=NOW):
+    db.SensorsLatest.insert_one({'gateway_id': 'GW-1', 'node_id': node, 'type': sensor_type,
+                                 'value': value, 'time': time})
+
+
+# ── Deviations ────────────────────────────────────────────────────────────────
+
+class TestGatewayDeviations:
+    def test_z_scores_use_local_hour_of_week(self, db):
+        _baseline(db, '1')
+        _baseline(db, '2', std=0.5)
+        _latest(db, '1', "b'92.3'")       # Tuesday (3) 22h: mean 92.3
+        _latest(db, '2', '96.3')          # 4 above a 0.5 std
+        results = _bd.gateway_deviations(db, 'GW-1', now=NOW)
+        assert [(r['node_id'], r['z'], r['deviating']) for r in results] == [
+            ('2', 8.0, True), ('1', 0.0, False)]
+        assert (results[0]['day_of_week'], results[0]['hour']) == (3, 22)
+
+    def test_timezone_shifts_bucket(self, db):
+        _baseline(db, '1', tz='Asia/Tokyo')
+        _latest(db, '1', '77.4')          # Wednesday (4) 07h in Tokyo: mean 77.4
+        result = _bd.gateway_deviations(db, 'GW-1', tz='Asia/Tokyo', now=NOW)[0]
+        assert (result['day_of_week'], result['hour'], result['z']) == (4, 7, 0.0)
+        assert _bd.gateway_deviations(db, 'GW-1', now=NOW) == []
+
+    def test_sensors_without_baseline_or_std_or_value(self, db):
+        _baseline(db, '1', std=0.0)
+        _baseline(db, '2')
+        _latest(db, '1', '80')
+        _latest(db, '2', 'garbage')
+        _latest(db, '3', '80')
+        _latest(db, '2', '50', sensor_type='H')
+        results = _bd.gateway_deviations(db, 'GW-1', now=NOW)
+        assert sorted(r['node_id'] for r in results) == ['1', '2']
+        assert all(r['z'] is None and not r['deviating'] for r in results)
+
+    def test_type_filter_and_threshold(self, db):
+        _baseline(db, '1')
+        _baseline(db, '1', sensor_type='H', mean=40)
+        _latest(db, '1', '96.3')
+        _latest(db, '1', '64.3', sensor_type='H')
+        results = _bd.gateway_deviations(db, 'GW-1', types=['H'], threshold=1.5, now=NOW)
+        assert [(r['type'], r['z'], r['deviating']) for r in results] == [('H', 1.0, False)]
+
+
+# ── Cache ─────────────────────────────────────────────────────────────────────
+
+class TestBaselineCache:
+    def test_baselines_loaded_once_per_ttl(self, db, monkeypatch):
+        _baseline(db, '1')
+        _baseline(db, '2')
+        _latest(db, '1', '80')
+        calls = []
+        collection = type(db.Baselines)
+        find = collection.find
+        monkeypatch.setattr(collection, 'find',
+                            lambda self, *a, **kw: calls.append(self.name) or find(self, *a, **kw))
+        for _ in range(5):
+            _bd.gateway_deviations(db, 'GW-1', now=NOW)
+        assert calls.count('Baselines') == 1
+        assert calls.count('SensorsLatest') == 5
+        _bd.gateway_deviations(db, 'GW-1', now=NOW + _bd._CACHE_TTL)
+        assert calls.count('Baselines') == 2
+
+    def test_arrays_and_invalidate(self, db):
+        _baseline(db, '1')
+        mean, std = _bd.gateway_baselines(db, 'GW-1', now=NOW).sensor(1, 'F')
+        assert mean.shape == std.shape == (7, 24)
+        assert mean[0, 5] == pytest.approx(75.1)
+        assert np.all(std == 2.0)
+
+        db.Baselines.update_many({}, {'$set': {'std': 4.0}})
+        assert _bd.gateway_baselines(db, 'GW-1', now=NOW).sensor('1', 'F')[1][0, 0] == 2.0
+        _bd.invalidate('GW-1')
+        assert _bd.gateway_baselines(db, 'GW-1', now=NOW).sensor('1', 'F')[1][0, 0] == 4.0
+
+    def test_version_bump_reloads_without_invalidate(self, db):
+        # Another worker recomputed the baselines: only the stored version tells
+        _baseline(db, '1')
+        assert _bd.gateway_baselines(db, 'GW-1', now=NOW).sensor('1', 'F')[1][0, 0] == 2.0
+        db.Baselines.update_many({}, {'$set': {'std': 4.0}})
+        _bd._bl.bump_baselines_version(db, ['GW-2'])
+        assert _bd.gateway_baselines(db, 'GW-1', now=NOW).sensor('1', 'F')[1][0, 0] == 2.0
+        _bd._bl.bump_baselines_version(db, ['GW-1'])
+        assert _bd.gateway_baselines(db, 'GW-1', now=NOW).sensor('1', 'F')[1][0, 0] == 4.0
@@ -0,0 +1,263 @@
+"""Unit tests for baselines: incremental (hour, day_of_week) sufficient statistics."""
+import datetime as dt
+
+import mongomock
+import numpy as np
+import pytest
+from dateutil.tz import gettz
+
+import baselines as _bl
+
+DAY = 86400
+T0 = 1_700_006_400          # a UTC midnight
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def _seed(db, first_day, n_days, seed=0):
+    """Four readings an hour for node 1 (F), with a few legacy b'…' strings."""
+    rng = np.random.default_rng(seed + first_day)
+    times = first_day + np.arange(n_days * 96) * 900 + 7
+    values = 60 + 5 * np.sin(times / 3600) + rng.normal(size=len(times))
+    docs = [{'gateway_id': 'GW-B', 'node_id': '1', 'type': 'F', 'time': int(t),
+             'value': f"b'{v:.3f}'" if i % 10 == 0 else round(float(v), 3)}
+            for i, (t, v) in enumerate(zip(times, values))]
+    db.Sensors.insert_many(docs)
+
+
+def _reference(db, now, days, tz='UTC'):
+    """Brute-force {(hour, dow): (mean, std, count)} over the local update window."""
+    today = dt.datetime.fromtimestamp(now, gettz(tz)).date()
+    start = dt.datetime.combine(today - dt.timedelta(days=days), dt.time(), gettz(tz)).timestamp()
+    groups = {}
+    for doc in db.Sensors.find({'gateway_id': 'GW-B', 'node_id': '1', 'type': 'F',
+                                'time': {'$gte': start, '$lt': now}}):
+        value = float(str(doc['value']).replace("b'", '').replace("'", ''))
+        when = dt.datetime.fromtimestamp(doc['time'], gettz(tz))
+        groups.setdefault((when.hour, (when.weekday() + 1) % 7 + 1), []).append(value)
+    return {key: (np.mean(v), np.std(v, ddof=1), len(v)) for key, v in groups.items()}
+
+
+def _stored(db, tz='UTC'):
+    return {(doc['hour'], doc['day_of_week']): (doc['mean'], doc['std'], doc['count'])
+            for doc in db.Baselines.find({'gateway_id': 'GW-B', 'node_id': '1', 'type': 'F',
+                                          'tz': tz})}
+
+
+def _assert_matches(db, now, days, tz='UTC'):
+    expected, actual = _reference(db, now, days, tz), _stored(db, tz)
+    assert set(actual) == set(expected)
+    for key, (mean, std, count) in expected.items():
+        assert actual[key][2] == count
+        assert actual[key][0] == pytest.approx(mean, abs=1e-9)
+        assert actual[key][1] == pytest.approx(std, abs=1e-6)
+
+
+# ── Incremental updates ───────────────────────────────────────────────────────
+
+class TestUpdateBaseline:
+    def test_first_run_matches_full_aggregate(self, db):
+        _seed(db, T0, 10)
+        now = T0 + 9 * DAY + 6 * 3600
+        result = _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now)
+        assert result['days_aggregated'] == 8
+        assert result['bucket_count'] == 168
+        _assert_matches(db, now, 7)
+        assert _bl.baselines_version(db, 'GW-B') == 1
+        assert _bl.baselines_version(db, 'GW-C') == 0
+
+    def test_next_day_aggregates_only_new_days_and_ages_out(self, db, monkeypatch):
+        _seed(db, T0, 10)
+        now = T0 + 9 * DAY + 6 * 3600
+        _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now)
+        _seed(db, T0 + 10 * DAY, 1)
+
+        queried = []
+        hourly = _bl._hourly_stats
+        monkeypatch.setattr(_bl, '_hourly_stats',
+                            lambda db, match, *a, **kw: queried.append(match) or hourly(db, match, *a, **kw))
+        result = _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now + DAY)
+        assert queried[0]['time']['$gte'] == T0 + 9 * DAY   # yesterday was incomplete
+        assert result['days_aggregated'] == 2
+        assert result['days_aged_out'] == 1
+        assert not result['rebuilt']
+        assert db.BaselineDays.count_documents({}) == 8
+        _assert_matches(db, now + DAY, 7)
+
+    def test_bucket_writes_are_one_bulk_write(self, db, monkeypatch):
+        _seed(db, T0, 3)
+        calls = []
+        collection = type(db.Baselines)
+        bulk_write = collection.bulk_write
+        monkeypatch.setattr(collection, 'bulk_write',
+                            lambda self, ops, **kw: calls.append(self.name) or bulk_write(self, ops, **kw))
+        monkeypatch.setattr(collection, 'update_one', None)
+        _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=T0 + 3 * DAY)
+        assert calls.count('Baselines') == 1
+
+    @pytest.mark.parametrize('failing', ['Baselines', 'BaselineDays'])
+    def test_interrupted_run_is_repaired_not_double_counted(self, db, monkeypatch, failing):
+        _seed(db, T0, 10)
+        now = T0 + 9 * DAY + 6 * 3600
+        _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now)
+        _seed(db, T0 + 10 * DAY, 1)
+
+        collection = type(db.Baselines)
+        bulk_write = collection.bulk_write
+
+        def crash_on(self, ops, **kw):
+            if self.name == failing:
+                raise RuntimeError('worker died')
+            return bulk_write(self, ops, **kw)
+        with monkeypatch.context() as patch:
+            patch.setattr(collection, 'bulk_write', crash_on)
+            with pytest.raises(RuntimeError):
+                _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now + DAY)
+        _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now + DAY)
+        _assert_matches(db, now + DAY, 7)
+
+    def test_incremental_run_writes_only_changed_weekdays(self, db, monkeypatch):
+        _seed(db, T0, 10)
+        now = T0 + 9 * DAY + 6 * 3600
+        _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now)
+        written = []
+        collection = type(db.Baselines)
+        bulk_write = collection.bulk_write
+        monkeypatch.setattr(collection, 'bulk_write', lambda self, ops, **kw: (
+            written.extend(ops) if self.name == 'Baselines' else None) or bulk_write(self, ops, **kw))
+        _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now + 3600)
+        # Only today's weekday is re-aggregated
+        assert 0 < len(written) <= 24
+        _assert_matches(db, now + 3600, 7)
+
+    def test_window_change_rebuilds(self, db):
+        _seed(db, T0, 10)
+        now = T0 + 9 * DAY + 6 * 3600
+        _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now)
+        result = _bl.update_baseline(db, 'GW-B', '1', 'F', days=3, now=now)
+        assert result['rebuilt']
+        assert db.BaselineDays.count_documents({}) == 4
+        _assert_matches(db, now, 3)
+
+    def test_legacy_buckets_rebuilt(self, db):
+        _seed(db, T0, 3)
+        db.Baselines.insert_one({'gateway_id': 'GW-B', 'node_id': '1', 'type': 'F',
+                                 'hour': 0, 'day_of_week': 1, 'mean': 1.0, 'std': 0.0,
+                                 'count': 5, 'computed_at': 0})
+        now = T0 + 3 * DAY
+        assert _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now)['rebuilt']
+        _assert_matches(db, now, 7)
+
+    def test_sensor_without_readings(self, db):
+        result = _bl.update_baseline(db, 'GW-B', '9', 'F', days=7, now=T0)
+        assert result['bucket_count'] == 0
+        assert db.Baselines.count_documents({}) == 0
+
+
+# ── Timezones ─────────────────────────────────────────────────────────────────
+
+class TestTimezones:
+    def test_local_hours_and_days(self, db):
+        _seed(db, T0, 10)
+        now = T0 + 9 * DAY + 6 * 3600
+        result = _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now,
+                                     tz='America/New_York')
+        assert result['tz'] == 'America/New_York'
+        _assert_matches(db, now, 7, 'America/New_York')
+        assert db.BaselineDays.find_one()['day'] % DAY == 5 * 3600   # EST midnight
+
+    def test_timezones_kept_apart(self, db):
+        _seed(db, T0, 3)
+        for tz in ('UTC', 'Asia/Kolkata'):
+            _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=T0 + 3 * DAY, tz=tz)
+        _assert_matches(db, T0 + 3 * DAY, 7, 'UTC')
+        _assert_matches(db, T0 + 3 * DAY, 7, 'Asia/Kolkata')
+
+    def test_dst_transition_days(self, db):
+        spring = 1_710_028_800 - 2 * DAY          # 2024-03-08 UTC midnight
+        _seed(db, spring, 4)
+        now = spring + 4 * DAY
+        _bl.update_baseline(db, 'GW-B', '1', 'F', days=5, now=now, tz='America/New_York')
+        _assert_matches(db, now, 5, 'America/New_York')
+
+    def test_legacy_documents_adopted_as_utc(self, db):
+        _seed(db, T0, 10)
+        now = T0 + 9 * DAY + 6 * 3600
+        _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now)
+        for name in ('Baselines', 'BaselineDays'):
+            db[name].update_many({}, {'$unset': {'tz': ''}})
+        result = _bl.update_baseline(db, 'GW-B', '1', 'F', days=7, now=now + DAY)
+        assert not result['rebuilt']
+        assert db.Baselines.count_documents({}) == 168
+        _assert_matches(db, now + DAY, 7)
+
+    def test_resolve_timezone(self):
+        assert _bl.resolve_timezone(None) == 'UTC'
+        assert _bl.resolve_timezone('Europe/Paris') == 'Europe/Paris'
+        assert _bl.resolve_timezone('Mars/Olympus') is None
+
+
+# ── Fleet-wide update ─────────────────────────────────────────────────────────
+
+def _seed_fleet(db, first_day, n_days):
+    """Node 1 and node 2 on GW-B and GW-C, plus a NOAA forecast that is skipped."""
+    _seed(db, first_day, n_days)
+    docs = list(db.Sensors.find({'gateway_id': 'GW-B', 'node_id': '1',
+                                 'time': {'$gte': first_day}}, {'_id': 0}))
+    db.Sensors.insert_many([{**doc, 'gateway_id': gw, 'node_id': node}
+                            for gw, node in (('GW-B', '2'), ('GW-C', '1'), ('GW-C', 'noaa_forecast'))
+                            for doc in docs])
+
+
+class TestFleetBaselines:
+    def test_matches_per_sensor_updates(self, db):
+        _seed_fleet(db, T0, 10)
+        now = T0 + 9 * DAY + 6 * 3600
+        report = _bl.update_fleet_baselines(db, ['GW-B', 'GW-C'], days=7, now=now,
+                                            partition_size=1, batch_size=100)
+        assert report['sensors'] == 3
+        assert report['buckets'] == 3 * 168
+        assert report['bulk_writes'] > 2
+        assert db.Baselines.count_documents({'node_id': 'noaa_forecast'}) == 0
+        assert _bl.baselines_version(db, 'GW-B') == _bl.baselines_version(db, 'GW-C') == 1
+        fleet = {(d['gateway_id'], d['node_id'], d['hour'], d['day_of_week']): d['mean']
+                 for d in db.Baselines.find()}
+
+        single = mongomock.MongoClient().db
+        _seed_fleet(single, T0, 10)
+        for gw, node in (('GW-B', '1'), ('GW-B', '2'), ('GW-C', '1')):
+            _bl.update_baseline(single, gw, node, 'F', days=7, now=now)
+        assert fleet == pytest.approx(
+            {(d['gateway_id'], d['node_id'], d['hour'], d['day_of_week']): d['mean']
+             for d in single.Baselines.find()})
+
+    def test_incremental_pass_reads_new_days_and_new_sensors_window(self, db, monkeypatch):
+        _seed(db, T0, 10)
+        now = T0 + 9 * DAY + 6 * 3600
+        _bl.update_fleet_baselines(db, ['GW-B'], days=7, now=now)
+        _seed_fleet(db, T0 + 10 * DAY, 1)
+        db.Sensors.insert_many([{**doc, 'node_id': '2'} for doc in db.Sensors.find(
+            {'node_id': '1', 'time': {'$lt': T0 + 10 * DAY}}, {'_id': 0})])
+
+        matches = []
+        hourly = _bl._hourly_stats
+        monkeypatch.setattr(_bl, '_hourly_stats',
+                            lambda db, match, *a: matches.append(match) or hourly(db, match, *a))
+        report = _bl.update_fleet_baselines(db, ['GW-B'], days=7, now=now + DAY)
+        assert len(matches) == 2
+        assert matches[0]['time']['$gte'] == T0 + 9 * DAY
+        assert matches[1]['$or'] == [{'gateway_id': 'GW-B', 'node_id': '2', 'type': 'F'}]
+        assert report['sensors'] == 2
+        _assert_matches(db, now + DAY, 7)
+
+    def test_enabled_gateways(self, db):
+        db.AnalyticsSettings.insert_many([{'email': 'a@x', 'baseline_enabled': True},
+                                          {'email': 'b@x', 'baseline_enabled': False}])
+        db.UserProfiles.insert_many([{'email': 'a@x', 'gateway_ids': ['GW-2', 'GW-1']},
+                                     {'email': 'b@x', 'gateway_ids': ['GW-3']}])
+        assert _bl.baseline_enabled_gateways(db) == ['GW-1', 'GW-2']
@@ -0,0 +1,141 @@
+"""Unit tests for daily_summaries: finalized per-day heatmap cells."""
+import datetime as dt
+
+import mongomock
+import numpy as np
+import pytest
+from dateutil.tz import gettz
+
+import daily_summaries as _ds
+
+DAY = 86400
+Y2025 = int(dt.datetime(2025, 1, 1, tzinfo=dt.timezone.utc).timestamp())
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture(autouse=True)
+def empty_year_cache():
+    _ds._year_cache.clear()
+    yield
+    _ds._year_cache.clear()
+
+
+def _seed(db, first_day, n_days, node='1'):
+    """Hourly readings, every fifth a legacy b'…' string and one unparseable a day."""
+    rng = np.random.default_rng(first_day)
+    docs = [{'gateway_id': 'GW-H', 'node_id': node, 'type': 'F', 'time': first_day + h * 3600 + 5,
+             'value': f"b'{v:.2f}'" if h % 5 == 0 else round(float(v), 2)}
+            for h, v in enumerate(60 + rng.normal(size=n_days * 24))]
+    docs += [{'gateway_id': 'GW-H', 'node_id': node, 'type': 'F', 'time': first_day + d * DAY + 99,
+              'value': 'bad'} for d in range(n_days)]
+    db.Sensors.insert_many(docs)
+
+
+def _reference(db, start, end, tz='UTC'):
+    """Brute-force cells over raw readings in [start, end), by local date."""
+    days = {}
+    for doc in db.Sensors.find({'time': {'$gte': start, '$lt': end}}):
+        date = dt.datetime.fromtimestamp(doc['time'], gettz(tz)).strftime('%Y-%m-%d')
+        day = days.setdefault(date, {'values': [], 'count': 0})
+        day['count'] += 1
+        try:
+            day['values'].append(float(str(doc['value']).replace("b'", '').replace("'", '')))
+        except ValueError:
+            pass
+    return [{'date': date, 'min': min(s['values']), 'max': max(s['values']),
+             'avg': pytest.approx(np.mean(s['values'])), 'count': s['count']}
+            for date, s in sorted(days.items())]
+
+
+# ── Heatmap ───────────────────────────────────────────────────────────────────
+
+class TestHeatmapYear:
+    def test_matches_raw_aggregate_and_finalizes_closed_days(self, db):
+        _seed(db, Y2025 + 40 * DAY, 10)
+        now = Y2025 + 49 * DAY + 6 * 3600
+        cells = _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now)
+        assert cells == _reference(db, Y2025, now)
+        assert db.DailySummaries.count_documents({}) == 9           # first reading … yesterday
+        assert db.DailySummaries.count_documents({'count': {'$gt': 0}}) == 9
+
+    def test_gap_inside_reading_range_finalized_empty(self, db):
+        _seed(db, Y2025 + 40 * DAY, 2)
+        _seed(db, Y2025 + 45 * DAY, 2)
+        now = Y2025 + 60 * DAY
+        cells = _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now)
+        assert cells == _reference(db, Y2025, now)
+        assert db.DailySummaries.count_documents({}) == 7           # day 40 … day 46
+        assert db.DailySummaries.count_documents({'count': 0}) == 3
+
+    def test_years_without_readings_write_nothing(self, db, monkeypatch):
+        _seed(db, Y2025 + 40 * DAY, 2)
+        now = Y2025 + 60 * DAY
+        monkeypatch.setattr(_ds, '_daily_stats', lambda *a: pytest.fail('aggregated'))
+        assert _ds.heatmap_year(db, 'GW-H', '1', 'F', 1990, now=now) == []
+        assert _ds.heatmap_year(db, 'GW-H', '9', 'F', 2024, now=now) == []
+        assert db.DailySummaries.count_documents({}) == 0
+
+    def test_only_open_days_aggregated_once_summarized(self, db, monkeypatch):
+        _seed(db, Y2025 + 40 * DAY, 10)
+        now = Y2025 + 49 * DAY + 6 * 3600
+        _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now)
+
+        ranges = []
+        stats = _ds._daily_stats
+        monkeypatch.setattr(_ds, '_daily_stats', lambda db, sensor, start, end, tz:
+                            ranges.append((start, end)) or stats(db, sensor, start, end, tz))
+        _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now + 600)
+        assert ranges == [(Y2025 + 49 * DAY, now + 600)]
+
+        _seed(db, Y2025 + 50 * DAY, 1)
+        ranges.clear()
+        cells = _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now + DAY)
+        assert ranges[0] == (Y2025 + 49 * DAY, Y2025 + 50 * DAY)   # yesterday finalized
+        assert cells == _reference(db, Y2025, now + DAY)
+
+    def test_day_within_grace_stays_live(self, db):
+        _seed(db, Y2025 + 3 * DAY, 1)
+        now = Y2025 + 4 * DAY + 60
+        _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now)
+        assert db.DailySummaries.count_documents({'day': Y2025 + 3 * DAY}) == 0
+        db.Sensors.insert_one({'gateway_id': 'GW-H', 'node_id': '1', 'type': 'F',
+                               'time': Y2025 + 3 * DAY + 7, 'value': 200.0})
+        cells = _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now + 2 * 3600)
+        assert cells[0]['max'] == 200.0
+        assert db.DailySummaries.count_documents({'day': Y2025 + 3 * DAY}) == 1
+
+    def test_finalized_year_cached_in_process(self, db, monkeypatch):
+        _seed(db, Y2025 + 300 * DAY, 3)
+        now = Y2025 + 400 * DAY
+        first = _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now)
+        assert _ds.year_is_final(2025, now)
+        monkeypatch.setattr(db.DailySummaries, 'find', None)
+        assert _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now) is first
+
+    def test_current_year_not_cached(self, db):
+        _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=Y2025 + 10 * DAY)
+        assert not _ds._year_cache
+
+    def test_local_days_in_timezone(self, db):
+        _seed(db, Y2025 + 40 * DAY, 10)
+        now = Y2025 + 49 * DAY + 6 * 3600
+        cells = _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now, tz='Asia/Tokyo')
+        tokyo_start = Y2025 - 9 * 3600
+        assert cells == _reference(db, tokyo_start, now, 'Asia/Tokyo')
+        assert db.DailySummaries.find_one({'tz': 'Asia/Tokyo'},
+                                          sort=[('day', 1)])['day'] == tokyo_start + 40 * DAY
+        assert _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now) == _reference(db, Y2025, now)
+
+    def test_legacy_summaries_served_as_utc(self, db):
+        _seed(db, Y2025 + 40 * DAY, 10)
+        now = Y2025 + 49 * DAY + 6 * 3600
+        first = _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now)
+        db.DailySummaries.update_many({}, {'$unset': {'tz': ''}})
+        assert _ds.heatmap_year(db, 'GW-H', '1', 'F', 2025, now=now) == first
+        assert db.DailySummaries.count_documents({}) == 9
@@ -0,0 +1,90 @@
+"""Unit tests for the madi detectors' score_array fast path."""
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import anomaly_training as _at
+from madi.detectors import base_detector
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    train = pd.DataFrame(rng.normal(size=(400, 5)), columns=[f'{i}_F' for i in range(5)])
+    train['flat'] = 1.0   # zero-variance column exercises the std == 0 branch
+    test = pd.DataFrame(rng.normal(scale=2.0, size=(300, 6)), columns=train.columns)
+    return train, test
+
+
+DETECTORS = {
+    'IsolationForest': lambda: _at.IsolationForestAd(contamination=0.1, random_state=0),
+    'OneClassSVM': lambda: _at.OneClassSVMAd(nu=0.1),
+    'NS-RandomForest': lambda: _at.NegativeSamplingRandomForestAd(
+        n_estimators=20, random_state=0, sample_ratio=1.0, sample_delta=0.05),
+}
+
+
+@pytest.fixture(scope='module', params=list(DETECTORS))
+def trained(request, data):
+    np.random.seed(0)
+    det = DETECTORS[request.param]()
+    det.train_model(data[0].copy())
+    return det
+
+
+class TestScoreArray:
+    def test_matches_predict(self, trained, data):
+        test = data[1]
+        expected = trained.predict(test.copy())['class_prob'].values
+        np.testing.assert_array_equal(trained.score_array(test.to_numpy()), expected)
+
+    def test_float32_input(self, trained, data):
+        test = data[1]
+        probs = trained.score_array(test.to_numpy(np.float32))
+        assert probs.shape == (len(test),)
+        assert ((probs >= 0) & (probs <= 1)).all()
+
+    def test_chunked_equals_single_pass(self, trained, data, monkeypatch):
+        x = data[1].to_numpy()
+        whole = trained.score_array(x)
+        monkeypatch.setattr(base_detector, 'SCORE_CHUNK_ROWS', 7)
+        np.testing.assert_array_equal(trained.score_array(x), whole)
+
+    def test_no_feature_name_warning(self, trained, data):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            trained.score_array(data[1].to_numpy())
+
+
+class TestPredictAnomalies:
+    def test_does_not_modify_input(self, trained, data):
+        test = data[1].copy()
+        _at.predict_anomalies(trained, test, feature_columns=list(test.columns))
+        assert list(test.columns) == list(data[1].columns)
+
+    def test_falls_back_to_predict(self, data):
+        class PredictOnly(base_detector.BaseAnomalyDetectionAlgorithm):
+            def train_model(self, x_train):
+                pass
+
+            def predict(self, sample_df):
+                sample_df['class_prob'] = np.where(sample_df['0_F'] > 0, 1.0, 0.0)
+                return sample_df
+
+        test = data[1].reset_index(drop=True)
+        got = _at.predict_anomalies(PredictOnly(), test, feature_columns=list(test.columns))
+        assert got == [float(i) for i in test.index[test['0_F'] <= 0]]
+
+
+class TestSeeding:
+    def test_ns_random_forest_reproducible_from_random_state(self, data):
+        train, test = data
+        probs = []
+        for global_seed in (1, 2):
+            np.random.seed(global_seed)   # must not influence a seeded fit
+            det = DETECTORS['NS-RandomForest']()
+            det.train_model(train.copy())
+            probs.append(det.score_array(test.to_numpy()))
+        np.testing.assert_array_equal(probs[0], probs[1])
@@ -228,3 +228,146 @@ class TestThirdPartyServices:
         data = json.loads(client.get('/get_3p_services?logins=u@test.com').data)
         assert len(data) == 1
         assert data[0]['password'] == 'new_enc_pw'
+
+
+# ── GET /regression_forecasts/<gw> ────────────────────────────────────────────
+
+class TestRegressionForecasts:
+    FORECASTS = [{'node_id': '1', 'type': 'F', 'model_type': 'Ridge', 'r2': 0.9,
+                  'forecast': [{'timestamp': 1.0, 'predicted': 70.0}]}]
+
+    def test_returns_all_sensor_forecasts(self, client):
+        with patch('server._rt.predict_gateway_forecasts',
+                   return_value=self.FORECASTS) as predict:
+            resp = client.get('/regression_forecasts/GW-TEST?hours=12')
+        assert resp.status_code == 200
+        assert json.loads(resp.data) == {'forecasts': self.FORECASTS}
+        assert predict.call_args.kwargs['hours'] == 12
+
+    def test_no_models_returns_404(self, client):
+        with patch('server._rt.predict_gateway_forecasts', return_value=[]):
+            resp = client.get('/regression_forecasts/GW-NONE')
+        assert resp.status_code == 404
+
+    def test_hours_out_of_range_rejected(self, client):
+        with patch('server._rt.predict_gateway_forecasts') as predict:
+            for hours in ('0', '-5', '100000', 'abc'):
+                resp = client.get(f'/regression_forecasts/GW-TEST?hours={hours}')
+                assert resp.status_code == 400
+        predict.assert_not_called()
+
+
+# ── POST /compute_baseline ────────────────────────────────────────────────────
+
+class TestComputeBaseline:
+    def test_requires_gateway_and_node(self, client):
+        resp = client.post('/compute_baseline', data=json.dumps({'gateway_id': 'GW-TEST'}),
+                           content_type='application/json')
+        assert resp.status_code == 400
+
+    def test_delegates_to_incremental_update(self, client):
+        result = {'bucket_count': 3, 'computed_at': 1, 'days_aggregated': 1,
+                  'days_aged_out': 0, 'rebuilt': False}
+        with patch('server._bl.update_baseline', return_value=result) as update:
+            resp = client.post('/compute_baseline',
+                               data=json.dumps({'gateway_id': 'GW-TEST', 'node_id': '1',
+                                                'days': 14}),
+                               content_type='application/json')
+        assert resp.status_code == 200
+        assert json.loads(resp.data) == result
+        assert update.call_args.args[1:] == ('GW-TEST', '1', 'F', 14)
+
+
+# ── GET /heatmap/<gw> ─────────────────────────────────────────────────────────
+
+class TestHeatmap:
+    CELLS = [{'date': '2024-03-01', 'min': 60.0, 'max': 70.0, 'avg': 65.0, 'count': 24}]
+
+    def test_requires_node(self, client):
+        assert client.get('/heatmap/GW-TEST?year=2024').status_code == 400
+
+    def test_past_year_is_cacheable(self, client):
+        with patch('server._ds.heatmap_year', return_value=self.CELLS) as heatmap_year:
+            resp = client.get('/heatmap/GW-TEST?node=1&year=2024')
+        assert json.loads(resp.data) == self.CELLS
+        assert heatmap_year.call_args.args[1:] == ('GW-TEST', '1', 'F', 2024)
+        assert 'immutable' in resp.headers['Cache-Control']
+
+    def test_current_year_not_cacheable(self, client):
+        with patch('server._ds.heatmap_year', return_value=[]):
+            resp = client.get('/heatmap/GW-TEST?node=1')
+        assert 'Cache-Control' not in resp.headers
+
+    def test_timezone_passed_through(self, client):
+        with patch('server._ds.heatmap_year', return_value=[]) as heatmap_year:
+            client.get('/heatmap/GW-TEST?node=1&year=2024&timezone=America/Chicago')
+        assert heatmap_year.call_args.kwargs['tz'] == 'America/Chicago'
+
+    def test_unknown_timezone(self, client):
+        resp = client.get('/heatmap/GW-TEST?node=1&timezone=Nowhere/Special')
+        assert resp.status_code == 400
+        resp = client.post('/compute_baseline',
+                           data=json.dumps({'gateway_id': 'GW-TEST', 'node_id': '1',
+                                            'timezone': 'Nowhere/Special'}),
+                           content_type='application/json')
+        assert resp.status_code == 400
+
+
+# ── /alert_rules ──────────────────────────────────────────────────────────────
+
+class TestAlertRules:
+    AUTH_HEADERS = {'Authorization': 'Bearer fake_token'}
+
+    @pytest.fixture(autouse=True)
+    def mock_token_verification(self):
+        with patch('server._verify_google_token', return_value='test@example.com'):
+            yield
+
+    @pytest.fixture(autouse=True)
+    def clean_rules(self):
+        import server as _server
+        yield
+        _server.db.AlertRules.drop()
+        _server.db.AlertRulesVersion.drop()
+
+    def _version(self):
+        import server as _server
+        return _server._alerts._rules_version(_server.db)
+
+    def test_crud_bumps_rules_version(self, client):
+        rule = {'gateway_id': 'GW-TEST', 'node_id': '1', 'type': 'F',
+                'operator': '>', 'threshold': 80}
+        resp = client.post('/alert_rules', data=json.dumps(rule),
+                           content_type='application/json', headers=self.AUTH_HEADERS)
+        assert resp.status_code == 201
+        rule_id = json.loads(resp.data)['rule_id']
+        assert self._version() == 1
+        client.put(f'/alert_rules/{rule_id}', data=json.dumps({'threshold': 85}),
+                   content_type='application/json', headers=self.AUTH_HEADERS)
+        assert self._version() == 2
+        client.delete(f'/alert_rules/{rule_id}', headers=self.AUTH_HEADERS)
+        assert self._version() == 3
+
+    def test_missing_rule_does_not_bump(self, client):
+        resp = client.delete('/alert_rules/nope', headers=self.AUTH_HEADERS)
+        assert resp.status_code == 404
+        assert self._version() == 0
+
+
+# ── /baseline_deviation/<gw> ──────────────────────────────────────────────────
+
+class TestBaselineDeviation:
+    READINGS = [{'node_id': '1', 'type': 'F', 'value': 90.0, 'time': 1.0, 'hour': 0,
+                 'day_of_week': 1, 'mean': 70.0, 'std': 2.0, 'z': 10.0, 'deviating': True}]
+
+    def test_returns_scored_readings(self, client):
+        with patch('server._bd.gateway_deviations', return_value=self.READINGS) as deviations:
+            resp = client.get('/baseline_deviation/GW-TEST?type=F,H&timezone=Europe/Berlin')
+        data = json.loads(resp.data)
+        assert data['deviating'] == 1 and data['readings'] == self.READINGS
+        assert deviations.call_args.args[1:] == ('GW-TEST', ['F', 'H'])
+        assert deviations.call_args.kwargs == {'tz': 'Europe/Berlin', 'threshold': 3.0}
+
+    def test_bad_parameters(self, client):
+        assert client.get('/baseline_deviation/GW-TEST?timezone=Nowhere/Special').status_code == 400
+        assert client.get('/baseline_deviation/GW-TEST?threshold=high').status_code == 400
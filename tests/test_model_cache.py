@@ -0,0 +1,175 @@
+"""Unit tests for model_cache.ModelCache and the cached model loaders."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import Ridge
+from sklearn.pipeline import Pipeline
+
+import anomaly_training as _at
+import model_cache
+import regression_training as _rt
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+def _write(path, payload=b'x'):
+    with open(path, 'wb') as f:
+        f.write(payload)
+    return str(path)
+
+
+class _Loader:
+    """Callable loader that counts invocations."""
+
+    def __init__(self, value='model'):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return f'{self.value}-{self.calls}'
+
+
+# ── ModelCache ────────────────────────────────────────────────────────────────
+
+class TestModelCache:
+    def test_repeat_get_skips_loader_and_stat(self, tmp_path, monkeypatch):
+        path = _write(tmp_path / 'm.joblib')
+        cache = model_cache.ModelCache(revalidate_seconds=60)
+        loader = _Loader()
+        assert cache.get('k', [path], loader) == 'model-1'
+
+        def no_stat(*args, **kwargs):
+            raise AssertionError('filesystem touched on a cache hit')
+
+        monkeypatch.setattr(model_cache.os, 'stat', no_stat)
+        assert cache.get('k', [path], loader) == 'model-1'
+        assert loader.calls == 1
+        assert cache.hits == 1
+
+    def test_mtime_change_reloads_after_revalidation(self, tmp_path):
+        path = _write(tmp_path / 'm.joblib')
+        cache = model_cache.ModelCache(revalidate_seconds=0)
+        loader = _Loader()
+        cache.get('k', [path], loader)
+        cache.get('k', [path], loader)
+        assert loader.calls == 1   # unchanged stamp → revalidated, not reloaded
+
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        assert cache.get('k', [path], loader) == 'model-2'
+
+    def test_bump_version_forces_reload(self, tmp_path):
+        path = _write(tmp_path / 'm.joblib')
+        cache = model_cache.ModelCache(revalidate_seconds=60)
+        loader = _Loader()
+        cache.get('k', [path], loader)
+        cache.bump_version('k')
+        assert cache.get('k', [path], loader) == 'model-2'
+
+    def test_missing_file_raises_and_evicts(self, tmp_path):
+        path = _write(tmp_path / 'm.joblib')
+        cache = model_cache.ModelCache(revalidate_seconds=0)
+        cache.get('k', [path], _Loader())
+        os.remove(path)
+        with pytest.raises(FileNotFoundError):
+            cache.get('k', [path], _Loader())
+        assert 'k' not in cache
+
+    def test_lru_eviction_bounded_by_bytes(self, tmp_path):
+        paths = [_write(tmp_path / f'{i}.joblib', b'x' * 100) for i in range(3)]
+        cache = model_cache.ModelCache(max_bytes=250, revalidate_seconds=60)
+        cache.get('a', [paths[0]], _Loader())
+        cache.get('b', [paths[1]], _Loader())
+        cache.get('a', [paths[0]], _Loader())   # 'a' becomes most recently used
+        cache.get('c', [paths[2]], _Loader())
+        assert 'a' in cache and 'c' in cache
+        assert 'b' not in cache
+        assert cache.total_bytes == 200
+
+    def test_size_of_overrides_file_size(self, tmp_path):
+        path = _write(tmp_path / 'small.joblib', b'x' * 10)
+        cache = model_cache.ModelCache(max_bytes=1000)
+        cache.get('k', [path], _Loader(), size_of=lambda value: 5000)
+        assert cache.total_bytes == 5000
+
+    def test_single_oversized_entry_is_kept(self, tmp_path):
+        path = _write(tmp_path / 'big.joblib', b'x' * 1000)
+        cache = model_cache.ModelCache(max_bytes=10)
+        cache.get('k', [path], _Loader())
+        assert 'k' in cache
+
+
+# ── Cached loaders ────────────────────────────────────────────────────────────
+
+class TestCachedLoaders:
+    @pytest.fixture(autouse=True)
+    def fresh_cache(self, monkeypatch):
+        monkeypatch.setattr(model_cache, 'cache', model_cache.ModelCache())
+        yield
+
+    def test_anomaly_model_roundtrip_and_reload_on_save(self, tmp_path):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame(rng.normal(size=(200, 3)), columns=['1_F', '1_H', '2_F'])
+        det = _at.IsolationForestAd(random_state=0)
+        det.train_model(df)
+        _at.save_model('GW-MC', det, 'IsolationForest', 0.9, 0.8,
+                       list(df.columns), ['1', '2'], len(df), str(tmp_path))
+
+        first, meta = _at.load_cached_model('GW-MC', str(tmp_path))
+        again, _ = _at.load_cached_model('GW-MC', str(tmp_path))
+        assert first is again
+        assert meta['model_type'] == 'IsolationForest'
+
+        _at.save_model('GW-MC', det, 'IsolationForest', 0.9, 0.85,
+                       list(df.columns), ['1', '2'], len(df), str(tmp_path))
+        reloaded, meta = _at.load_cached_model('GW-MC', str(tmp_path))
+        assert reloaded is not first
+        assert meta['f1'] == 0.85
+
+    def test_entries_sized_by_resident_bytes(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(_at._model_store, '_COMPRESS', 3)
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame(rng.normal(size=(200, 3)), columns=['1_F', '1_H', '2_F'])
+        det = _at.IsolationForestAd(random_state=0)
+        det.train_model(df)
+        _at.save_model('GW-MC', det, 'IsolationForest', 0.9, 0.8,
+                       list(df.columns), ['1', '2'], len(df), str(tmp_path))
+        _, meta = _at.load_cached_model('GW-MC', str(tmp_path))
+        assert model_cache.cache.total_bytes == meta['artifact']['resident_bytes']
+        assert meta['artifact']['resident_bytes'] > meta['artifact']['size_bytes']
+
+    def test_miss_rejects_artifact_not_matching_its_hash(self, tmp_path):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame(rng.normal(size=(200, 3)), columns=['1_F', '1_H', '2_F'])
+        det = _at.IsolationForestAd(random_state=0)
+        det.train_model(df)
+        _at.save_model('GW-MC', det, 'IsolationForest', 0.9, 0.8,
+                       list(df.columns), ['1', '2'], len(df), str(tmp_path))
+        with open(os.path.join(_at._model_dir('GW-MC', str(tmp_path)), 'model.joblib'), 'ab') as f:
+            f.write(b'\0')
+        with pytest.raises(ValueError):
+            _at.load_cached_model('GW-MC', str(tmp_path))
+        assert len(model_cache.cache) == 0
+
+    def test_regression_miss_checks_hash(self, tmp_path, monkeypatch):
+        x = pd.DataFrame(np.random.default_rng(0).normal(size=(100, 2)), columns=['a', 'b'])
+        pipe = Pipeline([('model', Ridge())]).fit(x, x['a'])
+        _rt.save_regression_model('GW-MC', '1', 'F', pipe, 'Ridge', {}, 0.9, 0.1,
+                                  ['a', 'b'], False, 0.0, len(x), str(tmp_path))
+        _rt.load_cached_regression_model('GW-MC', '1', 'F', str(tmp_path))
+        monkeypatch.setattr(model_cache, 'cache', model_cache.ModelCache())
+        with open(_rt._model_path('GW-MC', '1', 'F', str(tmp_path)), 'ab') as f:
+            f.write(b'\0')
+        with pytest.raises(ValueError):
+            _rt.load_cached_regression_model('GW-MC', '1', 'F', str(tmp_path))
+
+    def test_missing_anomaly_model_raises(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            _at.load_cached_model('GW-NONE', str(tmp_path))
+
+    def test_forecast_without_model_is_empty(self, tmp_path):
+        assert _rt.predict_sensor_forecast('GW-NONE', '1', 'F', db=None,
+                                           models_dir=str(tmp_path)) == []
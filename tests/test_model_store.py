@@ -0,0 +1,200 @@
+"""Unit tests for model_store: artifact manifests and ensemble compaction."""
+import json
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import Ridge
+from sklearn.metrics import r2_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import OneClassSVM
+
+import anomaly_training as _at
+import model_store
+import regression_training as _rt
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+def _data(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(n, 4))
+    y = 2 * x[:, 0] - x[:, 1] + 0.1 * rng.normal(size=n)
+    return x, y
+
+
+def _forest(n_estimators=40):
+    x, y = _data()
+    return RandomForestRegressor(n_estimators=n_estimators, random_state=0).fit(x[:300], y[:300])
+
+
+def _holdout_r2(model):
+    x, y = _data()
+    return r2_score(y[300:], model.predict(x[300:]))
+
+
+# ── Artifacts ─────────────────────────────────────────────────────────────────
+
+class TestArtifacts:
+    def test_manifest_describes_written_file(self, tmp_path):
+        path = str(tmp_path / 'm.joblib')
+        manifest = model_store.save_artifact(_forest(), path, compress=3)
+        assert manifest['format'] == 1
+        assert manifest['compress'] == 3
+        assert manifest['size_bytes'] == os.path.getsize(path)
+        assert manifest['resident_bytes'] > manifest['size_bytes']
+        assert len(manifest['sha256']) == 64
+        assert 'load_seconds' not in manifest
+        assert [p for p in os.listdir(tmp_path) if p.endswith('.tmp')] == []
+
+    def test_default_is_uncompressed_and_memory_mapped(self, tmp_path):
+        path = str(tmp_path / 'm.joblib')
+        model = Pipeline([('scaler', StandardScaler()), ('model', Ridge())]).fit(*_data(5000))
+        manifest = model_store.save_artifact(model, path)
+        assert manifest['compress'] == 0
+
+        loaded = model_store.load_artifact(path, manifest, mmap_mode='r')
+        assert isinstance(loaded.named_steps['scaler'].mean_, np.memmap)
+
+    def test_reload_only_with_verify(self, tmp_path, monkeypatch):
+        loads = []
+        load_artifact = model_store.load_artifact
+        monkeypatch.setattr(model_store, 'load_artifact',
+                            lambda *a, **kw: loads.append(a) or load_artifact(*a, **kw))
+        model_store.save_artifact(_forest(), str(tmp_path / 'a.joblib'))
+        assert loads == []
+        manifest = model_store.save_artifact(_forest(), str(tmp_path / 'b.joblib'), verify=True)
+        assert len(loads) == 1 and manifest['load_seconds'] >= 0
+
+    def test_compressed_artifact_is_smaller_and_ignores_mmap(self, tmp_path):
+        model = _forest()
+        raw = model_store.save_artifact(model, str(tmp_path / 'raw.joblib'), compress=0)
+        packed = model_store.save_artifact(model, str(tmp_path / 'z.joblib'), compress=3)
+        assert packed['size_bytes'] < raw['size_bytes']
+
+        loaded = model_store.load_artifact(str(tmp_path / 'z.joblib'), packed, mmap_mode='r')
+        x, _ = _data()
+        np.testing.assert_array_equal(loaded.predict(x), model.predict(x))
+
+    def test_verify_rejects_modified_file(self, tmp_path):
+        path = str(tmp_path / 'm.joblib')
+        manifest = model_store.save_artifact(Ridge().fit(*_data()), path)
+        model_store.load_artifact(path, manifest, verify=True)
+        with open(path, 'ab') as f:
+            f.write(b'\0')
+        with pytest.raises(ValueError):
+            model_store.load_artifact(path, manifest, verify=True)
+
+    def test_legacy_artifact_without_manifest_loads(self, tmp_path):
+        path = str(tmp_path / 'legacy.joblib')
+        joblib.dump(Ridge().fit(*_data()), path)
+        assert isinstance(model_store.load_artifact(path, None, mmap_mode='r'), Ridge)
+
+    def test_regression_metadata_records_manifest(self, tmp_path):
+        x, y = _data()
+        pipe = Pipeline([('scaler', StandardScaler()), ('model', Ridge())]).fit(x, y)
+        _rt.save_regression_model('GW-MS', '1', 'F', pipe, 'Ridge', {}, 0.9, 0.1,
+                                  ['a', 'b', 'c', 'd'], False, 0.0, len(x), str(tmp_path))
+        loaded, meta = _rt.load_regression_model('GW-MS', '1', 'F', str(tmp_path), mmap_mode='r')
+        assert meta['artifact']['size_bytes'] > 0
+        assert meta['artifact']['load_seconds'] >= 0
+        assert 'compaction' not in meta
+        np.testing.assert_allclose(loaded.predict(x), pipe.predict(x))
+
+    def test_anomaly_metadata_records_load_time(self, tmp_path):
+        _at.save_model('GW-MS', Ridge().fit(*_data()), 'Ridge', 0.9, 0.8,
+                       ['a', 'b', 'c', 'd'], ['1'], 400, str(tmp_path))
+        _, meta = _at.load_model('GW-MS', str(tmp_path))
+        assert meta['artifact']['load_seconds'] >= 0
+        assert meta['artifact']['sha256']
+
+
+# ── Shared layout ─────────────────────────────────────────────────────────────
+
+class TestSharedLayout:
+    @pytest.fixture(autouse=True)
+    def small_threshold(self, monkeypatch):
+        monkeypatch.setattr(model_store, '_SHARED_MIN_BYTES', 1024)
+
+    def test_large_arrays_are_memory_mapped(self, tmp_path):
+        x, _ = _data(2000)
+        model = OneClassSVM(nu=0.5).fit(x)
+        path = str(tmp_path / 'svm.joblib')
+        manifest = model_store.save_artifact(model, path, shared=True)
+        assert manifest['layout'] == 'shared'
+        assert manifest['arrays'] >= 1
+        assert os.path.isdir(tmp_path / manifest['array_dir'])
+
+        loaded = model_store.load_artifact(path, manifest, mmap_mode='r')
+        assert isinstance(loaded.support_vectors_, np.memmap)
+        assert not loaded.support_vectors_.flags.writeable
+        np.testing.assert_array_equal(loaded.predict(x), model.predict(x))
+
+    def test_layout_detected_without_manifest(self, tmp_path):
+        model = _forest(5)
+        path = str(tmp_path / 'rf.joblib')
+        model_store.save_artifact(model, path, shared=True)
+        loaded = model_store.load_artifact(path)
+        x, _ = _data()
+        np.testing.assert_array_equal(loaded.predict(x), model.predict(x))
+
+    def test_old_generations_pruned(self, tmp_path):
+        path = str(tmp_path / 'rf.joblib')
+        dirs = [model_store.save_artifact(_forest(5), path, shared=True)['array_dir']
+                for _ in range(4)]
+        remaining = sorted(p for p in os.listdir(tmp_path) if '.arrays.' in p)
+        assert remaining == sorted(dirs[-2:])
+
+
+# ── Compaction ────────────────────────────────────────────────────────────────
+
+class TestCompaction:
+    def test_forest_pruned_within_tolerance(self):
+        model = _forest()
+        compact, report = model_store.compact_ensemble(model, _holdout_r2, tolerance=0.02)
+        assert report['applied']
+        assert report['trees_after'] < report['trees_before'] == 40
+        assert report['score_after'] >= report['score_before'] - 0.02
+        assert len(model.estimators_) == 40   # original untouched
+
+    def test_pruned_forest_keeps_exact_node_values(self):
+        model = _forest()
+        compact, report = model_store.compact_ensemble(model, _holdout_r2, tolerance=0.02)
+        x, _ = _data()
+        kept = model.estimators_[:report['trees_after']]
+        np.testing.assert_array_equal(compact.predict(x),
+                                      np.mean([t.predict(x) for t in kept], axis=0))
+
+    def test_no_candidate_returns_model_unchanged(self):
+        model = _forest()
+        same, report = model_store.compact_ensemble(model, _holdout_r2, tolerance=-1.0)
+        assert same is model and not report['applied']
+
+    def test_gradient_boosting_in_pipeline(self):
+        x, y = _data()
+        pipe = Pipeline([('scaler', StandardScaler()),
+                         ('model', GradientBoostingRegressor(n_estimators=80, random_state=0))])
+        pipe.fit(x[:300], y[:300])
+        compact, report = model_store.compact_ensemble(pipe, _holdout_r2, tolerance=0.05)
+        assert report['applied']
+        assert compact.steps[-1][1].n_estimators_ == report['trees_after']
+        assert compact.predict(x).shape == (len(x),)
+
+    def test_apply_compaction_replays_fraction(self):
+        _, report = model_store.compact_ensemble(_forest(), _holdout_r2, tolerance=0.02)
+        sibling = model_store.apply_compaction(_forest(), report)
+        assert len(sibling.estimators_) == report['trees_after']
+
+    def test_non_ensemble_passthrough(self):
+        model = Ridge().fit(*_data())
+        same, report = model_store.compact_ensemble(model, _holdout_r2, tolerance=0.1)
+        assert same is model
+        assert not report['applied']
+        assert model_store.apply_compaction(model, {'applied': True, 'fraction': 0.5}) is model
+
+    def test_report_is_json_serialisable(self):
+        _, report = model_store.compact_ensemble(_forest(), _holdout_r2, tolerance=0.02)
+        json.dumps(report)
@@ -0,0 +1,135 @@
+"""Unit tests for notifications: batched, per-user push dispatch."""
+import threading
+import time
+
+import mongomock
+import pytest
+
+import notifications as _notifications
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient().db
+    db.DeviceTokens.insert_many([
+        {'email': 'a@x', 'platform': 'ios', 'token': 'tok-a-ios'},
+        {'email': 'a@x', 'platform': 'android', 'token': 'tok-a-android'},
+        {'email': 'b@x', 'platform': 'ios', 'token': 'tok-b'},
+    ])
+    return db
+
+
+class StubTransport:
+    """Records sends; tokens in `unregistered` are reported as gone."""
+
+    def __init__(self, unregistered=(), delay=0.0):
+        self.sent = []
+        self.unregistered = set(unregistered)
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def send(self, token, title, body, data):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+            self.sent.append((token, title, body, data))
+        return token not in self.unregistered
+
+    def close(self):
+        self.closed = True
+
+
+def _alert(rule_id, email='a@x'):
+    return {'rule_id': rule_id, 'email': email, 'message': f'{rule_id}: 99 > 95'}
+
+
+def _dispatcher(db, transport, **kw):
+    return _notifications.NotificationDispatcher(db, transport=transport, batch_window=0.05, **kw)
+
+
+# ── Dispatch ──────────────────────────────────────────────────────────────────
+
+class TestDispatcher:
+    def test_groups_alerts_per_user_and_sends_to_each_token(self, db):
+        transport = StubTransport()
+        dispatcher = _dispatcher(db, transport)
+        for alert in (_alert('r1'), _alert('r2'), _alert('r3', 'b@x')):
+            assert dispatcher.enqueue(alert)
+        dispatcher.flush()
+        sent = {token: (title, body) for token, title, body, _ in transport.sent}
+        assert set(sent) == {'tok-a-ios', 'tok-a-android', 'tok-b'}
+        assert sent['tok-a-ios'] == ('2 sensor alerts', 'r1: 99 > 95; r2: 99 > 95')
+        assert sent['tok-b'] == ('Sensor alert', 'r3: 99 > 95')
+        stats = dispatcher.stats()
+        assert stats['sent'] == 3 and stats['enqueued'] == 3
+        assert set(stats['latency']) == {'p50', 'p95', 'p99', 'max'}
+        dispatcher.close()
+        assert transport.closed
+
+    def test_one_token_query_per_batch(self, db, monkeypatch):
+        queries = []
+        collection = type(db.DeviceTokens)
+        find = collection.find
+        monkeypatch.setattr(collection, 'find',
+                            lambda self, *a, **kw: queries.append(a[0]) or find(self, *a, **kw))
+        dispatcher = _dispatcher(db, StubTransport())
+        for i in range(50):
+            dispatcher.enqueue(_alert(f'r{i}', 'a@x' if i % 2 else 'b@x'))
+        dispatcher.flush()
+        assert len(queries) == dispatcher.stats()['batches'] < 50
+        assert sorted(queries[0]['email']['$in']) == ['a@x', 'b@x']
+        dispatcher.close()
+
+    def test_concurrency_is_bounded(self, db):
+        db.DeviceTokens.insert_many([{'email': 'c@x', 'token': f'tok-c{i}'} for i in range(12)])
+        transport = StubTransport(delay=0.02)
+        dispatcher = _dispatcher(db, transport, workers=3)
+        dispatcher.enqueue(_alert('storm', 'c@x'))
+        dispatcher.flush()
+        assert len(transport.sent) == 12
+        assert transport.peak <= 3
+        dispatcher.close()
+
+    def test_enqueue_never_blocks_when_full(self, db):
+        gate = threading.Event()
+
+        class BlockedTransport(StubTransport):
+            def send(self, *a):
+                gate.wait()
+                return True
+
+        dispatcher = _dispatcher(db, BlockedTransport(), max_queue=2)
+        results = [dispatcher.enqueue(_alert(f'r{i}')) for i in range(10)]
+        assert results.count(False) >= 1
+        assert dispatcher.stats()['dropped'] == results.count(False)
+        gate.set()
+        dispatcher.close()
+
+    def test_unregistered_tokens_removed_and_failures_counted(self, db):
+        class FlakyTransport(StubTransport):
+            def send(self, token, *a):
+                if token == 'tok-b':
+                    raise ConnectionError('reset')
+                return super().send(token, *a)
+
+        dispatcher = _dispatcher(db, FlakyTransport(unregistered={'tok-a-android'}))
+        dispatcher.enqueue(_alert('r1'))
+        dispatcher.enqueue(_alert('r2', 'b@x'))
+        dispatcher.enqueue(_alert('r3', 'nobody@x'))
+        dispatcher.flush()
+        stats = dispatcher.stats()
+        assert (stats['sent'], stats['failed'], stats['no_tokens'], stats['tokens_removed']) == (1, 1, 1, 1)
+        assert db.DeviceTokens.count_documents({'token': 'tok-a-android'}) == 0
+        dispatcher.close()
+
+    def test_transport_from_env(self, monkeypatch):
+        monkeypatch.delenv('FCM_CREDENTIALS', raising=False)
+        assert isinstance(_notifications.transport_from_env(), _notifications.LogTransport)
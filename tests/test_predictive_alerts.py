@@ -0,0 +1,106 @@
+"""Unit tests for predictive_alerts: fleet frost/heat scan over NOAA forecasts."""
+import mongomock
+import pytest
+
+import predictive_alerts as _pa
+
+NOW = 1_700_000_000
+HOUR = 3600
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def _settings(db, email, gw, **kw):
+    db.NOAASettings.insert_one({'email': email, 'gateway_id': gw, 'enabled': True,
+                                'predictive_alerts_enabled': True,
+                                'frost_threshold': 35.0, 'heat_threshold': 95.0, **kw})
+
+
+def _forecast(db, gw, temps, start=NOW + HOUR):
+    """Hourly forecast readings from start; values stored as strings like the ingester."""
+    db.Sensors.insert_many([{'gateway_id': gw, 'node_id': 'noaa_forecast', 'type': 'F',
+                             'value': str(t), 'time': start + i * HOUR}
+                            for i, t in enumerate(temps)])
+
+
+def _emitted(report):
+    return sorted((a['email'], a['gateway_id'], a['kind']) for a in report['alerts'])
+
+
+# ── Scan ──────────────────────────────────────────────────────────────────────
+
+class TestScan:
+    def test_frost_and_heat_crossings(self, db):
+        _settings(db, 'a@x', 'GW-COLD')
+        _settings(db, 'b@x', 'GW-HOT', heat_threshold=90)
+        _settings(db, 'c@x', 'GW-MILD')
+        _forecast(db, 'GW-COLD', [40, 36, 33, 31, 34])
+        _forecast(db, 'GW-HOT', [85, 91, 93])
+        _forecast(db, 'GW-MILD', [60, 65])
+        pushed = []
+        report = _pa.scan(db, push=pushed.append, now=NOW)
+        assert _emitted(report) == [('a@x', 'GW-COLD', 'frost'), ('b@x', 'GW-HOT', 'heat')]
+        frost = next(a for a in pushed if a['kind'] == 'frost')
+        assert frost['value'] == 31 and frost['time'] == NOW + 3 * HOUR
+        assert frost['message'] == 'Frost forecast: low of 31°F in 3 h (threshold 35°F)'
+
+    def test_only_new_crossings_are_emitted(self, db):
+        _settings(db, 'a@x', 'GW-1')
+        _forecast(db, 'GW-1', [34, 33])
+        assert _pa.scan(db, now=NOW)['emitted'] == 1
+        report = _pa.scan(db, now=NOW)
+        assert report['crossings'] == 1 and report['emitted'] == 0
+
+        # Warm spell clears the state, the next cold snap warns again
+        db.Sensors.delete_many({})
+        _forecast(db, 'GW-1', [50, 52])
+        assert _pa.scan(db, now=NOW)['emitted'] == 0
+        assert not db.PredictiveAlertState.find_one({'kind': 'frost'})['active']
+        db.Sensors.delete_many({})
+        _forecast(db, 'GW-1', [30])
+        assert _pa.scan(db, now=NOW)['emitted'] == 1
+
+    def test_missing_forecast_keeps_state(self, db):
+        _settings(db, 'a@x', 'GW-1')
+        _forecast(db, 'GW-1', [30])
+        _pa.scan(db, now=NOW)
+        db.Sensors.delete_many({})
+        assert _pa.scan(db, now=NOW)['forecasts'] == 0
+        assert db.PredictiveAlertState.find_one({'kind': 'frost'})['active']
+
+    def test_disabled_settings_and_past_or_distant_forecasts_ignored(self, db):
+        _settings(db, 'a@x', 'GW-1', predictive_alerts_enabled=False)
+        _settings(db, 'b@x', 'GW-2', enabled=False)
+        _settings(db, 'c@x', 'GW-3')
+        _forecast(db, 'GW-1', [20])
+        _forecast(db, 'GW-2', [20])
+        _forecast(db, 'GW-3', [20], start=NOW - 2 * HOUR)
+        _forecast(db, 'GW-3', [20], start=NOW + 60 * HOUR)
+        report = _pa.scan(db, now=NOW, hours=48)
+        assert report['settings'] == 1 and report['forecasts'] == 0
+        assert report['emitted'] == 0
+
+    def test_shared_gateway_uses_each_users_threshold(self, db):
+        _settings(db, 'a@x', 'GW-1', frost_threshold=32)
+        _settings(db, 'b@x', 'GW-1', frost_threshold=36)
+        _forecast(db, 'GW-1', [34, 35])
+        assert _emitted(_pa.scan(db, now=NOW)) == [('b@x', 'GW-1', 'frost')]
+
+    def test_two_reads_for_the_whole_fleet(self, db, monkeypatch):
+        for i in range(20):
+            _settings(db, f'u{i}@x', f'GW-{i}')
+            _forecast(db, f'GW-{i}', [30 if i % 2 else 60, 100 if i % 3 == 0 else 70])
+        calls = []
+        collection = type(db.Sensors)
+        find = collection.find
+        monkeypatch.setattr(collection, 'find',
+                            lambda self, *a, **kw: calls.append(self.name) or find(self, *a, **kw))
+        report = _pa.scan(db, now=NOW)
+        assert calls.count('NOAASettings') == 1 and calls.count('Sensors') == 1
+        assert report['gateways'] == 20
+        assert report['emitted'] == 10 + 7
@@ -0,0 +1,438 @@
+"""Unit tests for regression_training data loading and model selection."""
+import mongomock
+import numpy as np
+import pandas as pd
+import pytest
+
+import regression_training as _rt
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+def _sensor_frame(n_hours=400, seed=0):
+    """Hourly indoor temperature driven by NOAA temperature and time of day."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'hour_bucket': 1_700_000_000 + 3600 * np.arange(n_hours)})
+    _rt._add_time_features(df)
+    df['noaa_temp_f'] = 50 + 10 * np.sin(np.arange(n_hours) / 24) + rng.normal(size=n_hours)
+    df['sensor_value'] = (60 + 0.3 * df['noaa_temp_f'] + 2 * df['hour_sin']
+                          + 0.2 * rng.normal(size=n_hours))
+    return df
+
+
+@pytest.fixture
+def small_grid(monkeypatch):
+    monkeypatch.setattr(_rt, '_REGRESSION_GRID', [
+        (_rt.Ridge, {'alpha': 1.0}),
+        (_rt.Ridge, {'alpha': 100.0}),
+        (_rt.RandomForestRegressor, {'n_estimators': 10, 'max_depth': 4, 'random_state': 42}),
+    ])
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def _seed_gateway(db, gateway_id='GW-R', n_hours=150, seed=0):
+    """Three readings an hour for nodes 1 and 2 (F/H/P), hourly NOAA for 2/3 of it."""
+    rng = np.random.default_rng(seed)
+    t0 = 1_700_000_000
+    docs = []
+    for node in ('1', '2'):
+        for i in range(n_hours * 3):
+            ts = t0 + i * 1200 + float(rng.integers(0, 600))
+            for type_, base in (('F', 70), ('H', 40), ('P', 1000)):
+                value = base + rng.normal()
+                docs.append({'gateway_id': gateway_id, 'node_id': node, 'type': type_,
+                             'value': f"b'{value:.2f}'" if i % 2 else value, 'time': ts})
+    for h in range(n_hours * 2 // 3):
+        docs.append({'gateway_id': gateway_id, 'node_id': 'noaa_forecast', 'type': 'F',
+                     'value': 50 + rng.normal(), 'time': t0 + h * 3600 + 60})
+    docs.append({'gateway_id': gateway_id, 'node_id': '3', 'type': 'F',
+                 'value': 70.0, 'time': t0})
+    docs.append({'gateway_id': 'OTHER', 'node_id': '1', 'type': 'F', 'value': 1.0, 'time': t0})
+    db.Sensors.insert_many(docs)
+
+
+# ── Data loading ──────────────────────────────────────────────────────────────
+
+def _reference_frame(db, gateway_id, node_id, sensor_type):
+    """The original per-sensor loader: every reading in memory, pandas groupby."""
+    rows = pd.DataFrame(list(db.Sensors.find(
+        {'gateway_id': gateway_id, 'node_id': node_id, 'type': sensor_type})))
+    rows['value'] = rows['value'].apply(_rt._clean_value)
+    rows = rows.dropna(subset=['value'])
+    rows['hour_bucket'] = (rows['time'] // 3600).astype(int) * 3600
+    df = (rows.groupby('hour_bucket')['value'].mean().reset_index()
+              .rename(columns={'value': 'sensor_value'}))
+    noaa = pd.DataFrame(list(db.Sensors.find(
+        {'gateway_id': gateway_id, 'node_id': 'noaa_forecast', 'type': 'F'})))
+    noaa['hour_bucket'] = (noaa['time'] // 3600).astype(int) * 3600
+    noaa = (noaa.groupby('hour_bucket')['value'].first().reset_index()
+                .rename(columns={'value': 'noaa_temp_f'}))
+    df = _rt._add_time_features(df.merge(noaa, on='hour_bucket', how='left'))
+    return df.sort_values('hour_bucket').reset_index(drop=True)
+
+
+class TestGatewaySensorFrames:
+    def test_matches_reference_loader(self, db):
+        _seed_gateway(db)
+        frames = _rt.get_gateway_sensor_frames(db, 'GW-R')
+        assert set(frames) == {('1', 'F'), ('1', 'H'), ('2', 'F'), ('2', 'H'), ('3', 'F')}
+        for (node_id, sensor_type), result in frames.items():
+            if node_id == '3':
+                assert result is None
+                continue
+            df, coverage = result
+            expected = _reference_frame(db, 'GW-R', node_id, sensor_type)
+            assert coverage == pytest.approx(expected['noaa_temp_f'].notna().mean())
+            pd.testing.assert_frame_equal(df, expected[df.columns], check_dtype=False)
+
+    def test_chunked_streaming_matches(self, db, monkeypatch):
+        _seed_gateway(db)
+        whole = _rt.get_gateway_sensor_frames(db, 'GW-R')
+        monkeypatch.setattr(_rt, '_HOURLY_CHUNK_ROWS', 97)
+        chunked = _rt.get_gateway_sensor_frames(db, 'GW-R')
+        for key, result in whole.items():
+            if result is not None:
+                pd.testing.assert_frame_equal(chunked[key][0], result[0])
+
+    def test_server_side_aggregate_is_used(self, db, monkeypatch):
+        docs = [{'_id': {'node_id': '1', 'type': 'F', 'hour': float(1_700_000_000 // 3600 * 3600
+                                                                   + 3600 * h)},
+                 'count': 3, 'sum': 210.0 + h, 'valid': 3, 'first': 70.0} for h in range(120)]
+        docs.append({'_id': {'node_id': 'noaa_forecast', 'type': 'F',
+                             'hour': docs[0]['_id']['hour']},
+                     'count': 1, 'sum': 50.0, 'valid': 1, 'first': 50.0})
+        seen = []
+        monkeypatch.setattr(db.Sensors, 'aggregate',
+                            lambda pipeline, **kw: seen.append(pipeline) or iter(docs))
+        monkeypatch.setattr(db.Sensors, 'find', lambda *a, **kw: pytest.fail('streamed'))
+        df, coverage = _rt.get_gateway_sensor_frames(db, 'GW-R')[('1', 'F')]
+        assert seen[0][-1]['$group']['_id']['hour']
+        assert len(df) == 120
+        assert df['sensor_value'].iloc[1] == pytest.approx(211.0 / 3)
+        assert df['noaa_temp_f'].iloc[0] == 50.0
+        assert coverage == pytest.approx(1 / 120)
+
+    def test_server_pipeline_matches_streamed_fold(self, db, monkeypatch):
+        # mongomock has no $convert: with numeric values the stage is '$value'.
+        rng = np.random.default_rng(1)
+        t0 = 1_700_000_000
+        docs = [{'gateway_id': 'GW-R', 'node_id': node, 'type': 'F', 'time': t0 + i * 900 + 7,
+                 'value': round(float(v), 2)}
+                for node in ('1', 'noaa_forecast') for i, v in enumerate(50 + rng.normal(size=96))]
+        db.Sensors.insert_many([docs[i] for i in rng.permutation(len(docs))])
+        pipeline = _rt._hourly_pipeline
+
+        def without_convert(match):
+            stages = pipeline(match)
+            next(s for s in stages if '$project' in s)['$project']['v'] = '$value'
+            return stages
+
+        monkeypatch.setattr(_rt, '_hourly_pipeline', without_convert)
+        match = _rt._hourly_match('GW-R', None, ('F',))
+        keys = ['node_id', 'type', 'hour_bucket']
+        server = _rt._hourly_readings(db, match).sort_values(keys).reset_index(drop=True)
+        streamed = _rt._hourly_readings_streamed(db, match).sort_values(keys).reset_index(drop=True)
+        assert len(server) == 48
+        pd.testing.assert_frame_equal(server, streamed, check_dtype=False)
+        earliest = {(d['node_id'], d['time'] // 3600 * 3600): d['value']
+                    for d in sorted(docs, key=lambda d: -d['time'])}
+        assert server['first'].tolist() == [earliest[(n, h)] for n, h in
+                                            zip(server['node_id'], server['hour_bucket'])]
+
+    def test_first_skips_unparseable_earliest_reading(self, db, monkeypatch):
+        # Stored None stands in for a value $convert cannot parse
+        t0 = 1_700_000_000 // 3600 * 3600
+        db.Sensors.insert_many([
+            {'gateway_id': 'GW-R', 'node_id': 'noaa_forecast', 'type': 'F', 'time': t0 + s, 'value': v}
+            for s, v in ((60, None), (600, 41.5), (1200, 42.0), (3660, None))])
+        pipeline = _rt._hourly_pipeline
+
+        def without_convert(match):
+            stages = pipeline(match)
+            next(s for s in stages if '$project' in s)['$project']['v'] = '$value'
+            return stages
+
+        monkeypatch.setattr(_rt, '_hourly_pipeline', without_convert)
+        match = _rt._hourly_match('GW-R', None, ('F',))
+        keys = ['node_id', 'type', 'hour_bucket']
+        server = _rt._hourly_readings(db, match).sort_values(keys).reset_index(drop=True)
+        streamed = _rt._hourly_readings_streamed(db, match).sort_values(keys).reset_index(drop=True)
+        pd.testing.assert_frame_equal(server, streamed, check_dtype=False)
+        assert server['count'].tolist() == [3, 1]
+        assert server['valid'].tolist() == [2, 0]
+        assert server['first'].iloc[0] == 41.5 and np.isnan(server['first'].iloc[1])
+
+    def test_per_sensor_loader_selects_one_sensor(self, db):
+        _seed_gateway(db)
+        df, _ = _rt.get_sensor_dataframe(db, 'GW-R', '2', 'H')
+        expected = _reference_frame(db, 'GW-R', '2', 'H')
+        pd.testing.assert_frame_equal(df, expected[df.columns], check_dtype=False)
+        assert _rt.get_sensor_dataframe(db, 'GW-R', '3', 'F') is None
+
+    def test_single_sensors_query(self, db, monkeypatch):
+        _seed_gateway(db)
+        calls = []
+        find = db.Sensors.find
+
+        def counting_find(*args, **kwargs):
+            if args:   # mongomock's aggregate calls find() internally
+                calls.append(args)
+            return find(*args, **kwargs)
+
+        monkeypatch.setattr(db.Sensors, 'find', counting_find)
+        _rt.get_gateway_sensor_frames(db, 'GW-R')
+        assert len(calls) == 1
+
+    def test_sparse_sensor_reported_as_none(self, db):
+        _seed_gateway(db)
+        assert _rt.get_gateway_sensor_frames(db, 'GW-R')[('3', 'F')] is None
+
+    def test_unknown_gateway_is_empty(self, db):
+        assert _rt.get_gateway_sensor_frames(db, 'GW-NONE') == {}
+
+
+# ── train_regression_for_sensor ───────────────────────────────────────────────
+
+class TestTrainRegressionForSensor:
+    def test_parallel_matches_sequential(self, small_grid):
+        df = _sensor_frame()
+        seq = _rt.train_regression_for_sensor(df, 1.0, n_jobs=1)
+        par = _rt.train_regression_for_sensor(df, 1.0, n_jobs=2)
+        assert seq[1:3] == par[1:3]
+        assert seq[3] == pytest.approx(par[3])
+        assert seq[5] == ['noaa_temp_f', 'hour_sin', 'hour_cos', 'dow_sin', 'dow_cos']
+        np.testing.assert_allclose(seq[0].predict(df[seq[5]]), par[0].predict(df[par[5]]))
+
+    def test_variant_seconds_recorded_in_metadata(self, small_grid, tmp_path):
+        df = _sensor_frame()
+        pipe, name, params, r2, rmse, features, noaa_mean = \
+            _rt.train_regression_for_sensor(df, 1.0, n_jobs=1, race=False)
+        assert len(pipe.cv_seconds_) == 3
+        assert all(s >= 0 for s in pipe.cv_seconds_.values())
+
+        _rt.save_regression_model('GW-RT', '1', 'F', pipe, name, params, r2, rmse,
+                                  features, True, noaa_mean, len(df), str(tmp_path))
+        _, meta = _rt.load_regression_model('GW-RT', '1', 'F', str(tmp_path))
+        assert meta['variant_seconds'] == pipe.cv_seconds_
+
+    def test_failing_variant_is_skipped(self, monkeypatch):
+        monkeypatch.setattr(_rt, '_REGRESSION_GRID', [
+            (_rt.Ridge, {'alpha': 1.0}),
+            (_rt.Ridge, {'alpha': 1.0, 'no_such_param': 1}),
+        ])
+        pipe, name, *_ = _rt.train_regression_for_sensor(_sensor_frame(), 1.0, n_jobs=1)
+        assert name == 'Ridge'
+        assert len(pipe.cv_seconds_) == 1
+
+    def test_without_noaa_uses_time_features_only(self, small_grid):
+        *_, features, noaa_mean = _rt.train_regression_for_sensor(_sensor_frame(), 0.0, n_jobs=1)
+        assert features == ['hour_sin', 'hour_cos', 'dow_sin', 'dow_cos']
+        assert noaa_mean == 0.0
+
+    @pytest.fixture
+    def forest_only(self, monkeypatch):
+        monkeypatch.setattr(_rt._model_store, 'COMPACT_ENABLED', True)
+        monkeypatch.setattr(_rt, '_REGRESSION_GRID', [
+            (_rt.RandomForestRegressor, {'n_estimators': 20, 'max_depth': 4, 'random_state': 42}),
+        ])
+
+    def test_compaction_revalidated_on_refit(self, forest_only):
+        pipe, *_ = _rt.train_regression_for_sensor(_sensor_frame(), 1.0, n_jobs=1)
+        report = pipe.compaction_
+        assert len(pipe.steps[-1][1].estimators_) == report['trees_after']
+        assert report['final_score_after'] >= report['final_score_before'] - _rt._COMPACT_TOLERANCE
+
+    def test_compaction_rejected_when_refit_degrades(self, forest_only, monkeypatch):
+        def degrading(model, report):
+            compacted = _rt._model_store._compacted(model, report['fraction'])
+            compacted.steps[-1][1].estimators_[0].tree_.value[:] += 50.0
+            return compacted
+
+        monkeypatch.setattr(_rt._model_store, 'apply_compaction', degrading)
+        pipe, *_ = _rt.train_regression_for_sensor(_sensor_frame(), 1.0, n_jobs=1)
+        assert getattr(pipe, 'compaction_', None) is None
+        assert len(pipe.steps[-1][1].estimators_) == 20
+
+
+# ── Grid racing ───────────────────────────────────────────────────────────────
+
+class TestGridRacing:
+    @pytest.fixture
+    def calls(self, monkeypatch):
+        """Record (model class name, fold end) for every fit."""
+        seen = []
+        fit_fold = _rt._fit_fold
+
+        def recording(model_cls, params, X, y, train, val, keep_model):
+            seen.append((model_cls.__name__, val.stop))
+            return fit_fold(model_cls, params, X, y, train, val, keep_model)
+
+        monkeypatch.setattr(_rt, '_fit_fold', recording)
+        return seen
+
+    def test_losing_variant_is_pruned_early(self, monkeypatch, calls):
+        # A depth-1 stump cannot follow the NOAA-driven signal the way Ridge can.
+        monkeypatch.setattr(_rt, '_REGRESSION_GRID', [
+            (_rt.Ridge, {'alpha': 1.0}),
+            (_rt.GradientBoostingRegressor, {'n_estimators': 5, 'max_depth': 1,
+                                             'learning_rate': 0.1, 'random_state': 42}),
+        ])
+        pipe, name, *_ = _rt.train_regression_for_sensor(_sensor_frame(), 1.0, n_jobs=1)
+        assert name == 'Ridge'
+        key = next(iter(pipe.cv_pruned_))
+        assert key.startswith('GradientBoostingRegressor')
+        assert sum(1 for cls, _ in calls if cls == 'GradientBoostingRegressor') \
+            == _rt._RACE_MIN_FOLDS
+        assert sum(1 for cls, _ in calls if cls == 'Ridge') == _rt._CV_SPLITS
+
+    def test_racing_picks_same_winner_as_full_grid(self, small_grid):
+        df = _sensor_frame(seed=3)
+        full = _rt.train_regression_for_sensor(df, 1.0, n_jobs=1, race=False)
+        raced = _rt.train_regression_for_sensor(df, 1.0, n_jobs=1, race=True)
+        assert raced[1:3] == full[1:3]
+        assert raced[3] == pytest.approx(full[3])
+
+    def test_competitive_variant_survives(self, monkeypatch):
+        monkeypatch.setattr(_rt, '_RACE_TOLERANCE', 10.0)
+        monkeypatch.setattr(_rt, '_REGRESSION_GRID', [
+            (_rt.Ridge, {'alpha': 1.0}),
+            (_rt.RandomForestRegressor, {'n_estimators': 5, 'max_depth': 3, 'random_state': 42}),
+        ])
+        pipe, *_ = _rt.train_regression_for_sensor(_sensor_frame(), 1.0, n_jobs=1)
+        assert pipe.cv_pruned_ == {}
+        assert len(pipe.cv_seconds_) == 2
+
+
+# ── Forecasts ─────────────────────────────────────────────────────────────────
+
+class TestGatewayForecasts:
+    @pytest.fixture
+    def models_dir(self, tmp_path, monkeypatch):
+        import model_cache
+        monkeypatch.setattr(model_cache, 'cache', model_cache.ModelCache())
+        df = _sensor_frame()
+        for node_id, noaa in (('1', True), ('2', False)):
+            features = (['noaa_temp_f'] if noaa else []) + ['hour_sin', 'hour_cos',
+                                                            'dow_sin', 'dow_cos']
+            pipe = _rt.Pipeline([('scaler', _rt.StandardScaler()), ('model', _rt.Ridge())])
+            pipe.fit(df[features], df['sensor_value'])
+            _rt.save_regression_model('GW-F', node_id, 'F', pipe, 'Ridge', {}, 0.9, 0.1,
+                                      features, noaa, 55.0, len(df), str(tmp_path))
+        return str(tmp_path)
+
+    def _seed_noaa_forecast(self, db, hours=6):
+        now = int(_rt.time.time() // 3600 + 1) * 3600
+        db.Sensors.insert_many([{'gateway_id': 'GW-F', 'node_id': 'noaa_forecast', 'type': 'F',
+                                 'value': f"b'{60 + h}'", 'time': now + h * 3600}
+                                for h in range(hours)])
+
+    def test_matches_per_sensor_forecast(self, db, models_dir):
+        self._seed_noaa_forecast(db)
+        batch = _rt.predict_gateway_forecasts('GW-F', db, hours=12, models_dir=models_dir)
+        assert [(f['node_id'], f['type']) for f in batch] == [('1', 'F'), ('2', 'F')]
+        for entry in batch:
+            single = _rt.predict_sensor_forecast('GW-F', entry['node_id'], 'F', db,
+                                                 hours=12, models_dir=models_dir)
+            assert entry['forecast'] == single
+        assert len(batch[0]['forecast']) == 6    # NOAA forecast hours
+        assert len(batch[1]['forecast']) == 12   # synthetic hours
+
+    def test_noaa_queried_once(self, db, models_dir, monkeypatch):
+        self._seed_noaa_forecast(db)
+        calls = []
+        find = db.Sensors.find
+        monkeypatch.setattr(db.Sensors, 'find',
+                            lambda *a, **kw: calls.append(a) or find(*a, **kw))
+        _rt.predict_gateway_forecasts('GW-F', db, hours=12, models_dir=models_dir)
+        assert len(calls) == 1
+
+    def test_without_noaa_records_falls_back_to_mean(self, db, models_dir):
+        batch = _rt.predict_gateway_forecasts('GW-F', db, hours=4, models_dir=models_dir)
+        assert all(len(entry['forecast']) == 4 for entry in batch)
+
+    def test_gateway_without_models(self, db, tmp_path):
+        assert _rt.predict_gateway_forecasts('GW-NONE', db, models_dir=str(tmp_path)) == []
+
+
+# ── Forecast cache ────────────────────────────────────────────────────────────
+
+class TestForecastCache:
+    models_dir = TestGatewayForecasts.models_dir
+    _seed_noaa_forecast = TestGatewayForecasts._seed_noaa_forecast
+
+    def _count_predicts(self, monkeypatch):
+        calls = []
+        forecast_with = _rt._forecast_with
+        monkeypatch.setattr(_rt, '_forecast_with',
+                            lambda *a: calls.append(a) or forecast_with(*a))
+        return calls
+
+    def test_second_request_is_cache_read(self, db, models_dir, monkeypatch):
+        self._seed_noaa_forecast(db)
+        calls = self._count_predicts(monkeypatch)
+        first = _rt.predict_gateway_forecasts('GW-F', db, hours=12, models_dir=models_dir)
+        assert len(calls) == 2
+        assert db.RegressionForecasts.count_documents({'gateway_id': 'GW-F'}) == 2
+        second = _rt.predict_gateway_forecasts('GW-F', db, hours=12, models_dir=models_dir)
+        assert len(calls) == 2
+        assert second == first
+
+    def test_new_noaa_batch_invalidates_noaa_models_only(self, db, models_dir, monkeypatch):
+        self._seed_noaa_forecast(db)
+        _rt.predict_gateway_forecasts('GW-F', db, hours=12, models_dir=models_dir)
+        db.Sensors.update_many({'node_id': 'noaa_forecast'}, {'$set': {'value': "b'70'"}})
+        calls = self._count_predicts(monkeypatch)
+        batch = _rt.predict_gateway_forecasts('GW-F', db, hours=12, models_dir=models_dir)
+        assert len(calls) == 1                    # node 1 uses NOAA, node 2 does not
+        assert batch[0]['forecast'] == _rt.predict_sensor_forecast(
+            'GW-F', '1', 'F', db, hours=12, models_dir=models_dir)
+
+    def test_retrain_invalidates(self, db, models_dir, monkeypatch):
+        _rt.predict_gateway_forecasts('GW-F', db, hours=4, models_dir=models_dir)
+        db.RegressionForecasts.update_many({}, {'$set': {'trained_at': 'older'}})
+        calls = self._count_predicts(monkeypatch)
+        _rt.predict_gateway_forecasts('GW-F', db, hours=4, models_dir=models_dir)
+        assert len(calls) == 2
+
+    def test_refresh_warms_and_prunes(self, db, models_dir):
+        self._seed_noaa_forecast(db)
+        assert _rt.refresh_cached_forecasts(db, models_dir, hours=12) == 2
+        assert _rt.refresh_cached_forecasts(db, models_dir, hours=12) == 0
+        db.RegressionForecasts.insert_one({'gateway_id': 'GW-F', 'node_id': '9', 'type': 'F',
+                                           'hours': 12, 'forecast': []})
+        db.Sensors.insert_one({'gateway_id': 'GW-F', 'node_id': 'noaa_forecast', 'type': 'F',
+                               'value': "b'80'", 'time': _rt.time.time() + 7200.5})
+        assert _rt.refresh_cached_forecasts(db, models_dir, hours=12) == 1
+        assert db.RegressionForecasts.count_documents({'node_id': '9'}) == 0
+
+    def test_refresh_skips_unread_horizons(self, db, models_dir):
+        _rt.predict_gateway_forecasts('GW-F', db, hours=6, models_dir=models_dir)
+        _rt.predict_gateway_forecasts('GW-F', db, hours=24, models_dir=models_dir)
+        idle = _rt._utc(_rt.time.time() - _rt._FORECAST_IDLE_SECS - 60)
+        db.RegressionForecasts.update_many({'hours': 24}, {'$set': {'read_at': idle}})
+        db.RegressionForecasts.update_many({}, {'$set': {'trained_at': 'older'}})
+        assert _rt.refresh_cached_forecasts(db, models_dir, hours=12) == 4   # 12 h and 6 h
+        assert db.RegressionForecasts.count_documents(
+            {'hours': 24, 'trained_at': 'older'}) == 2
+        assert db.RegressionForecasts.find_one({'hours': 24})['read_at'] <= idle   # untouched
+
+    def test_reads_touch_read_at_at_most_hourly(self, db, models_dir):
+        _rt.predict_gateway_forecasts('GW-F', db, hours=4, models_dir=models_dir)
+        stamped = db.RegressionForecasts.find_one({'node_id': '1'})['read_at']
+        _rt.predict_gateway_forecasts('GW-F', db, hours=4, models_dir=models_dir)
+        assert db.RegressionForecasts.find_one({'node_id': '1'})['read_at'] == stamped
+
+        old = _rt._utc(_rt.time.time() - _rt._FORECAST_TOUCH_SECS - 60)
+        db.RegressionForecasts.update_many({}, {'$set': {'read_at': old}})
+        _rt.predict_gateway_forecasts('GW-F', db, hours=4, models_dir=models_dir)
+        assert db.RegressionForecasts.find_one({'node_id': '1'})['read_at'] > old
+
+    def test_ttl_index_on_read_at(self, db, models_dir):
+        _rt.refresh_cached_forecasts(db, models_dir, hours=12)
+        ttl = [ix for ix in db.RegressionForecasts.index_information().values()
+               if ix['key'] == [('read_at', 1)]]
+        assert ttl[0]['expireAfterSeconds'] == _rt._FORECAST_TTL_SECS
@@ -0,0 +1,138 @@
+"""Unit tests for madi.utils.sample_utils (negative sampling)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import anomaly_training as _at
+
+sample_utils = _at.sample_utils
+
+
+@pytest.fixture
+def pos():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({'a': rng.normal(10, 2, 500),
+                         'b': rng.uniform(-1, 1, 500),
+                         'c': np.arange(500, dtype=float)})
+
+
+# ── get_neg_sample ────────────────────────────────────────────────────────────
+
+class TestGetNegSample:
+    def test_uniform_stays_in_extended_bounds(self, pos):
+        neg = sample_utils.get_neg_sample(pos, 2000, delta=0.1, rng=1)
+        assert list(neg.columns) == ['a', 'b', 'c', 'class_label']
+        assert len(neg) == 2000 and (neg['class_label'] == 0).all()
+        span = pos.max() - pos.min()
+        assert (neg[pos.columns] >= pos.min() - 0.1 * span).all().all()
+        assert (neg[pos.columns] <= pos.max() + 0.1 * span).all().all()
+
+    def test_permute_draws_observed_values_per_column(self, pos):
+        neg = sample_utils.get_neg_sample(pos, 300, do_permute=True, rng=2)
+        for col in pos.columns:
+            assert neg[col].isin(pos[col]).all()
+        # Columns are shuffled independently: 'c' identifies the source row,
+        # so 'a' should rarely come from the same row
+        same_row = neg['a'].values == pos['a'].values[neg['c'].values.astype(int)]
+        assert same_row.mean() < 0.05
+
+    def test_class_label_column_is_ignored(self, pos):
+        labelled = pos.assign(class_label=1)
+        neg = sample_utils.get_neg_sample(labelled, 100, rng=3)
+        assert list(neg.columns) == ['a', 'b', 'c', 'class_label']
+
+    def test_seeded_generator_is_reproducible(self, pos):
+        first = sample_utils.get_neg_sample(pos, 100, rng=np.random.default_rng(7))
+        again = sample_utils.get_neg_sample(pos, 100, rng=np.random.default_rng(7))
+        pd.testing.assert_frame_equal(first, again)
+
+    def test_default_rng_follows_global_seed(self, pos):
+        np.random.seed(11)
+        first = sample_utils.get_neg_sample(pos, 100, do_permute=True)
+        np.random.seed(11)
+        again = sample_utils.get_neg_sample(pos, 100, do_permute=True)
+        pd.testing.assert_frame_equal(first, again)
+
+    def test_as_array_returns_float32_features(self, pos):
+        arr = sample_utils.get_neg_sample(pos.assign(class_label=1), 50, rng=4, as_array=True)
+        df = sample_utils.get_neg_sample(pos.assign(class_label=1), 50, rng=4)
+        assert arr.dtype == np.float32 and arr.shape == (50, 3)
+        np.testing.assert_array_equal(arr, df[['a', 'b', 'c']].to_numpy(np.float32))
+
+
+# ── normalize / denormalize ───────────────────────────────────────────────────
+
+def _normalize_reference(df, info):
+    """The original per-column Series implementation of normalize."""
+    cols = []
+    for column in sorted(info, key=lambda c: info[c].index):
+        if info[column].std == 0.0:
+            cols.append(pd.Series(0.0, name=column, index=df.index))
+        else:
+            cols.append(pd.Series((df[column] - info[column].mean) / info[column].std,
+                                  name=column, index=df.index))
+    return pd.concat(cols, axis=1)
+
+
+class TestNormalization:
+    @pytest.fixture
+    def frame(self, pos):
+        return pos.assign(flat=3.0, ok_validity=1.0)
+
+    def test_matches_per_column_reference(self, frame):
+        info = sample_utils.get_normalization_info(frame)
+        shuffled = frame[['c', 'flat', 'a', 'ok_validity', 'b']]
+        pd.testing.assert_frame_equal(sample_utils.normalize(shuffled, info),
+                                      _normalize_reference(shuffled, info))
+
+    def test_constant_column_normalizes_to_zero_and_back_to_mean(self, frame):
+        info = sample_utils.get_normalization_info(frame)
+        normed = sample_utils.normalize(frame, info)
+        assert (normed['flat'] == 0.0).all()
+        restored = sample_utils.denormalize(normed, info)
+        pd.testing.assert_frame_equal(restored, frame, check_exact=False)
+
+    def test_plain_dict_from_legacy_pickles_still_works(self, frame):
+        info = sample_utils.get_normalization_info(frame)
+        legacy = dict(info)
+        assert type(legacy) is dict
+        pd.testing.assert_frame_equal(sample_utils.normalize(frame, legacy),
+                                      sample_utils.normalize(frame, info))
+        assert sample_utils.get_column_order(legacy) == list(frame.columns)
+
+    def test_modifying_info_drops_compiled_cache(self, frame):
+        info = sample_utils.get_normalization_info(frame)
+        sample_utils.normalize(frame, info)
+        info['a'] = sample_utils.Variable(info['a'].index, 'a', 0.0, 1.0)
+        assert (sample_utils.normalize(frame, info)['a'] == frame['a']).all()
+
+    @pytest.mark.parametrize('mutate', [
+        lambda info: info.pop('flat'),
+        lambda info: info.popitem(),
+        lambda info: info.clear(),
+        lambda info: info.update(extra=sample_utils.Variable(99, 'extra', 0.0, 1.0)),
+        lambda info: info.setdefault('extra', sample_utils.Variable(99, 'extra', 0.0, 1.0)),
+        lambda info: info.__ior__({'extra': sample_utils.Variable(99, 'extra', 0.0, 1.0)}),
+    ])
+    def test_every_mutator_drops_compiled_cache(self, frame, mutate):
+        info = sample_utils.get_normalization_info(frame)
+        sample_utils.get_column_order(info)
+        mutate(info)
+        assert sample_utils.get_column_order(info) == \
+            sample_utils.get_column_order(dict(info))
+
+    def test_pickle_roundtrip_drops_cache(self, frame):
+        import pickle
+        info = sample_utils.get_normalization_info(frame)
+        sample_utils.normalize(frame, info)
+        loaded = pickle.loads(pickle.dumps(info))
+        assert getattr(loaded, '_compiled', None) is None
+        pd.testing.assert_frame_equal(sample_utils.normalize(frame, loaded),
+                                      sample_utils.normalize(frame, info))
+
+    def test_normalize_array_preserves_float32(self, frame):
+        info = sample_utils.get_normalization_info(frame)
+        x = frame.to_numpy(np.float32)
+        out = sample_utils.normalize_array(x, info)
+        assert out.dtype == np.float32
+        np.testing.assert_allclose(out, sample_utils.normalize(frame, info).values, atol=1e-5)